@@ -0,0 +1,305 @@
+import math
+import sys
+from array import array
+
+import numpy as np
+
+from Node import Node
+
+
+class LowerBound:
+    """
+    How branchAndBound bounds its states. A bound creates the root state and expands states into children;
+    every state has lowerBound, level, pathVisited, test(), releaseMatrix() and memoryFootprint().
+    """
+    name = None
+
+    def setup(self, costMatrix):
+        """
+        Prepares the bound for a search (or a worker of a parallel search) over costMatrix.
+        """
+        pass
+
+    def createRoot(self, costMatrix):
+        raise NotImplementedError
+
+    def expand(self, node, bssfCost):
+        """
+        :param node: state to expand
+        :param bssfCost: cost of the best solution so far
+        :return: the children of node (children that can not beat bssfCost may be left out) and how many
+                 children were left out
+        """
+        raise NotImplementedError
+
+    def pack(self, node):
+        """
+        :return: node as plain data that can be sent to another process, node must not be used after this
+        """
+        raise NotImplementedError
+
+    def unpack(self, state):
+        """
+        :return: the node packed by pack()
+        """
+        raise NotImplementedError
+
+
+class ReductionBound(LowerBound):
+    """
+    Reduced cost matrix bound: every state keeps its reduced matrix (see Node). With batch expansion, a state
+    whose children have INCREMENTAL_CELLS matrix cells or more between them bounds them incrementally
+    (Node.expandIncremental, same children); for fewer cells reducing their whole matrices at once costs less
+    than the fixed overhead of it.
+    """
+    name = 'reduction'
+    INCREMENTAL_CELLS = 1 << 16
+
+    def __init__(self, batchExpansion=True):
+        self.batchExpansion: bool = batchExpansion
+
+    def setup(self, costMatrix):
+        Node.setupPool(len(costMatrix))
+
+    def createRoot(self, costMatrix):
+        return Node.createRoot(costMatrix)
+
+    def expand(self, node, bssfCost):
+        if self.batchExpansion:
+            # Children that can not beat the bssf are dropped while expanding
+            size = Node.pool.size
+            if (size - 1 - node.level) * size * size >= self.INCREMENTAL_CELLS:
+                return node.expandIncremental(bssfCost)
+            return node.expandBatch(bssfCost)
+        return node.expandTree(), 0
+
+    def pack(self, node):
+        state = (node.lowerBound, node.level, node.pathVisited.tobytes(), node.reducedMatrix.copy())
+        node.releaseMatrix()
+        return state
+
+    def unpack(self, state):
+        lowerBound, level, path, matrix = state
+        slot = Node.pool.acquire()
+        np.copyto(Node.pool.matrix(slot), matrix)
+        pathVisited = array('H')
+        pathVisited.frombytes(path)
+        return Node.restore(slot, level, pathVisited, lowerBound)
+
+
+class AssignmentNode:
+    """
+    A state bounded with the assignment problem (AP) relaxation. For a path that ends at city `last`, every
+    city not in the path plus `last` has to leave to a city not in the path or back to the start; the cheapest
+    way to pick those edges (each city entered once) is the AP. The state keeps the optimal AP assignment and
+    its dual values (u for rows, v for columns) so its children can fix them up instead of starting over.
+    """
+    __slots__ = ('lowerBound', 'level', 'pathVisited', 'visitedMask', 'pathCost', 'u', 'v', 'rowTo', 'colFrom')
+
+    def __init__(self, level, pathVisited, visitedMask, pathCost, u, v, rowTo, colFrom, lowerBound):
+        self.level: int = level
+        self.pathVisited: array = pathVisited
+        self.visitedMask: int = visitedMask
+        self.pathCost: int = pathCost
+        self.u = u  # dual value of each row, float array
+        self.v = v  # dual value of each column, float array
+        self.rowTo = rowTo  # column assigned to each row, -1 if none
+        self.colFrom = colFrom  # row assigned to each column, -1 if none
+        self.lowerBound = lowerBound
+        Node.incrementCount()
+
+    def test(self):
+        """
+        :return: LB if the path is complete, infinity otherwise
+        """
+        if self.level == len(self.u) - 1:
+            return self.lowerBound
+        return np.inf
+
+    def releaseMatrix(self):
+        pass
+
+    def memoryFootprint(self) -> int:
+        return (sys.getsizeof(self) + sys.getsizeof(self.pathVisited) + sys.getsizeof(self.lowerBound) +
+                sys.getsizeof(self.level) + sys.getsizeof(self.visitedMask) + sys.getsizeof(self.pathCost) +
+                self.u.nbytes + self.v.nbytes + self.rowTo.nbytes + self.colFrom.nbytes)
+
+
+class AssignmentBound(LowerBound):
+    """
+    Assignment problem bound, tighter than the reduced cost matrix on asymmetric instances. The root AP is
+    solved with shortest augmenting paths (Hungarian method). A child only removes the row of the parent's
+    last city and the column of the new city (and forbids going straight back to the start), so the parent
+    duals are still feasible and at most two augmenting paths restore the optimum.
+    """
+    name = 'assignment'
+    START = 0
+
+    def __init__(self):
+        self.costMatrix = None
+
+    def setup(self, costMatrix):
+        self.costMatrix = costMatrix
+
+    def createRoot(self, costMatrix):
+        size = len(costMatrix)
+        rowMins = costMatrix.min(axis=1)
+        u = np.where(np.isfinite(rowMins), rowMins, 0.0)
+        v = np.zeros(size)
+        rowTo = np.full(size, -1, dtype=np.intp)
+        colFrom = np.full(size, -1, dtype=np.intp)
+        activeCols = np.arange(size)
+
+        feasible = all(self.augment(row, activeCols, u, v, rowTo, colFrom, self.START) for row in range(size))
+        lowerBound = self.assignmentCost(range(size), rowTo) if feasible else math.inf
+        return AssignmentNode(0, array('H', [self.START]), 1 << self.START, 0, u, v, rowTo, colFrom, lowerBound)
+
+    def expand(self, node, bssfCost):
+        costMatrix = self.costMatrix
+        size = len(costMatrix)
+        last = node.pathVisited[-1]
+        unvisited = [city for city in range(size) if not node.visitedMask >> city & 1]
+        children = []
+        droppedCount = 0
+
+        # The parent duals are still feasible for every child, so parent bound + reduced cost of the new edge
+        # is already a bound: children it prunes are never re-optimized
+        quickBounds = node.lowerBound + costMatrix[last, unvisited] - node.u[last] - node.v[unvisited]
+        for city, quickBound in zip(unvisited, quickBounds):
+            if quickBound >= bssfCost:
+                droppedCount += 1
+                continue
+            pathCost = node.pathCost + costMatrix[last, city]
+            lowerBound = self.childBound(node, last, city, unvisited, pathCost)
+            if lowerBound is None or lowerBound[0] >= bssfCost:
+                droppedCount += 1
+                continue
+            bound, u, v, rowTo, colFrom = lowerBound
+            pathVisited = node.pathVisited[:]
+            pathVisited.append(city)
+            children.append(AssignmentNode(node.level + 1, pathVisited, node.visitedMask | 1 << city,
+                                           int(pathCost), u, v, rowTo, colFrom, bound))
+
+        Node.incrementCount(droppedCount)
+        return children, droppedCount
+
+    def childBound(self, node, last, city, unvisited, pathCost):
+        """
+        Re-optimizes the parent AP for the child that goes from last to city.
+        :return: (lower bound, u, v, rowTo, colFrom) of the child, or None if it has no route
+        """
+        if pathCost == np.inf:
+            return None
+        u, v = node.u.copy(), node.v.copy()
+        rowTo, colFrom = node.rowTo.copy(), node.colFrom.copy()
+
+        # Row `last` and column `city` leave the problem
+        assignedCol = rowTo[last]
+        assignedRow = colFrom[city]
+        rowTo[last] = -1
+        colFrom[city] = -1
+        freeRows = []
+        if assignedCol != city:
+            colFrom[assignedCol] = -1
+            rowTo[assignedRow] = -1
+            freeRows.append(assignedRow)
+
+        remaining = [other for other in unvisited if other != city]
+        if remaining and rowTo[city] == self.START:
+            # city is the new end of the path, it can not go straight back to the start anymore
+            rowTo[city] = -1
+            colFrom[self.START] = -1
+            freeRows.append(city)
+
+        forbiddenRow = city if remaining else -1
+        activeCols = np.array([self.START] + remaining)  # sorted, as unvisited is
+        for row in freeRows:
+            if not self.augment(row, activeCols, u, v, rowTo, colFrom, forbiddenRow):
+                return None
+        lowerBound = int(pathCost) + self.assignmentCost(remaining + [city], rowTo)
+        return lowerBound, u, v, rowTo, colFrom
+
+    def assignmentCost(self, rows, rowTo) -> int:
+        rows = np.asarray(list(rows))
+        return int(self.costMatrix[rows, rowTo[rows]].sum())
+
+    def rowCosts(self, row, activeCols, forbiddenRow):
+        costs = self.costMatrix[row, activeCols]
+        if row == forbiddenRow:
+            costs = np.where(activeCols == self.START, np.inf, costs)
+        return costs
+
+    def augment(self, freeRow, activeCols, u, v, rowTo, colFrom, forbiddenRow) -> bool:
+        """
+        Over the columns in activeCols (sorted), assigns freeRow along the shortest augmenting path (Dijkstra
+        over reduced costs c - u - v), then moves the duals so they stay feasible and every assigned edge keeps
+        a reduced cost of 0.
+        :return: False if freeRow can not be assigned (there is no route)
+        """
+        dist = self.rowCosts(freeRow, activeCols, forbiddenRow) - u[freeRow] - v[activeCols]
+        pred = np.full(len(activeCols), freeRow, dtype=np.intp)
+        done = np.zeros(len(activeCols), dtype=bool)
+        while True:
+            position = int(np.where(done, np.inf, dist).argmin())
+            if done[position] or dist[position] == np.inf:
+                return False
+            done[position] = True
+            row = colFrom[activeCols[position]]
+            if row < 0:
+                sink = position
+                break
+            newDist = dist[position] + self.rowCosts(row, activeCols, forbiddenRow) - u[row] - v[activeCols]
+            better = (newDist < dist) & ~done
+            dist[better] = newDist[better]
+            pred[better] = row
+
+        # Dual update: rows reached through a scanned column (and freeRow) go up, scanned columns go down
+        shortest = dist[sink]
+        scanned = np.flatnonzero(done)
+        scanned = scanned[scanned != sink]
+        u[colFrom[activeCols[scanned]]] += shortest - dist[scanned]
+        u[freeRow] += shortest
+        v[activeCols[scanned]] -= shortest - dist[scanned]
+
+        # Flip the assignment along the path (activeCols is sorted)
+        position = sink
+        while True:
+            row = pred[position]
+            col = activeCols[position]
+            previousCol = rowTo[row]
+            rowTo[row] = col
+            colFrom[col] = row
+            if row == freeRow:
+                return True
+            position = int(np.searchsorted(activeCols, previousCol))
+
+    def pack(self, node):
+        return (node.level, node.pathVisited.tobytes(), node.visitedMask, node.pathCost, node.u, node.v,
+                node.rowTo, node.colFrom, node.lowerBound)
+
+    def unpack(self, state):
+        level, path, visitedMask, pathCost, u, v, rowTo, colFrom, lowerBound = state
+        pathVisited = array('H')
+        pathVisited.frombytes(path)
+        node = AssignmentNode.__new__(AssignmentNode)
+        node.level, node.pathVisited, node.visitedMask, node.pathCost = level, pathVisited, visitedMask, pathCost
+        node.u, node.v, node.rowTo, node.colFrom, node.lowerBound = u, v, rowTo, colFrom, lowerBound
+        return node
+
+
+BOUNDS = {bound.name: bound for bound in (ReductionBound, AssignmentBound)}
+
+
+def makeBound(bound, batchExpansion=True) -> LowerBound:
+    """
+    :param bound: name of the bound (see BOUNDS) or an already created LowerBound
+    :param batchExpansion: for the reduction bound, reduce all the children of a state at once
+    :return: the bound to use
+    """
+    if isinstance(bound, LowerBound):
+        return bound
+    if bound not in BOUNDS:
+        raise ValueError('Unknown lower bound: {}'.format(bound))
+    if bound == ReductionBound.name:
+        return ReductionBound(batchExpansion=batchExpansion)
+    return BOUNDS[bound]()
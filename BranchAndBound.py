@@ -0,0 +1,334 @@
+import heapq
+import itertools
+import math
+import time
+
+import numpy as np
+
+from Bounds import makeBound
+from Node import Node
+from SearchStrategies import makeStrategy
+from SpillStore import SpillStore
+from TranspositionTable import TranspositionTable
+
+
+class BranchAndBoundSearch:
+    """
+    Branch and bound over partial paths starting at city 0. States are bounded with reduced cost matrices
+    by default or with the assignment problem (bound='assignment', see Bounds.py); see
+    TSPSolver.branchAndBound for the other parameters.
+
+    When queueLimit is set the queue never holds more than that many states. Once it is full, onQueueFull
+    decides what happens:
+        'dfs'   - the best state is taken off the queue and its whole subtree is searched depth first, which
+                  only needs room for about n * n states;
+        'spill' - the worst half of the queue is written to disk (SpillStore) and read back once the queue
+                  has room again.
+    Either way no state is lost, so the search is still optimal when it is given enough time.
+
+    Paths that reach the same cities and end at the same city as a cheaper path are pruned as dominated
+    (counted apart from the other pruned states), using a TranspositionTable of transpositionSize pairs;
+    transpositionSize=0 turns this off.
+
+    With a profile (SearchProfile) the search also times its phases, counts why states are pruned and samples
+    the queue size; without one none of that code runs.
+    """
+    QUEUE_FULL_MODES = ('dfs', 'spill')
+    TRANSPOSITION_SIZE = 1 << 16
+
+    def __init__(self, costMatrix, bssfCost=math.inf, bssfPath=None, batchExpansion=True, strategy='depth',
+                 queueLimit=None, queueBytesLimit=None, onQueueFull='dfs', bound='reduction', profile=None,
+                 transpositionSize=TRANSPOSITION_SIZE, **strategyOptions):
+        if onQueueFull not in self.QUEUE_FULL_MODES:
+            raise ValueError('Unknown queue full mode: {}'.format(onQueueFull))
+        self.bound = makeBound(bound, batchExpansion)
+        limited = queueLimit is not None or queueBytesLimit is not None
+        if limited and onQueueFull == 'spill' and self.bound.name != 'reduction':
+            raise ValueError('Spilling to disk needs the reduction bound')
+        self.costMatrix = costMatrix
+        self.numberCities: int = len(costMatrix)
+        self.bssfCost = bssfCost
+        self.bssfPath = bssfPath
+        self.batchExpansion: bool = batchExpansion
+        self.strategy = makeStrategy(strategy, **strategyOptions)
+        self.queueLimit = queueLimit
+        self.queueBytesLimit = queueBytesLimit
+        self.onQueueFull: str = onQueueFull
+        self.profile = profile
+        self.transpositions = TranspositionTable(transpositionSize) if transpositionSize else None
+
+        self.priorityQueue: list = []  # (key, tiebreak, node)
+        self.tiebreak = itertools.count()
+        self.spillStore = None
+        self.root = None
+
+        self.maxPriorityQueueSize: int = 0
+        self.prunedCount: int = 0
+        self.dominatedCount: int = 0
+        self.solutionsCount: int = 0
+        self.divesCount: int = 0
+        self.progressInterval = None
+        self.nextProgress = math.inf
+
+    def run(self, start_time, time_allowance):
+        """
+        Searches until the queue is empty (the bssf is optimal) or the time runs out.
+        :param start_time: time.time() when the solver started
+        :param time_allowance: seconds the solver can run
+        """
+        for _ in self.improvements(start_time, time_allowance):
+            pass
+
+    def improvements(self, start_time, time_allowance, progressInterval=None):
+        """
+        The search of run, as a generator that yields the bssf cost every time a better route is found.
+        Closing it stops the search.
+        :param progressInterval: if given, the bssf cost is also yielded every that many seconds
+        """
+        self.progressInterval = progressInterval
+        if progressInterval is not None:
+            self.nextProgress = time.time() + progressInterval
+        Node.resetCount()
+        Node.profile = self.profile
+        self.bound.setup(self.costMatrix)
+        self.root = self.bound.createRoot(self.costMatrix)
+        self.push(self.root)
+
+        if self.queueBytesLimit is not None:
+            stateLimit = max(2, self.queueBytesLimit // self.root.memoryFootprint())
+            self.queueLimit = stateLimit if self.queueLimit is None else min(self.queueLimit, stateLimit)
+        if self.queueLimit is not None and self.onQueueFull == 'spill':
+            self.spillStore = SpillStore(self.numberCities)
+
+        try:
+            yield from self.searchQueue(start_time, time_allowance)
+        finally:
+            Node.profile = None
+            if self.spillStore is not None:
+                self.spillStore.close()
+
+    def searchQueue(self, start_time, time_allowance):
+        """
+        The main loop: expands states from the queue until it is empty or the time runs out.
+        :return: generator of the bssf cost, every time it improves
+        """
+        while (self.priorityQueue or self.hasSpilledStates()) and time.time() - start_time < time_allowance:
+            if self.hasSpilledStates() and (not self.priorityQueue or len(self.priorityQueue) < self.queueLimit // 2):
+                self.reloadSpilledStates()
+                continue
+            self.maxPriorityQueueSize = max(len(self.priorityQueue), self.maxPriorityQueueSize)
+            solutions = self.solutionsCount
+            self.expandNext()
+            if self.solutionsCount > solutions or self.progressDue():
+                yield self.bssfCost
+
+            if self.queueLimit is not None and len(self.priorityQueue) >= self.queueLimit:
+                if self.onQueueFull == 'dfs':
+                    yield from self.dive(start_time, time_allowance)
+                else:
+                    self.spillWorstStates()
+            self.checkpoint()
+
+    def expandNext(self):
+        """
+        Pops the best state of the queue, explores it and pushes its children.
+        """
+        if self.profile is not None:
+            self.profiledExpansion()
+            return
+        _, _, poppedNode = heapq.heappop(self.priorityQueue)
+        for node in self.explore(poppedNode):
+            self.push(node)
+
+    def profiledExpansion(self):
+        """
+        One pass of the searchQueue loop (pop a state, explore it, push its children) with the pop and push
+        phases timed, and a timeline sample.
+        """
+        profile = self.profile
+        started = time.perf_counter()
+        _, _, poppedNode = heapq.heappop(self.priorityQueue)
+        profile.add('pop', time.perf_counter() - started)
+        children = self.explore(poppedNode)
+        started = time.perf_counter()
+        for node in children:
+            self.push(node)
+        profile.add('push', time.perf_counter() - started, len(children))
+        profile.sample(len(self.priorityQueue), self.bssfCost)
+
+    def progressDue(self) -> bool:
+        """
+        :return: True once every progressInterval seconds (see improvements)
+        """
+        if self.progressInterval is None or time.time() < self.nextProgress:
+            return False
+        self.nextProgress = time.time() + self.progressInterval
+        return True
+
+    def checkpoint(self):
+        """
+        Called after every expansion, lets subclasses share information with other searches.
+        """
+        pass
+
+    def push(self, node):
+        heapq.heappush(self.priorityQueue, (self.strategy.key(node), next(self.tiebreak), node))
+
+    def explore(self, poppedNode) -> list:
+        """
+        Expands a state taken off the queue. Complete routes update the bssf, children that can not beat
+        the bssf are pruned.
+        :param poppedNode: the state to expand
+        :return: the children that have to be searched
+        """
+        profile = self.profile
+        if poppedNode.lowerBound >= self.bssfCost:
+            poppedNode.releaseMatrix()
+            self.prunedCount += 1
+            if profile is not None:
+                profile.prune('popped')
+            return []
+        if self.transpositions is not None:
+            pathCost = self.pathCost(poppedNode)
+            if self.transpositions.beaten(poppedNode.visitedMask, poppedNode.pathVisited[-1], pathCost):
+                # A cheaper path to the same cities was found after this one was queued
+                poppedNode.releaseMatrix()
+                self.dominatedCount += 1
+                if profile is not None:
+                    profile.prune('dominated')
+                return []
+
+        if profile is not None:
+            started, reduceSeconds = time.perf_counter(), profile.seconds['reduce']
+        children, droppedCount = self.bound.expand(poppedNode, self.bssfCost)
+        self.prunedCount += droppedCount
+        poppedNode.releaseMatrix()
+        if profile is not None:
+            expanded = time.perf_counter()
+            profile.add('expand', expanded - started - (profile.seconds['reduce'] - reduceSeconds))
+            profile.boundEvaluations += len(children) + droppedCount
+            profile.prune('expanded', droppedCount)
+            prunedBefore = self.prunedCount
+
+        promisingChildren = []
+        rebuildQueue = False
+        for node in children:
+            test = node.test()
+            if test != np.inf:
+                node.releaseMatrix()
+                cost = self.routeCost(node.pathVisited)
+                if cost < self.bssfCost:
+                    self.solutionsCount += 1
+                    self.bssfCost = cost
+                    self.bssfPath = list(node.pathVisited)
+                    rebuildQueue = self.strategy.solutionFound() or rebuildQueue
+            elif node.lowerBound < self.bssfCost:
+                promisingChildren.append(node)
+            else:
+                node.releaseMatrix()
+                self.prunedCount += 1
+
+        if self.transpositions is not None and promisingChildren:
+            promisingChildren = self.dropDominated(poppedNode, pathCost, promisingChildren)
+        keptChildren, droppedChildren = self.strategy.select(promisingChildren)
+        for node in droppedChildren:
+            node.releaseMatrix()
+            self.prunedCount += 1
+        if profile is not None:
+            profile.add('test', time.perf_counter() - expanded, len(children))
+            profile.prune('child', self.prunedCount - prunedBefore - len(droppedChildren))
+            profile.prune('strategy', len(droppedChildren))
+        if rebuildQueue:
+            self.priorityQueue = [(self.strategy.key(node), order, node) for _, order, node in self.priorityQueue]
+            heapq.heapify(self.priorityQueue)
+        return keptChildren
+
+    def pathCost(self, node):
+        """
+        :return: cost of the path of node so far, without the way back to the start
+        """
+        path = np.frombuffer(node.pathVisited, dtype=np.uint16)
+        return self.costMatrix[path[:-1], path[1:]].sum()
+
+    def dropDominated(self, parent, parentCost, children) -> list:
+        """
+        Offers the children of parent to the transposition table.
+        :param parentCost: cost of the path of parent
+        :return: the children that are not dominated, the others are released and counted
+        """
+        lastCities = [child.pathVisited[-1] for child in children]
+        costs = parentCost + self.costMatrix[parent.pathVisited[-1], lastCities]
+        kept = []
+        for child, lastCity, cost in zip(children, lastCities, costs.tolist()):
+            if self.transpositions.offer(child.visitedMask, lastCity, cost):
+                kept.append(child)
+            else:
+                child.releaseMatrix()
+        self.dominatedCount += len(children) - len(kept)
+        if self.profile is not None:
+            self.profile.prune('dominated', len(children) - len(kept))
+        return kept
+
+    def routeCost(self, path):
+        """
+        :param path: complete route as city indices
+        :return: cost of the route, including the way back to the start
+        """
+        path = np.asarray(path, dtype=np.intp)
+        cost = self.costMatrix[path, np.roll(path, -1)].sum()
+        return int(cost) if cost < np.inf else math.inf
+
+    def dive(self, start_time, time_allowance):
+        """
+        Searches the whole subtree of the best state in the queue depth first. The stack only ever holds the
+        children of the states on the current path, so the memory used stays small.
+        :return: generator of the bssf cost, every time it improves
+        """
+        self.divesCount += 1
+        _, _, subtreeRoot = heapq.heappop(self.priorityQueue)
+        stack = [subtreeRoot]
+        while stack and time.time() - start_time < time_allowance:
+            self.maxPriorityQueueSize = max(len(self.priorityQueue) + len(stack), self.maxPriorityQueueSize)
+            solutions = self.solutionsCount
+            children = self.explore(stack.pop())
+            if self.solutionsCount > solutions or self.progressDue():
+                yield self.bssfCost
+            if self.profile is not None:
+                started = time.perf_counter()
+            # The child with the best key ends on top of the stack
+            children.sort(key=self.strategy.key, reverse=True)
+            stack.extend(children)
+            if self.profile is not None:
+                self.profile.add('push', time.perf_counter() - started, len(children))
+                self.profile.sample(len(self.priorityQueue) + len(stack), self.bssfCost)
+        for node in stack:
+            # Out of time, what is left goes back to the queue (not searched anyway)
+            self.push(node)
+
+    def hasSpilledStates(self) -> bool:
+        return self.spillStore is not None and self.spillStore.hasStates()
+
+    def spillWorstStates(self):
+        """
+        Writes the worst half of the queue to disk.
+        """
+        self.priorityQueue.sort()
+        keep = len(self.priorityQueue) // 2
+        self.spillStore.spill([node for _, _, node in self.priorityQueue[keep:]])
+        # A sorted list is already a heap
+        del self.priorityQueue[keep:]
+
+    def reloadSpilledStates(self):
+        """
+        Brings back the spilled batch with the lowest bound, batches that can not beat the bssf are pruned.
+        """
+        discarded = self.spillStore.discardWorseThan(self.bssfCost)
+        self.prunedCount += discarded
+        if self.profile is not None:
+            self.profile.prune('spilled', discarded)
+        if self.spillStore.hasStates():
+            for node in self.spillStore.reload():
+                self.push(node)
+
+    def remainingNodes(self) -> list:
+        return [node for _, _, node in self.priorityQueue]
@@ -0,0 +1,219 @@
+import os
+import tempfile
+import weakref
+
+import numpy as np
+
+MAP_SCALE = 1000.0
+# Cells of the matrix computed at once when it is built or copied in blocks of rows
+BLOCK_CELLS = 1 << 22
+# Cost of a missing edge in int32 matrices
+MISSING = np.iinfo(np.int32).max
+
+
+def edgeCosts(xs, ys, elevations, rows, cols, asymmetric=True):
+    """
+    Cost from city rows to city cols (broadcast against each other), the same rules as City.costTo but
+    without missing edges: Euclidean distance, plus the climb in elevation when asymmetric, never below 0,
+    scaled to the map and rounded up.
+    """
+    # The same operations in the same order as Scenario.buildCostMatrix, so both round the same way
+    cost = np.square(xs[cols] - xs[rows])
+    cost += np.square(ys[cols] - ys[rows])
+    np.sqrt(cost, out=cost)
+    if asymmetric:
+        cost += elevations[cols] - elevations[rows]
+        np.maximum(cost, 0.0, out=cost)
+    cost *= MAP_SCALE
+    np.ceil(cost, out=cost)
+    return cost
+
+
+class CostMatrix:
+    """
+    The costs of a scenario, read the way a numpy matrix is: costs[i, j], costs[rows, cols] (broadcast),
+    costs[rows] (whole rows), slices for either axis. Missing edges and self-edges cost np.inf. Subclasses
+    only implement lookup, so solvers work the same whatever stores the costs.
+    """
+
+    def __init__(self, numberCities):
+        self.shape = (numberCities, numberCities)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, key):
+        rows, cols = key if isinstance(key, tuple) else (key, slice(None))
+        if isinstance(cols, slice):
+            cols = self.cityRange(cols)
+            rows = self.cityRange(rows) if isinstance(rows, slice) else np.asarray(rows)
+            rows = rows[..., np.newaxis]
+        elif isinstance(rows, slice):
+            cols = np.asarray(cols)
+            rows = self.cityRange(rows).reshape((-1,) + (1,) * cols.ndim)
+        rows, cols = np.broadcast_arrays(np.asarray(rows, dtype=np.intp), np.asarray(cols, dtype=np.intp))
+        costs = self.lookup(rows.reshape(-1), cols.reshape(-1)).reshape(rows.shape)
+        return costs[()] if costs.ndim == 0 else costs
+
+    def cityRange(self, cities):
+        """
+        :param cities: slice of the cities
+        :return: the city indices in it
+        """
+        return np.arange(*cities.indices(len(self)))
+
+    def lookup(self, rows, cols):
+        """
+        :param rows: 1-d array of city indices
+        :param cols: 1-d array of city indices, as long as rows
+        :return: float array of the costs from rows to cols
+        """
+        raise NotImplementedError
+
+    def rowBlocks(self):
+        """
+        :return: (start, stop, costs of the rows start to stop) for every block of about BLOCK_CELLS cells
+        """
+        numberCities = len(self)
+        blockRows = max(1, BLOCK_CELLS // max(numberCities, 1))
+        for start in range(0, numberCities, blockRows):
+            stop = min(start + blockRows, numberCities)
+            yield start, stop, self[start:stop]
+
+    def dense(self):
+        """
+        :return: the whole matrix as a float numpy array, n x n in memory
+        """
+        matrix = np.empty(self.shape)
+        for start, stop, block in self.rowBlocks():
+            matrix[start:stop] = block
+        return matrix
+
+    def fillInt32(self, out):
+        """
+        Copies the costs into the n x n int32 matrix out (a memory map usually) block by block of rows, so
+        only one block is ever in memory. Missing edges are written as MISSING.
+        """
+        for start, stop, block in self.rowBlocks():
+            out[start:stop] = np.where(block == np.inf, MISSING, block).astype(np.int32)
+        return out
+
+
+class DenseCostMatrix(CostMatrix):
+    """
+    Costs held in a float numpy matrix.
+    """
+
+    def __init__(self, matrix):
+        super().__init__(len(matrix))
+        self.matrix = matrix
+
+    def __getitem__(self, key):
+        # Straight to numpy, solvers make many small lookups
+        return self.matrix[key]
+
+    def lookup(self, rows, cols):
+        return self.matrix[rows, cols]
+
+    def dense(self):
+        return self.matrix
+
+
+class HashedEdges:
+    """
+    Missing edges of a big Hard scenario, without an n x n bitmap: edge (i, j) is missing when a hash of
+    (key, i, j) falls under fraction, except the edges of a tour kept aside so there is always a solution.
+    About fraction of the edges are missing, not exactly that many.
+    """
+
+    def __init__(self, key, fraction, keptNext):
+        """
+        :param key: random 64 bit key of the scenario
+        :param fraction: share of the edges to remove
+        :param keptNext: keptNext[i] is the city after i on the kept tour
+        """
+        self.key = np.uint64(key)
+        self.threshold = np.uint64(int(fraction * (1 << 53)))
+        self.keptNext = keptNext
+
+    def missing(self, rows, cols):
+        """
+        :return: bool array, True where the edge from rows to cols was removed
+        """
+        # splitmix64 of the cell index, the top 53 bits compared with the fraction
+        with np.errstate(over='ignore'):
+            z = rows.astype(np.uint64) * np.uint64(len(self.keptNext)) + cols.astype(np.uint64) + self.key
+            z = (z ^ (z >> np.uint64(30))) * np.uint64(0xbf58476d1ce4e5b9)
+            z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94d049bb133111eb)
+            z ^= z >> np.uint64(31)
+        return ((z >> np.uint64(11)) < self.threshold) & (self.keptNext[rows] != cols)
+
+
+class TiledCostMatrix(CostMatrix):
+    """
+    Costs computed on demand from the city arrays, nothing n x n is kept. Looking up k cells costs O(k).
+    """
+
+    def __init__(self, xs, ys, elevations, asymmetric=True, removedEdges=None):
+        """
+        :param removedEdges: HashedEdges of the scenario, None if every edge exists
+        """
+        super().__init__(len(xs))
+        self.xs, self.ys, self.elevations = xs, ys, elevations
+        self.asymmetric = asymmetric
+        self.removedEdges = removedEdges
+
+    def lookup(self, rows, cols):
+        costs = edgeCosts(self.xs, self.ys, self.elevations, rows, cols, self.asymmetric)
+        costs[rows == cols] = np.inf
+        if self.removedEdges is not None:
+            costs[self.removedEdges.missing(rows, cols)] = np.inf
+        return costs
+
+
+class EdgeMask:
+    """
+    Missing edges read from an n x n bool matrix of the edges that exist (see Scenario.edge_exists).
+    """
+
+    def __init__(self, exists):
+        self.exists = exists
+
+    def missing(self, rows, cols):
+        return ~self.exists[rows, cols]
+
+
+class MemmapCostMatrix(CostMatrix):
+    """
+    Costs in an n x n int32 matrix, usually a file mapped into memory, for when the whole matrix is needed but
+    does not fit in it. Missing edges are stored as MISSING.
+    """
+
+    def __init__(self, matrix):
+        super().__init__(len(matrix))
+        self.matrix = matrix
+
+    @classmethod
+    def fromCosts(cls, costs, path=None):
+        """
+        Writes costs to an int32 file (see CostMatrix.fillInt32) and maps it.
+        :param costs: CostMatrix to copy
+        :param path: file to write, by default a temporary file that is removed as soon as it is mapped (or when
+                     the mapping is freed, where an open file can not be removed)
+        """
+        temporary = path is None
+        if temporary:
+            handle, path = tempfile.mkstemp(suffix='.int32')
+            os.close(handle)
+        matrix = np.memmap(path, dtype=np.int32, mode='w+', shape=costs.shape)
+        costs.fillInt32(matrix).flush()
+        if temporary:
+            try:
+                os.remove(path)
+            except OSError:
+                weakref.finalize(matrix, os.remove, path)
+        return cls(matrix)
+
+    def lookup(self, rows, cols):
+        values = self.matrix[rows, cols]
+        return np.where(values == MISSING, np.inf, values.astype(float))
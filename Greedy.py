@@ -0,0 +1,151 @@
+import math
+import time
+
+import numpy as np
+
+# Largest number of (start, city) cells handled at once, bounds the memory used for big scenarios
+BLOCK_CELLS = 1 << 22
+# Largest number of (start, step, city) cells looked at by one block (about 4 ns each), the deadline is only
+# checked between blocks
+BLOCK_WORK = 1 << 25
+# Largest number of (start, step, city) cells looked at when every start is tried, above it only evenly spread
+# starts are (a tour costs numberCities ** 2 cells, so the work grows as numberCities ** 3)
+ALL_STARTS_WORK = 1 << 28
+
+
+def greedyTours(costMatrix, starts=None, deadline=math.inf):
+    """
+    Nearest neighbor from every start city at once: each step, every unfinished tour moves to the cheapest
+    city it has not visited (lowest index on ties), found with an argmin over the masked rows of the cost
+    matrix. A tour fails when it gets stuck or its last city can not go back to its start.
+    :param costMatrix: cost matrix of the scenario, np.inf where there is no edge
+    :param starts: start cities to try, by default all of them, or evenly spread ones up to ALL_STARTS_WORK
+    :param deadline: time.time() at which to stop starting new blocks of starts (the first one always runs)
+    :return: (cost, route as city indices starting at its start city, number of starts that found a tour),
+             (math.inf, None, 0) if no start found one
+    """
+    result = (math.inf, None, 0)
+    for result in greedyBlocks(costMatrix, starts, deadline):
+        pass
+    return result
+
+
+def greedyBlocks(costMatrix, starts=None, deadline=math.inf):
+    """
+    The blocks of starts of greedyTours as they are done.
+    :return: generator of (best cost so far, its route, number of starts that found a tour so far), one after
+             every block
+    """
+    numberCities = len(costMatrix)
+    tourWork = max(numberCities, 1) ** 2
+    if starts is None:
+        maxStarts = max(1, ALL_STARTS_WORK // tourWork)
+        starts = np.arange(numberCities)[::max(1, math.ceil(numberCities / maxStarts))]
+    else:
+        starts = np.asarray(starts, dtype=np.intp)
+    blockSize = max(1, min(BLOCK_CELLS // max(numberCities, 1), BLOCK_WORK // tourWork))
+
+    bestCost, bestRoute, successes = math.inf, None, 0
+    for blockStart in range(0, len(starts), blockSize):
+        if blockStart > 0 and time.time() >= deadline:
+            break
+        costs, routes = greedyBlock(costMatrix, starts[blockStart:blockStart + blockSize])
+        found = np.isfinite(costs)
+        successes += int(found.sum())
+        if found.any():
+            best = int(costs.argmin())
+            if costs[best] < bestCost:
+                bestCost, bestRoute = int(costs[best]), routes[best].tolist()
+        yield bestCost, bestRoute, successes
+
+
+def greedyBlock(costMatrix, starts):
+    """
+    :return: (cost of each tour, np.inf where the start failed) and the routes, one row per start
+    """
+    numberCities = len(costMatrix)
+    rows = np.arange(len(starts))
+    routes = np.empty((len(starts), numberCities), dtype=np.intp)
+    routes[:, 0] = starts
+    visited = np.zeros((len(starts), numberCities), dtype=bool)
+    visited[rows, starts] = True
+    totals = np.zeros(len(starts))
+
+    current = starts
+    for step in range(1, numberCities):
+        candidates = np.where(visited, np.inf, costMatrix[current])
+        nextCities = candidates.argmin(axis=1)
+        # A stuck tour gets an infinite total, whatever it does afterwards does not matter
+        totals += candidates[rows, nextCities]
+        visited[rows, nextCities] = True
+        routes[:, step] = nextCities
+        current = nextCities
+    totals += costMatrix[current, starts]
+    return totals, routes
+
+
+def candidateTour(costMatrix, candidates, index, start=0):
+    """
+    Nearest neighbor for big scenarios, without scanning every city at every step: the next city is the
+    cheapest unvisited one in the candidate list of the current city. When every candidate is visited, the
+    grid cells around the current city are searched ring by ring for the cheapest unvisited city it has an
+    edge to (looking one ring past the first one that has any, as a closer city by cost may be there).
+    :param costMatrix: cost matrix of the scenario, np.inf where there is no edge
+    :param candidates: candidate lists, cheapest first (see Scenario.candidateLists)
+    :param index: GridIndex of the cities (see Scenario.getSpatialIndex)
+    :param start: first city of the tour
+    :return: (cost, route as city indices starting at start), (math.inf, None) if the tour gets stuck
+    """
+    numberCities = len(candidates)
+    visited = np.zeros(numberCities, dtype=bool)
+    cellX, cellY = index.cellOf(index.xs, index.ys)
+    unvisitedInCell = np.diff(index.cellStarts)
+    cellOfCity = cellY * index.columns + cellX
+
+    route = [start]
+    current = start
+    visited[start] = True
+    unvisitedInCell[cellOfCity[start]] -= 1
+    for _ in range(numberCities - 1):
+        options = candidates[current]
+        options = options[options >= 0]
+        options = options[~visited[options]]
+        if len(options):
+            nextCity = int(options[0])
+        else:
+            nextCity = nearestUnvisited(costMatrix, index, current, cellX[current], cellY[current], visited,
+                                        unvisitedInCell)
+            if nextCity is None:
+                return math.inf, None
+        route.append(nextCity)
+        visited[nextCity] = True
+        unvisitedInCell[cellOfCity[nextCity]] -= 1
+        current = nextCity
+
+    path = np.asarray(route)
+    cost = costMatrix[path, np.roll(path, -1)].sum()
+    return (int(cost), route) if cost < np.inf else (math.inf, None)
+
+
+def nearestUnvisited(costMatrix, index, city, cellX, cellY, visited, unvisitedInCell):
+    """
+    :return: the cheapest unvisited city around city (see candidateTour), None if city has no edge to any
+    """
+    best, bestCost = None, np.inf
+    lastRadius = max(index.columns, index.rows)
+    radius = 0
+    while radius <= lastRadius:
+        ringX, ringY = index.ring(cellX, cellY, radius)
+        inside = (ringX >= 0) & (ringX < index.columns) & (ringY >= 0) & (ringY < index.rows)
+        ringX, ringY = ringX[inside], ringY[inside]
+        occupied = unvisitedInCell[ringY * index.columns + ringX] > 0
+        if occupied.any():
+            cities = index.citiesInCells(ringX[occupied], ringY[occupied])
+            cities = cities[~visited[cities]]
+            costs = costMatrix[city, cities]
+            cheapest = int(costs.argmin())
+            if costs[cheapest] < bestCost:
+                best, bestCost = int(cities[cheapest]), costs[cheapest]
+                lastRadius = min(lastRadius, radius + 1)
+        radius += 1
+    return best
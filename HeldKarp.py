@@ -0,0 +1,75 @@
+import math
+import time
+
+import numpy as np
+
+
+def heldKarpTableBytes(numberCities) -> int:
+    """
+    Memory needed by heldKarpTour: one cost (float32) and one parent (int8) for every subset of the cities
+    other than the start and every city that can end the subset.
+    :param numberCities: number of cities of the scenario
+    """
+    others = max(numberCities - 1, 0)
+    return (1 << others) * others * (np.dtype(np.float32).itemsize + np.dtype(np.int8).itemsize)
+
+
+def heldKarpTour(costMatrix, deadline=math.inf):
+    """
+    Exact TSP with the Held-Karp dynamic program. table[mask, j] is the cheapest path that starts at city 0,
+    visits exactly the cities in mask (bit j stands for city j + 1) and ends at city j + 1. All the subsets of
+    the same size are solved together with array operations.
+    :param costMatrix: cost matrix of the scenario, np.inf where there is no edge
+    :param deadline: time.time() at which to give up
+    :return: (cost, route as city indices starting at 0), (math.inf, None) if there is no route, or None if
+             the deadline passed first
+    """
+    numberCities = len(costMatrix)
+    others = numberCities - 1
+    if others < 1:
+        return math.inf, None
+
+    # float32 is exact up to 2^24, otherwise (very expensive edges) use float64
+    finiteCosts = costMatrix[np.isfinite(costMatrix)]
+    largestRoute = finiteCosts.max() * numberCities if finiteCosts.size else 0
+    dtype = np.float32 if largestRoute < 1 << 24 else np.float64
+    costs = costMatrix.astype(dtype)
+    toCity = costs[1:, 1:]  # toCity[k, j]: from city k + 1 to city j + 1
+
+    subsets = np.arange(1 << others, dtype=np.int64)
+    subsetSizes = np.zeros(len(subsets), dtype=np.int8)
+    for bit in range(others):
+        subsetSizes += ((subsets >> bit) & 1).astype(np.int8)
+    subsetsBySize = np.argsort(subsetSizes, kind='stable')
+    layerEnds = np.cumsum(np.bincount(subsetSizes, minlength=others + 1))
+
+    table = np.full((1 << others, others), np.inf, dtype=dtype)
+    parents = np.zeros((1 << others, others), dtype=np.int8)
+    singles = 1 << np.arange(others)
+    table[singles, np.arange(others)] = costs[0, 1:]
+
+    for size in range(2, others + 1):
+        if time.time() >= deadline:
+            return None
+        layer = subsetsBySize[layerEnds[size - 1]:layerEnds[size]]
+        for last in range(others):
+            masks = layer[(layer >> last) & 1 == 1]
+            candidates = table[masks ^ (1 << last)] + toCity[:, last]
+            best = candidates.argmin(axis=1)
+            table[masks, last] = candidates[np.arange(len(masks)), best]
+            parents[masks, last] = best
+
+    everyCity = (1 << others) - 1
+    tourCosts = table[everyCity] + costs[1:, 0]
+    last = int(tourCosts.argmin())
+    if tourCosts[last] == np.inf:
+        return math.inf, None
+
+    route = []
+    mask = everyCity
+    while mask:
+        route.append(last + 1)
+        mask, last = mask ^ (1 << last), int(parents[mask, last])
+    route.append(0)
+    route.reverse()
+    return int(tourCosts.min()), route
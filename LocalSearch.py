@@ -0,0 +1,183 @@
+import math
+import time
+
+import numpy as np
+
+OR_OPT_SEGMENTS = (1, 2, 3)
+
+
+class TourCosts:
+    """
+    Prefix sums over a route so the cost of any stretch of it, walked forward or backward, is two lookups.
+    Missing edges count as 0 in the sums and are counted separately, a stretch is usable only when its count
+    is 0 (otherwise infinity - infinity would make the deltas NaN).
+    """
+
+    def __init__(self, costMatrix, route):
+        self.route = np.asarray(route, dtype=np.intp)
+        nextCities = np.roll(self.route, -1)
+        forward = costMatrix[self.route, nextCities]
+        backward = costMatrix[nextCities, self.route]
+        self.forward = prefixSums(forward)
+        self.backward = prefixSums(backward)
+        self.backwardMissing = np.concatenate(([0], np.cumsum(backward == np.inf)))
+        self.position = np.empty(len(self.route), dtype=np.intp)  # position of every city in the route
+        self.position[self.route] = np.arange(len(self.route))
+
+    def positionsOf(self, cities):
+        """
+        :param cities: city indices, -1 is skipped
+        :return: the positions of those cities in the route
+        """
+        return self.position[cities[cities >= 0]]
+
+    def reversalDelta(self, first, last):
+        """
+        :return: how much more the edges from position first to position last cost when walked backward,
+                 first and last may be arrays
+        """
+        delta = (self.backward[last] - self.backward[first]) - (self.forward[last] - self.forward[first])
+        missing = self.backwardMissing[last] - self.backwardMissing[first]
+        return np.where(missing > 0, np.inf, delta)
+
+
+def prefixSums(costs):
+    return np.concatenate(([0.0], np.cumsum(np.where(costs == np.inf, 0.0, costs))))
+
+
+def improveTour(costMatrix, route, deadline=math.inf, candidates=None):
+    """
+    Local search on an asymmetric tour: 2-opt moves (reverse a stretch of the route) and Or-opt moves (move
+    a stretch of 1 to 3 cities somewhere else, as it is or reversed). Every move is priced with TourCosts,
+    including the cost of walking the reversed stretch backward, and the best improving move for each
+    position is applied until there are none left or the deadline passes. The first city stays first.
+    :param costMatrix: cost matrix of the scenario, np.inf where there is no edge
+    :param route: a tour as city indices, a tour with an infinite cost is returned as it is
+    :param deadline: time.time() at which to stop
+    :param candidates: candidate lists (see Scenario.candidateLists), if given only moves that add an edge to
+                       a candidate are tried instead of every move
+    :return: (cost, improved route, number of moves applied)
+    """
+    result = (tourCost(costMatrix, route), list(route), 0)
+    for result in improvingMoves(costMatrix, route, deadline, candidates):
+        pass
+    return result
+
+
+def improvingMoves(costMatrix, route, deadline=math.inf, candidates=None, progressInterval=None):
+    """
+    The moves of improveTour as they are applied.
+    :param progressInterval: if given, the current tour is also yielded every that many seconds
+    :return: generator of (cost, route, number of moves applied so far), one after every move
+    """
+    nextProgress = time.time() + progressInterval if progressInterval is not None else math.inf
+    route = list(route)
+    numberCities = len(route)
+    costs = TourCosts(costMatrix, route)
+    moves = 0
+    improved = numberCities > 3 and tourCost(costMatrix, route) < math.inf
+    while improved and time.time() < deadline:
+        improved = False
+        for position in range(1, numberCities):
+            if time.time() >= deadline:
+                break
+            newRoute = twoOptMove(costMatrix, costs, position, candidates)
+            for length in OR_OPT_SEGMENTS:
+                if newRoute is None and position + length <= numberCities:
+                    newRoute = orOptMove(costMatrix, costs, position, length, candidates)
+            if newRoute is not None:
+                route = newRoute
+                costs = TourCosts(costMatrix, route)
+                moves += 1
+                improved = True
+            if newRoute is not None or time.time() >= nextProgress:
+                if progressInterval is not None:
+                    nextProgress = time.time() + progressInterval
+                yield tourCost(costMatrix, route), route, moves
+
+
+def tourCost(costMatrix, route):
+    path = np.asarray(route, dtype=np.intp)
+    cost = costMatrix[path, np.roll(path, -1)].sum()
+    return int(cost) if cost < np.inf else math.inf
+
+
+def twoOptMove(costMatrix, costs, first, candidates=None):
+    """
+    Best way to reverse the stretch from position first to some later position.
+    :param costs: TourCosts of the current route
+    :param candidates: candidate lists, if given the stretch only ends where the city before it gets an edge to
+                       one of its candidates
+    :return: the new route if it is cheaper, None otherwise
+    """
+    tour = costs.route
+    numberCities = len(tour)
+    if first >= numberCities - 1:
+        return None
+    before, firstCity = tour[first - 1], tour[first]
+    if candidates is None:
+        lasts = np.arange(first + 1, numberCities)
+    else:
+        lasts = costs.positionsOf(candidates[before])
+        lasts = lasts[lasts > first]
+        if not len(lasts):
+            return None
+    lastCities, afterCities = tour[lasts], tour[(lasts + 1) % numberCities]
+
+    deltas = (costMatrix[before, lastCities] + costMatrix[firstCity, afterCities]
+              - costMatrix[before, firstCity] - costMatrix[lastCities, afterCities]
+              + costs.reversalDelta(first, lasts))
+    best = int(deltas.argmin())
+    if not deltas[best] < 0:
+        return None
+    last = int(lasts[best])
+    return np.concatenate((tour[:first], tour[first:last + 1][::-1], tour[last + 1:])).tolist()
+
+
+def orOptMove(costMatrix, costs, first, length, candidates=None):
+    """
+    Best place to move the stretch of length cities starting at position first, as it is or reversed.
+    :param costs: TourCosts of the current route
+    :param candidates: candidate lists, if given the stretch only goes right before a candidate of the city
+                       that ends up last in it
+    :return: the new route if it is cheaper, None otherwise
+    """
+    tour = costs.route
+    numberCities = len(tour)
+    last = first + length - 1
+    before, after = tour[first - 1], tour[(last + 1) % numberCities]
+    firstCity, lastCity = tour[first], tour[last]
+    removal = costMatrix[before, after] - costMatrix[before, firstCity] - costMatrix[lastCity, after]
+    if removal == np.inf:
+        return None
+
+    # Inserting between tour[p] and tour[p + 1], except where the stretch is now
+    reversals = [False, True] if length > 1 else [False]
+    bestDelta, bestMove = 0, None
+    for reverse in reversals:
+        enters, leaves = (lastCity, firstCity) if reverse else (firstCity, lastCity)
+        if candidates is None:
+            positions = np.arange(numberCities)
+        else:
+            positions = (costs.positionsOf(candidates[leaves]) - 1) % numberCities
+        positions = positions[(positions < first - 1) | (positions > last)]
+        if not len(positions):
+            continue
+        cities, nextCities = tour[positions], tour[(positions + 1) % numberCities]
+        deltas = (removal + costMatrix[cities, enters] + costMatrix[leaves, nextCities]
+                  - costMatrix[cities, nextCities])
+        if reverse:
+            deltas = deltas + costs.reversalDelta(first, last)
+        best = int(deltas.argmin())
+        if deltas[best] < bestDelta:
+            bestDelta, bestMove = deltas[best], (reverse, int(positions[best]))
+    if bestMove is None:
+        return None
+
+    reverse, position = bestMove
+    stretch = tour[first:last + 1]
+    if reverse:
+        stretch = stretch[::-1]
+    rest = np.concatenate((tour[:first], tour[last + 1:]))
+    insertAt = position + 1 if position < first else position + 1 - length
+    return np.concatenate((rest[:insertAt], stretch, rest[insertAt:])).tolist()
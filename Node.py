@@ -1,40 +1,171 @@
+import math
+import sys
+import time
+from array import array
+
 import numpy as np
-import copy
 
+# Node matrices are int32, this value stands for infinity (no edge) in them.
+MATRIX_INFINITY = 1 << 30
+# Reductions subtract from infinite cells too (much faster than masking them out), so every value from here up
+# is still infinity. What a path subtracts from a cell is far less than the gap down to this threshold.
+INFINITY_THRESHOLD = MATRIX_INFINITY >> 1
+
+
+def matrixInfinity(matrix):
+    """
+    :param matrix: cost matrix, float (np.inf for no edge) or int32 (MATRIX_INFINITY for no edge)
+    :return: the value that means infinity in that matrix, and the threshold from which values are infinite
+    """
+    if matrix.dtype.kind == 'i':
+        return MATRIX_INFINITY, INFINITY_THRESHOLD
+    return np.inf, np.inf
+
+
+def compactCostMatrix(costMatrix):
+    """
+    Converts a float cost matrix with np.inf for missing edges into the int32 matrix used by the nodes.
+    :param costMatrix: float matrix from the scenario
+    :return: int32 copy of costMatrix, MATRIX_INFINITY where costMatrix was infinity
+    """
+    return np.where(np.isinf(costMatrix), MATRIX_INFINITY, costMatrix).astype(np.int32)
+
+
+def reduceCostMatrix(matrix):
+    """
+    Reduces a cost matrix in place: subtracts the minimum of every row from that row, then the minimum of
+    every column from that column. Rows or columns that are all infinity are left as they are.
+    A stack of matrices (k, n, n) is also accepted, then every matrix of the stack is reduced on its own.
+    :param matrix: 2D (or 3D stack) numpy array, float or int32 (see matrixInfinity)
+    :return: the total amount subtracted, which is what the lower bound grows by (one per matrix for a stack)
+    """
+    _, threshold = matrixInfinity(matrix)
+
+    rowMins = matrix.min(axis=-1)
+    rowMins[rowMins >= threshold] = 0
+    matrix -= rowMins[..., np.newaxis]
+
+    colMins = matrix.min(axis=-2)
+    colMins[colMins >= threshold] = 0
+    matrix -= colMins[..., np.newaxis, :]
+
+    return rowMins.sum(axis=-1, dtype=np.int64) + colMins.sum(axis=-1, dtype=np.int64)
 
-import TSPClasses
+
+class MatrixPool:
+    """
+    Preallocated storage for the reduced matrices of the search states. Matrices live in fixed size chunks
+    of one big array, and a node only keeps the number (slot) of the matrix it owns. Slots of nodes that are
+    expanded or pruned are given back and reused by new children, so the search does not allocate a new
+    matrix per child.
+    """
+    CHUNK_BYTES = 1 << 22  # Size of each block of matrices that is allocated at once
+
+    def __init__(self, size):
+        """
+        :param size: number of rows (and columns) of every matrix in the pool
+        """
+        self.size: int = size
+        self.chunkLength: int = max(1, self.CHUNK_BYTES // (size * size * np.dtype(np.int32).itemsize))
+        self.chunks: list = []
+        self.free: list = []  # slots that can be handed out
+        self.scratchBuffer = None  # used to reduce all the children of a node at once
+
+    def acquire(self) -> int:
+        """
+        Reserves a matrix of the pool.
+        :return: the slot of the reserved matrix, its content is whatever was there before
+        """
+        if not self.free:
+            self.grow()
+        return self.free.pop()
+
+    def release(self, slot: int):
+        """
+        Gives back a matrix to the pool so it can be used by another node.
+        :param slot: slot returned by acquire()
+        """
+        self.free.append(slot)
+
+    def grow(self):
+        """
+        Allocates a new chunk of matrices and makes its slots available.
+        """
+        firstSlot = len(self.chunks) * self.chunkLength
+        self.chunks.append(np.empty((self.chunkLength, self.size, self.size), dtype=np.int32))
+        self.free.extend(range(firstSlot + self.chunkLength - 1, firstSlot - 1, -1))
+
+    def matrix(self, slot: int):
+        """
+        :param slot: slot returned by acquire()
+        :return: the matrix (numpy view) stored in the slot
+        """
+        return self.chunks[slot // self.chunkLength][slot % self.chunkLength]
+
+    def capacity(self) -> int:
+        return len(self.chunks) * self.chunkLength
+
+    def scratch(self, count: int):
+        """
+        Working space for a stack of matrices that are not owned by any node. Its content does not survive
+        the next call.
+        :param count: number of matrices needed, at most chunkLength
+        :return: array of shape (count, size, size)
+        """
+        if self.scratchBuffer is None:
+            self.scratchBuffer = np.empty((self.chunkLength, self.size, self.size), dtype=np.int32)
+        return self.scratchBuffer[:count]
 
 
 class Node:
+    """
+    A state of the branch and bound search: a partial path starting at the root city. Nodes are kept small
+    (slots, int32 matrix stored in Node.pool, path packed in an array) since the queue can hold millions.
+    """
+    __slots__ = ('lowerBound', 'level', 'matrixSlot', 'pathVisited', 'visitedMask')
+
     nodesCreated = 0
+    pool: MatrixPool = None
+    profile = None  # SearchProfile of the running search, if it is profiled
 
-    def __init__(self, unreducedMatrix, level, pathVisited, cityForNewPath, cities, costFromParent, parentLB):
+    def __init__(self, matrixSlot, level, pathVisited, visitedMask, cityForNewPath, costFromParent, parentLB,
+                 reductionCost=None):
         """
         Creates a new node. Computes the reducedMatrix and lowerBound when is created.
 
-        :param unreducedMatrix: unreduced matrix coming from parent with .copy()
+        :param matrixSlot: slot of Node.pool holding the unreduced matrix coming from the parent, it is reduced
+                           in place
         :param level: depth, used to know when we have found a route
-        :param pathVisited: the path from the parent
-        :param cityForNewPath: city that will be added to the pathVisited array
-        :param cities: arrays of cities. Used for expanding the tree.
+        :param pathVisited: the path from the parent, city indices packed in an array (already a copy)
+        :param visitedMask: bitmask of the cities visited by the parent, bit i is set if city i is in the path
+        :param cityForNewPath: index of the city that will be added to the pathVisited array
         :param costFromParent: the cost of (i,j) from the parent matrix, used to calculate new LB
         :param parentLB: the parent LB, used to calculate new LB
+        :param reductionCost: if given, the matrix in matrixSlot has already been reduced and this is the amount
+                              the reduction added to the LB
         """
         self.lowerBound: int = None
-        self.length: int = len(unreducedMatrix)
-        self.reducedMatrix = self.reduceMatrix(unreducedMatrix, costFromParent, parentLB)  # 2D Array
+        self.matrixSlot: int = matrixSlot
+        if costFromParent >= INFINITY_THRESHOLD:
+            # There is no edge to this city, the node can never lead to a route
+            self.lowerBound = math.inf
+        elif reductionCost is None:
+            self.reduceMatrix(self.reducedMatrix, costFromParent, parentLB)
+        else:
+            self.lowerBound = int(reductionCost + costFromParent + parentLB)
         self.level: int = level  # to know when to end
-        self.pathVisited: list = pathVisited  # to know what path (new nodes to create) to follow
+        self.pathVisited: array = pathVisited  # to know what path (new nodes to create) to follow
+        self.visitedMask: int = visitedMask
         self.addToPath(cityForNewPath)
-        self.cities: list = cities
         self.incrementCount()
 
     @classmethod
-    def incrementCount(cls):
+    def incrementCount(cls, amount=1):
         """
         Increments the nodesCreated everytime a new node is created.
+        :param amount: number of states created, for children that are generated without creating a Node
         """
-        cls.nodesCreated += 1
+        cls.nodesCreated += amount
 
     @classmethod
     def resetCount(cls):
@@ -43,16 +174,84 @@ class Node:
         """
         cls.nodesCreated = 0
 
-    def __lt__(self, other):
-        # it needs to consider the lower bound and the depth (level)
-        return self.lowerBound / self.level < other.lowerBound / other.level
+    @classmethod
+    def reduce(cls, matrix):
+        """
+        reduceCostMatrix, timed as the 'reduce' phase of Node.profile when there is one.
+        """
+        if cls.profile is None:
+            return reduceCostMatrix(matrix)
+        started = time.perf_counter()
+        reduction = reduceCostMatrix(matrix)
+        cls.profile.add('reduce', time.perf_counter() - started, len(matrix) if matrix.ndim == 3 else 1)
+        return reduction
+
+    @classmethod
+    def setupPool(cls, size):
+        """
+        Creates the pool where the matrices of every node will be stored.
+        :param size: number of cities
+        """
+        cls.pool = MatrixPool(size)
+
+    @classmethod
+    def createRoot(cls, costMatrix, startCity=0):
+        """
+        Creates the first node of the search, starting the path at startCity.
+        :param costMatrix: unreduced cost matrix of the scenario (float, np.inf where there is no edge)
+        :param startCity: index of the city where every route starts
+        """
+        slot = cls.pool.acquire()
+        np.copyto(cls.pool.matrix(slot), compactCostMatrix(costMatrix))
+        # 'H' holds city indices up to 65535, more than branch and bound can ever handle
+        return Node(slot, 0, array('H'), 0, startCity, 0, 0)
+
+    @classmethod
+    def restore(cls, matrixSlot, level, pathVisited, lowerBound):
+        """
+        Rebuilds a node that was saved somewhere else (see SpillStore) without reducing its matrix again and
+        without counting it as a new state.
+        :param matrixSlot: slot of Node.pool that already holds the reduced matrix of the node
+        :param level: depth of the node
+        :param pathVisited: complete path of the node, city indices packed in an array
+        :param lowerBound: lower bound of the node
+        """
+        node = cls.__new__(cls)
+        node.matrixSlot = matrixSlot
+        node.level = level
+        node.pathVisited = pathVisited
+        node.visitedMask = sum(1 << city for city in pathVisited)
+        node.lowerBound = lowerBound
+        return node
+
+    @property
+    def reducedMatrix(self):
+        return Node.pool.matrix(self.matrixSlot)
+
+    def memoryFootprint(self) -> int:
+        """
+        Estimates the bytes this state takes while it waits in the queue: the object itself, its path,
+        its numbers and its matrix in the pool.
+        """
+        matrixBytes = Node.pool.size * Node.pool.size * np.dtype(np.int32).itemsize
+        return (sys.getsizeof(self) + sys.getsizeof(self.pathVisited) + sys.getsizeof(self.lowerBound) +
+                sys.getsizeof(self.level) + sys.getsizeof(self.visitedMask) + matrixBytes)
+
+    def releaseMatrix(self):
+        """
+        Gives the matrix of this node back to the pool. Called once the node is expanded or pruned.
+        """
+        if self.matrixSlot is not None:
+            Node.pool.release(self.matrixSlot)
+            self.matrixSlot = None
 
-    def addToPath(self, city: TSPClasses.City):
+    def addToPath(self, city: int):
         """
         Adds a new city to the path visited.
-        :param city: to be added to the path
+        :param city: index of the city to be added to the path
         """
         self.pathVisited.append(city)
+        self.visitedMask |= 1 << city
 
     def reduceMatrix(self, unreducedMatrix, costFromParent, parentLB):
         """
@@ -61,72 +260,186 @@ class Node:
         :param costFromParent: cost of going from the previous city (node) to this city.
         :param parentLB: parent's lowerBound
         """
-        lowerBound = 0
-        #  Reduce row
-        for row in range(self.length):
-            rowContainsZero = 0 in unreducedMatrix[row]
-            if rowContainsZero:
-                continue
-
-            minNumberInRow = min(unreducedMatrix[row])
-
-            if minNumberInRow != np.inf:
-                lowerBound += minNumberInRow
-                for col in range(self.length):
-                    unreducedMatrix[row][col] -= minNumberInRow
-
-        # Reduce column
-        for col in range(self.length):
-            minNumberInCol = np.inf
-            for row in range(self.length):
-                if unreducedMatrix[row][col] < minNumberInCol:
-                    minNumberInCol = unreducedMatrix[row][col]
-
-            if minNumberInCol != 0 and minNumberInCol != np.inf:
-                lowerBound += minNumberInCol
-                for row in range(self.length):
-                    if unreducedMatrix[row][col] != np.inf:
-                        unreducedMatrix[row][col] -= minNumberInCol
-
-        self.lowerBound = lowerBound + costFromParent + parentLB
+        lowerBound = self.reduce(unreducedMatrix)
+        self.lowerBound = int(lowerBound + costFromParent + parentLB)
         return unreducedMatrix
 
+    def unvisitedCities(self) -> list:
+        """
+        :return: indices of the cities that are not in the path yet
+        """
+        mask = self.visitedMask
+        return [city for city in range(Node.pool.size) if not mask >> city & 1]
+
     def expandTree(self):
         """
         Creates a new child node for every city that has not been visited by this state yet.
         :return: The children of the current node.
         """
         children = []
-        for city in self.cities:
-            if city not in self.pathVisited:
-                parentCity = self.pathVisited[-1]
-                parentIndex = self.cities.index(parentCity)
-                childIndex = self.cities.index(city)
-                parentMatrixCopy = copy.deepcopy(self.reducedMatrix)
-                matrixWithInfinities = self.makeRowAndColumnInfinite(parentMatrixCopy, parentIndex, childIndex)
-
-                pathVisitedCopy = copy.copy(self.pathVisited)
-                # Create a new node
-                tempNode = Node(matrixWithInfinities, self.level+1, pathVisitedCopy, city, self.cities,
-                                self.reducedMatrix[parentIndex][childIndex], self.lowerBound)
-                children.append(tempNode)
+        parentMatrix = self.reducedMatrix
+        parentIndex = self.pathVisited[-1]
+        for childIndex in self.unvisitedCities():
+            slot = Node.pool.acquire()
+            childMatrix = Node.pool.matrix(slot)
+            np.copyto(childMatrix, parentMatrix)
+            self.makeRowAndColumnInfinite(childMatrix, parentIndex, childIndex)
 
+            # Create a new node
+            tempNode = Node(slot, self.level + 1, self.pathVisited[:], self.visitedMask, childIndex,
+                            parentMatrix[parentIndex, childIndex], self.lowerBound)
+            children.append(tempNode)
 
         return children
 
+    def expandBatch(self, bssfCost):
+        """
+        Same as expandTree, but the matrices of all the children are built and reduced together as one
+        (k, n, n) stack. Children whose lower bound is not better than bssfCost are dropped before a Node is
+        created for them, they still count as created states.
+        :param bssfCost: cost of the best solution so far
+        :return: the children that were not dropped, and the number of children that were dropped
+        """
+        children = []
+        droppedCount = 0
+        parentMatrix = self.reducedMatrix
+        parentIndex = self.pathVisited[-1]
+        unvisited = np.array(self.unvisitedCities())
+        blockLength = Node.pool.chunkLength
+
+        for blockStart in range(0, len(unvisited), blockLength):
+            childIndices = unvisited[blockStart:blockStart + blockLength]
+            count = len(childIndices)
+            stack = Node.pool.scratch(count)
+            stack[:] = parentMatrix
+            self.makeRowAndColumnInfinite(stack, parentIndex, childIndices)
+
+            costsFromParent = parentMatrix[parentIndex, childIndices]
+            reductionCosts = self.reduce(stack)
+            lowerBounds = np.where(costsFromParent >= INFINITY_THRESHOLD, np.inf,
+                                   reductionCosts + costsFromParent + self.lowerBound)
+            survivors = np.flatnonzero(lowerBounds < bssfCost)
+            droppedCount += count - len(survivors)
+
+            for i in survivors:
+                slot = Node.pool.acquire()
+                np.copyto(Node.pool.matrix(slot), stack[i])
+                children.append(Node(slot, self.level + 1, self.pathVisited[:], self.visitedMask,
+                                     int(childIndices[i]), costsFromParent[i], self.lowerBound,
+                                     reductionCost=reductionCosts[i]))
+
+        self.incrementCount(droppedCount)
+        return children, droppedCount
+
+    def expandIncremental(self, bssfCost):
+        """
+        Same children as expandBatch, but without reducing a whole matrix per child. The matrix of this node is
+        reduced, so every row and column that is not all infinity has a zero. A child only makes the row of the
+        last city, the column of the new city and one cell infinite, so a row keeps its reduction unless all
+        its zeros were in that column or cell, and a column unless all its zeros were in that row or cell (or
+        in rows the child reduced, which only gain zeros). The zeros of every row and column are counted once
+        per expansion, then only the rows and columns that lost their only zero are reduced again: O(n) per
+        child in the usual case instead of O(n^2).
+        :param bssfCost: cost of the best solution so far
+        :return: the children that were not dropped, and the number of children that were dropped
+        """
+        parentMatrix = self.reducedMatrix
+        parentIndex = self.pathVisited[-1]
+        unvisited = np.array(self.unvisitedCities(), dtype=np.intp)
+        count, size = len(unvisited), len(parentMatrix)
+        childOf = np.full(size, -1)  # position in unvisited of the child that goes to each city
+        childOf[unvisited] = np.arange(count)
+
+        zeros = parentMatrix == 0
+        rowZeros, colZeros = zeros.sum(axis=1), zeros.sum(axis=0)
+
+        # A row with one zero loses it in the child going to the zero's column, or (zero in the column of the
+        # last city) in the child going to the row's city, whose cell back to the last city becomes infinity
+        rowReductions = np.zeros((count, size), dtype=np.int64)
+        rows = np.flatnonzero(rowZeros == 1)
+        zeroCols = zeros[rows].argmax(axis=1)
+        rowChildren = childOf[np.where(zeroCols == parentIndex, rows, zeroCols)]
+        lost = (rowChildren >= 0) & (rows != parentIndex)
+        rows, rowChildren = rows[lost], rowChildren[lost]
+        rowMins = np.zeros(len(rows), dtype=np.int64)
+        if len(rows):
+            values = parentMatrix[rows]
+            values[np.arange(len(rows)), unvisited[rowChildren]] = MATRIX_INFINITY
+            values[rows == unvisited[rowChildren], parentIndex] = MATRIX_INFINITY
+            rowMins = values.min(axis=1)
+            rowMins[rowMins >= INFINITY_THRESHOLD] = 0
+            rowReductions[rowChildren, rows] = rowMins
+
+        # A column whose only zero is in the row of the last city loses it in every child, the child going to
+        # that column makes it infinity anyway. The rows a child reduced can only have given it a zero back.
+        cols = np.flatnonzero((colZeros == 1) & zeros[parentIndex])
+        colMins = parentMatrix[:, cols].T[:, np.newaxis, :] - rowReductions
+        colMins[:, :, parentIndex] = MATRIX_INFINITY
+        colMins = colMins.min(axis=2)
+        colMins[(colMins >= INFINITY_THRESHOLD) | (cols[:, np.newaxis] == unvisited)] = 0
+        colReductions = colMins.sum(axis=0)
+        # The column of the last city is only finite at the root, its only zero may be in a cell back to it
+        backChild, backMin = -1, 0
+        if colZeros[parentIndex] == 1 and childOf[zeros[:, parentIndex].argmax()] >= 0:
+            backChild = childOf[zeros[:, parentIndex].argmax()]
+            values = parentMatrix[:, parentIndex] - rowReductions[backChild]
+            values[[parentIndex, unvisited[backChild]]] = MATRIX_INFINITY
+            backMin = values.min()
+            backMin = 0 if backMin >= INFINITY_THRESHOLD else backMin
+            colReductions[backChild] += backMin
+
+        costsFromParent = parentMatrix[parentIndex, unvisited]
+        reductionCosts = rowReductions.sum(axis=1) + colReductions
+        lowerBounds = np.where(costsFromParent >= INFINITY_THRESHOLD, np.inf,
+                               reductionCosts + costsFromParent + self.lowerBound)
+        survivors = np.flatnonzero(lowerBounds < bssfCost)
+        droppedCount = count - len(survivors)
+
+        # The matrices of the children that are kept: the parent's with the same changes and reductions
+        children = []
+        blockLength = Node.pool.chunkLength
+        for blockStart in range(0, len(survivors), blockLength):
+            block = survivors[blockStart:blockStart + blockLength]
+            stack = Node.pool.scratch(len(block))
+            stack[:] = parentMatrix
+            self.makeRowAndColumnInfinite(stack, parentIndex, unvisited[block])
+            kept = np.zeros(count, dtype=bool)
+            kept[block] = True
+            reduced = kept[rowChildren]
+            stack[np.searchsorted(block, rowChildren[reduced]), rows[reduced]] -= rowMins[reduced, np.newaxis]
+            stack[:, :, cols] -= colMins[:, block].T[:, np.newaxis, :]
+            if backMin and backChild in block:
+                stack[np.flatnonzero(block == backChild)[0], :, parentIndex] -= backMin
+
+            for i, childMatrix in zip(block, stack):
+                slot = Node.pool.acquire()
+                np.copyto(Node.pool.matrix(slot), childMatrix)
+                children.append(Node(slot, self.level + 1, self.pathVisited[:], self.visitedMask,
+                                     int(unvisited[i]), costsFromParent[i], self.lowerBound,
+                                     reductionCost=reductionCosts[i]))
+
+        self.incrementCount(droppedCount)
+        return children, droppedCount
+
     def makeRowAndColumnInfinite(self, parentMatrix, row, column):
         """
         Sets the rows and columns and position (column, row) to infinity in the parentMatrix
+        When parentMatrix is a stack of k matrices, column is an array with the column for each of them.
         :param parentMatrix matrix where cells will be updated
         :param row to be set to infinity
         :param column to be set to infinity
         :return: the matrix with updated rows and columns
         """
-        for i in range(len(parentMatrix)):
-            parentMatrix[row][i] = np.inf
-            parentMatrix[i][column] = np.inf
-
-        parentMatrix[column][row] = np.inf
+        infinity, _ = matrixInfinity(parentMatrix)
+        if parentMatrix.ndim == 3:
+            stackIndices = np.arange(len(parentMatrix))
+            parentMatrix[:, row, :] = infinity
+            parentMatrix[stackIndices, :, column] = infinity
+            parentMatrix[stackIndices, column, row] = infinity
+            return parentMatrix
+        parentMatrix[row, :] = infinity
+        parentMatrix[:, column] = infinity
+        parentMatrix[column, row] = infinity
         return parentMatrix
 
     def test(self) -> int:
@@ -134,7 +447,7 @@ class Node:
         Tests if the pathVisited is complete (go from the first element to the end)
         :return: LB if the path is complete, infinity otherwise
         """
-        if self.level == self.length - 1:
+        if self.level == Node.pool.size - 1:
             return self.lowerBound
         else:
             return np.inf
\ No newline at end of file
@@ -0,0 +1,210 @@
+import math
+import multiprocessing
+import os
+import queue
+import time
+
+from BranchAndBound import BranchAndBoundSearch
+from Node import Node
+from SearchProfile import SearchProfile
+
+
+class WorkerSearch(BranchAndBoundSearch):
+    """
+    The search run by each worker process. Every CHECKPOINT_INTERVAL expansions it
+        - takes the global bssf cost from shared memory, so it prunes with the best route any worker found;
+        - publishes its own bssf cost if it is better;
+        - gives half of its queue to the shared work queue if another worker is idle (work stealing).
+    """
+    CHECKPOINT_INTERVAL = 32
+
+    def __init__(self, costMatrix, sharedBssf, workQueue, pendingWork, idleWorkers, **options):
+        super().__init__(costMatrix, bssfCost=sharedBssf.value, **options)
+        self.sharedBssf = sharedBssf
+        self.workQueue = workQueue
+        self.pendingWork = pendingWork
+        self.idleWorkers = idleWorkers
+        self.expansions = 0
+
+    def checkpoint(self):
+        self.expansions += 1
+        if self.expansions % self.CHECKPOINT_INTERVAL:
+            return
+        self.shareBssf()
+        if self.idleWorkers.value > 0 and len(self.priorityQueue) > 1:
+            self.donateWork()
+
+    def shareBssf(self):
+        globalCost = self.sharedBssf.value
+        if self.bssfCost < globalCost:
+            with self.sharedBssf.get_lock():
+                if self.bssfCost < self.sharedBssf.value:
+                    self.sharedBssf.value = self.bssfCost
+        elif globalCost < self.bssfCost:
+            # A route found by another worker, only its cost is needed here
+            self.bssfCost = globalCost
+
+    def donateWork(self):
+        """
+        Moves every other state of the queue (in priority order) to the shared work queue, so both this
+        worker and the one stealing keep a mix of good states.
+        """
+        self.priorityQueue.sort()
+        donated = self.priorityQueue[1::2]
+        del self.priorityQueue[1::2]
+        with self.pendingWork.get_lock():
+            self.pendingWork.value += len(donated)
+        for _, _, node in donated:
+            self.workQueue.put(self.bound.pack(node))
+
+
+def searchWorker(costMatrix, sharedBssf, workQueue, pendingWork, idleWorkers, resultQueue, start_time,
+                 time_allowance, profile, options):
+    """
+    Entry point of each worker process: takes states from workQueue and searches their subtrees until there
+    is no work left anywhere or the time runs out. Sends its counters and best route to resultQueue, and
+    with profile its SearchProfile results.
+    """
+    Node.resetCount()
+    search = WorkerSearch(costMatrix, sharedBssf, workQueue, pendingWork, idleWorkers,
+                          profile=SearchProfile() if profile else None, **options)
+    Node.profile = search.profile
+    search.bound.setup(costMatrix)
+    idle = False
+    while pendingWork.value > 0 and time.time() - start_time < time_allowance:
+        try:
+            state = workQueue.get(timeout=0.01)
+        except queue.Empty:
+            if not idle:
+                idle = True
+                with idleWorkers.get_lock():
+                    idleWorkers.value += 1
+            continue
+        if idle:
+            idle = False
+            with idleWorkers.get_lock():
+                idleWorkers.value -= 1
+
+        search.shareBssf()
+        search.push(search.bound.unpack(state))
+        for _ in search.searchQueue(start_time, time_allowance):
+            pass
+        search.shareBssf()
+        if not search.priorityQueue:
+            # The whole subtree was searched (what was donated is pending on its own)
+            with pendingWork.get_lock():
+                pendingWork.value -= 1
+
+    # States still queued when the time runs out are never searched, do not wait for them to be read
+    workQueue.cancel_join_thread()
+    resultQueue.put({
+        # bssfCost may come from another worker, the cost of the route this worker found is what is reported
+        'cost': search.routeCost(search.bssfPath) if search.bssfPath is not None else math.inf,
+        'path': search.bssfPath,
+        'count': search.solutionsCount,
+        'max': search.maxPriorityQueueSize,
+        'total': Node.nodesCreated,
+        'pruned': search.prunedCount,
+        'dominated': search.dominatedCount,
+        'profile': search.profile.results() if search.profile is not None else None,
+    })
+
+
+class ParallelBranchAndBound:
+    """
+    Runs branch and bound on several processes. The main process expands the top of the tree until there
+    are a few states per worker, then the workers search those subtrees, sharing the bssf cost through
+    shared memory and stealing work from each other through a shared queue.
+    """
+    STATES_PER_WORKER = 4
+    RESULTS_GRACE_SECONDS = 5.0
+    # BranchAndBoundSearch options the workers do not support
+    UNSUPPORTED_OPTIONS = ('queueLimit', 'queueBytesLimit', 'onQueueFull')
+
+    def __init__(self, costMatrix, bssfCost=math.inf, workers=None, profile=False, **options):
+        """
+        :param costMatrix: cost matrix of the scenario (float, np.inf where there is no edge)
+        :param bssfCost: cost of the initial bssf
+        :param workers: number of processes, all the cores by default
+        :param profile: profile every process (see SearchProfile), the profiles are merged into self.profile
+        :param options: BranchAndBoundSearch options (batchExpansion, strategy, bound), not the queue limits
+        """
+        unsupported = [option for option in self.UNSUPPORTED_OPTIONS if option in options]
+        if unsupported:
+            raise ValueError('Parallel branch and bound does not support {}'.format(', '.join(unsupported)))
+        self.costMatrix = costMatrix
+        self.workers: int = workers or os.cpu_count() or 1
+        self.options: dict = options
+        self.profile = SearchProfile() if profile else None
+        self.search = BranchAndBoundSearch(costMatrix, bssfCost=bssfCost, profile=self.profile, **options)
+        self.workerResults: list = []
+
+    def run(self, start_time, time_allowance):
+        search = self.search
+        Node.resetCount()
+        search.bound.setup(self.costMatrix)
+        search.root = search.bound.createRoot(self.costMatrix)
+        search.push(search.root)
+
+        # Split the top of the tree until every worker has a few subtrees to start with
+        targetStates = self.workers * self.STATES_PER_WORKER
+        Node.profile = self.profile
+        try:
+            while search.priorityQueue and len(search.priorityQueue) < targetStates and \
+                    time.time() - start_time < time_allowance:
+                search.expandNext()
+        finally:
+            Node.profile = None
+        search.maxPriorityQueueSize = len(search.priorityQueue)
+        if not search.priorityQueue:
+            return
+
+        context = multiprocessing.get_context('spawn')
+        sharedBssf = context.Value('d', search.bssfCost)
+        pendingWork = context.Value('i', len(search.priorityQueue))
+        idleWorkers = context.Value('i', 0)
+        workQueue = context.Queue()
+        resultQueue = context.Queue()
+        for _, _, node in sorted(search.priorityQueue):
+            workQueue.put(search.bound.pack(node))
+        search.priorityQueue = []
+
+        processes = [context.Process(target=searchWorker, daemon=True,
+                                     args=(self.costMatrix, sharedBssf, workQueue, pendingWork, idleWorkers,
+                                           resultQueue, start_time, time_allowance, self.profile is not None,
+                                           self.options))
+                     for _ in range(self.workers)]
+        for process in processes:
+            process.start()
+        deadline = start_time + time_allowance + self.RESULTS_GRACE_SECONDS
+        while len(self.workerResults) < len(processes) and time.time() < deadline:
+            try:
+                self.workerResults.append(resultQueue.get(timeout=0.1))
+            except queue.Empty:
+                if not any(process.is_alive() for process in processes) and resultQueue.empty():
+                    break  # some worker died without sending its results
+        for process in processes:
+            process.join(timeout=1.0)
+            if process.is_alive():
+                process.terminate()
+        workQueue.cancel_join_thread()
+        workQueue.close()
+
+        for result in self.workerResults:
+            if self.profile is not None:
+                self.profile.merge(result['profile'])
+            if result['cost'] < search.bssfCost:
+                search.bssfCost = result['cost']
+                search.bssfPath = result['path']
+
+    def results(self) -> dict:
+        """
+        :return: counters of the whole search, the main process plus every worker
+        """
+        return {
+            'count': self.search.solutionsCount + sum(result['count'] for result in self.workerResults),
+            'max': self.search.maxPriorityQueueSize + sum(result['max'] for result in self.workerResults),
+            'total': Node.nodesCreated + sum(result['total'] for result in self.workerResults),
+            'pruned': self.search.prunedCount + sum(result['pruned'] for result in self.workerResults),
+            'dominated': self.search.dominatedCount + sum(result['dominated'] for result in self.workerResults),
+        }
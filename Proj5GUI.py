@@ -6,6 +6,8 @@ import signal
 import sys
 import time
 
+import numpy as np
+
 
 from which_pyqt import PYQT_VER
 if PYQT_VER == 'PYQT5':
@@ -30,6 +32,18 @@ from TSPClasses import *
 
 
 class PointLineView( QWidget ):
+    """
+    Draws the cities, the tour edges and their labels. The picture is kept in two cached layers, the cities
+    and the edges with their labels, so a repaint only copies pixmaps; a layer is drawn again when what is on
+    it changes or the view is resized. Drawing a layer only costs what ends up visible: arrowheads are left
+    off edges shorter than MIN_ARROW_EDGE pixels and a label is skipped when another one was already drawn
+    in its LABEL_CELL, so zoomed out thousands of labels do not pile up on each other.
+    """
+    ARROW_SCALE = 5.0
+    MIN_ARROW_EDGE = 30.0
+    LABEL_CELL = (48, 24)
+    CITY_SIZE = 2.0 # DIAMETER
+
     def __init__( self, status_bar, data_range ):
         super(QWidget,self).__init__()
         self.setMinimumSize(600,400)
@@ -37,6 +51,7 @@ class PointLineView( QWidget ):
         self.pointList	= {}
         self.edgeList	= {}
         self.labelList	 = {}
+        self.layers = {}
         self.status_bar = status_bar
         self.data_range = data_range
         self.start_pt = None
@@ -47,6 +62,7 @@ class PointLineView( QWidget ):
 
     def clearPoints(self):
         self.pointList = {}
+        self.layers.pop('cities', None)
 
     def clearEdges(self,removeColors = None):
         self.edgeList = {}
@@ -56,6 +72,7 @@ class PointLineView( QWidget ):
                     del self.labelList[color]
         else:
             self.labelList = {}
+        self.layers.pop('edges', None)
         self.repaint()
 
     def addPoints( self, point_list, color ):
@@ -63,6 +80,7 @@ class PointLineView( QWidget ):
             self.pointList[color].extend( point_list )
         else:
             self.pointList[color] = point_list
+        self.layers.pop('cities', None)
 
 
     def addEdge( self, startPt, endPt, label, edgeColor, labelColor=None, xoffset=0.0 ):
@@ -88,96 +106,172 @@ class PointLineView( QWidget ):
             self.labelList[labelColor].append( (point,label,xoffset) )
         else:
             self.labelList[labelColor] = [(point,label,xoffset)]
+        self.layers.pop('edges', None)
 
-    def paintEvent(self, event):
-        painter = QPainter(self)
-        painter.setRenderHint(QPainter.RenderHint.Antialiasing,True)
-
+    def viewScale(self):
+        """
+        :return: pixels per unit of the data, so the whole data range fits the view
+        """
         xr = self.data_range['x']
         yr = self.data_range['y']
         w = self.width()
         h = self.height()
         w2h_desired_ratio = (xr[1]-xr[0])/(yr[1]-yr[0])
         if w / h < w2h_desired_ratio:
-             scale = w / (xr[1]-xr[0])
-        else:
-             scale = h / (yr[1]-yr[0])
+             return w / (xr[1]-xr[0])
+        return h / (yr[1]-yr[0])
+
+    def toScreen(self, xs, ys):
+        """
+        :return: pixel coordinates of the data coordinates xs, ys (numpy arrays), y points down on screen
+        """
+        scale = self.viewScale()
+        return self.width()/2.0 + scale*xs, self.height()/2.0 - scale*ys
 
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.drawPixmap(0, 0, self.cachedLayer('edges', self.paintEdges))
+        painter.drawPixmap(0, 0, self.cachedLayer('cities', self.paintCities))
+
+    def cachedLayer(self, name, paintLayer):
+        """
+        :param paintLayer: draws the layer with the painter it is given
+        :return: the layer as a transparent pixmap the size of the view, drawn again only when it is missing
+                 from self.layers or the view was resized
+        """
+        layer = self.layers.get(name)
+        if layer is None or layer.size() != self.size():
+            layer = QPixmap(self.size())
+            layer.fill(Qt.GlobalColor.transparent)
+            painter = QPainter(layer)
+            painter.setRenderHint(QPainter.RenderHint.Antialiasing,True)
+            paintLayer(painter)
+            painter.end()
+            self.layers[name] = layer
+        return layer
+
+    def paintEdges(self, painter):
+        scale = self.viewScale()
         tform = QTransform()
         tform.translate(self.width()/2.0,self.height()/2.0)
-        tform.scale(1.0,-1.0)
-        painter.setTransform(tform)
+        tform.scale(scale,-scale)
 
         for color in self.edgeList:
             c = QColor(color[0],color[1],color[2])
-            painter.setPen( c )
+            # One path for all the edges of a color, in data coordinates with a pen one pixel wide whatever the scale
+            path = QPainterPath()
             for edge in self.edgeList[color]:
-                ln = QLineF( scale*edge.x1(), scale*edge.y1(), scale*edge.x2(), scale*edge.y2() )
-                painter.drawLine( ln )
+                path.moveTo(edge.p1())
+                path.lineTo(edge.p2())
+            pen = QPen(c)
+            pen.setCosmetic(True)
+            painter.setTransform(tform)
+            painter.setPen(pen)
+            painter.drawPath(path)
+
+            painter.resetTransform()
+            painter.setPen(c)
+            painter.setBrush(c)
+            painter.drawPath(self.arrowPath(self.edgeList[color]))
+        painter.resetTransform()
+        painter.setBrush(QBrush())
 
-        for color in self.edgeList:
-            c = QColor(color[0],color[1],color[2])
-            painter.setPen( c )
-            for edge in self.edgeList[color]:
-                #arrow_scale = .015
-                arrow_scale = 5.0
-                unit_edge = ( edge.x2() - edge.x1(), edge.y2() - edge.y1() )
-                unit_edge_mag = math.sqrt( ( edge.x2() - edge.x1())**2 + ( edge.y2() - edge.y1() )**2 )
-                unit_edge = (unit_edge[0] / unit_edge_mag, unit_edge[1] / unit_edge_mag )
-                unit_edge_perp = (-unit_edge[1], unit_edge[0])
-
-                temp_tform = QTransform()
-                temp_tform.translate(self.width()/2.0,self.height()/2.0)
-                temp_tform.scale(1.0,-1.0)
-                temp_tform.translate(scale*edge.x2(),scale*edge.y2())
-                temp_tform.scale(1.0,-1.0)
-                painter.setTransform(temp_tform)
-                #painter.drawText( RECT, label[1], align )
-
-                tri_pts = []
-                tri_pts.append( QPointF(0,0) )
-                tri_pts.append( QPointF(-arrow_scale*(2*unit_edge[0] + unit_edge_perp[0]),
-                                        arrow_scale*(2*unit_edge[1] + unit_edge_perp[1])) )
-                tri_pts.append( QPointF(-arrow_scale*(2*unit_edge[0] - unit_edge_perp[0]),
-                                        arrow_scale*(2*unit_edge[1] - unit_edge_perp[1])) )
-                tri = QPolygonF( tri_pts )
-                b = painter.brush()
-                painter.setBrush( c )
-                painter.drawPolygon( tri )
-                painter.setBrush( b )
-
-        painter.setTransform(tform)
         font = QFont("Monospace")
         font.setStyleHint(QFont.StyleHint.TypeWriter)
-
+        painter.setFont(font)
         R = 1.0E3
-        CITY_SIZE = 2.0 # DIAMETER
-        RECT = QRectF(-R,-R,2.0*R,2.0*R)
         align = QTextOption(Qt.AlignmentFlag.AlignHCenter | Qt.AlignmentFlag.AlignVCenter )
+        taken = set()
         for color in self.labelList:
-            c = QColor(color[0],color[1],color[2])
-            painter.setPen( c )
-            for label in self.labelList[color]:
-                temp_tform = QTransform()
-                temp_tform.translate(self.width()/2.0,self.height()/2.0)
-                temp_tform.scale(1.0,-1.0)
-                pt = label[0]
-                xoff = label[2]
-                temp_tform.translate(scale*pt.x()+xoff,scale*pt.y())
-                temp_tform.scale(1.0,-1.0)
-                painter.setTransform(temp_tform)
-                painter.drawText( RECT, label[1], align )
-
-        painter.setTransform(tform)
+            labels = self.labelList[color]
+            if not labels:
+                continue
+            xs, ys = self.toScreen(np.array([label[0].x() for label in labels]),
+                                   np.array([label[0].y() for label in labels]))
+            xs += np.array([label[2] for label in labels])
+            visible = (xs >= 0) & (xs < self.width()) & (ys >= 0) & (ys < self.height())
+            painter.setPen( QColor(color[0],color[1],color[2]) )
+            for i in np.flatnonzero(visible):
+                cell = (int(xs[i] // self.LABEL_CELL[0]), int(ys[i] // self.LABEL_CELL[1]))
+                if cell in taken:
+                    continue
+                taken.add(cell)
+                painter.drawText( QRectF(xs[i]-R,ys[i]-R,2.0*R,2.0*R), labels[i][1], align )
+
+    def arrowPath(self, edges):
+        """
+        :return: path in pixels of the arrowheads of edges (QLineF in data coordinates) long enough for one
+        """
+        path = QPainterPath()
+        if not edges:
+            return path
+        x1, y1 = self.toScreen(np.array([edge.x1() for edge in edges]), np.array([edge.y1() for edge in edges]))
+        x2, y2 = self.toScreen(np.array([edge.x2() for edge in edges]), np.array([edge.y2() for edge in edges]))
+        dx, dy = x2 - x1, y2 - y1
+        length = np.hypot(dx, dy)
+        margin = 3.0*self.ARROW_SCALE
+        shown = (length >= self.MIN_ARROW_EDGE) & (x2 > -margin) & (x2 < self.width()+margin) & \
+                (y2 > -margin) & (y2 < self.height()+margin)
+        for i in np.flatnonzero(shown):
+            ux, uy = dx[i]/length[i], dy[i]/length[i]
+            backx, backy = x2[i] - 2*self.ARROW_SCALE*ux, y2[i] - 2*self.ARROW_SCALE*uy
+            path.addPolygon( QPolygonF([ QPointF(x2[i],y2[i]),
+                                         QPointF(backx - self.ARROW_SCALE*uy, backy + self.ARROW_SCALE*ux),
+                                         QPointF(backx + self.ARROW_SCALE*uy, backy - self.ARROW_SCALE*ux) ]) )
+            path.closeSubpath()
+        return path
+
+    def paintCities(self, painter):
         for color in self.pointList:
             c = QColor(color[0],color[1],color[2])
             painter.setPen( c )
-            b = painter.brush()
             painter.setBrush(c)
-            for point in self.pointList[color]:
-                pt = QPointF(scale*point.x(), scale*point.y())
-                painter.drawEllipse( pt, CITY_SIZE, CITY_SIZE)
-            painter.setBrush(b)
+            points = self.pointList[color]
+            xs, ys = self.toScreen(np.array([point.x() for point in points]), np.array([point.y() for point in points]))
+            for x, y in zip(xs, ys):
+                painter.drawEllipse( QPointF(x, y), self.CITY_SIZE, self.CITY_SIZE)
+
+
+class SolverWorker( QObject ):
+    """
+    Runs one solve on a QThread so the window keeps repainting. Anytime solvers (TSPSolver.ANYTIME_ALGORITHMS)
+    report every better tour and their counters every PROGRESS_INTERVAL seconds through progress, and can be
+    cancelled: the best tour found so far is then what finished carries.
+    """
+    PROGRESS_INTERVAL = 0.25
+    progress = pyqtSignal(object)
+    finished = pyqtSignal(object)
+
+    def __init__( self, solver, algorithm, time_allowance ):
+        super(SolverWorker,self).__init__()
+        self.solver = solver
+        self.algorithm = algorithm
+        self.time_allowance = time_allowance
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+    def run(self):
+        if self.algorithm not in TSPSolver.ANYTIME_ALGORITHMS:
+            self.finished.emit(getattr(self.solver, self.algorithm)(time_allowance=self.time_allowance))
+            return
+        improvements = self.solver.anytime(self.algorithm, self.time_allowance,
+                                           progress_interval=self.PROGRESS_INTERVAL)
+        results = None
+        while True:
+            try:
+                latest = next(improvements)
+            except StopIteration as stop:
+                results = stop.value
+                break
+            results = latest
+            self.progress.emit(results)
+            if self.cancelled:
+                improvements.close()
+                results = dict(results, cancelled=True)
+                break
+        self.finished.emit(results)
 
 
 class Proj5GUI( QMainWindow ):
@@ -190,6 +284,8 @@ class Proj5GUI( QMainWindow ):
         self._MAX_SEED = 1000
 
         self._scenario = None
+        self.solving = False
+        self.solveThread = None
         self.initUI()
         self.solver = TSPSolver( self.view )
         self.genParams = {'size':None,'seed':None,'diff':None}
@@ -197,21 +293,9 @@ class Proj5GUI( QMainWindow ):
     def newPoints(self):
         # TODO - ERROR CHECKING!!!!
         seed = int(self.curSeed.text())
-        random.seed( seed )
-
-        ptlist = []
-        RANGE = self.data_range
-        xr = self.data_range['x']
-        yr = self.data_range['y']
         npoints = int(self.size.text())
-        while len(ptlist) < npoints:
-            x = random.uniform(0.0,1.0)
-            y = random.uniform(0.0,1.0)
-            if True:
-                xval = xr[0] + (xr[1]-xr[0])*x
-                yval = yr[0] + (yr[1]-yr[0])*y
-                ptlist.append( QPointF(xval,yval) )
-        return ptlist
+        # Same points as the command line runner (TSPRunner.py) for this size and seed
+        return [QPointF(x, y) for x, y in generatePoints(npoints, seed, self.data_range)]
 
     def generateNetwork(self):
         points = self.newPoints() # uses current rand seed
@@ -244,6 +328,7 @@ class Proj5GUI( QMainWindow ):
         self.maxQSize.setText( '--' )
         self.totalStates.setText( '--' )
         self.prunedStates.setText( '--' )
+        self.dominatedStates.setText( '--' )
         self.statusBar.showMessage('')
         self.view.repaint()
 
@@ -282,27 +367,91 @@ class Proj5GUI( QMainWindow ):
         self.maxQSize.setText( '--' )
         self.totalStates.setText( '--' )
         self.prunedStates.setText( '--' )
+        self.dominatedStates.setText( '--' )
         self.statusBar.showMessage('Processing...')
-        solve_func = 'self.solver.'+self.ALGORITHMS[self.algDropDown.currentIndex()][1]
-        results = eval(solve_func)(time_allowance=max_time )
+        self._solution = None
+
+        # The solve runs on its own thread, the results come back through signals
+        algorithm = self.ALGORITHMS[self.algDropDown.currentIndex()][1]
+        if self.solveThread is not None:
+            self.solveThread.wait()  # the last solve is done, its thread may still be winding down
+        self.solveThread = QThread()
+        self.solveWorker = SolverWorker( self.solver, algorithm, max_time )
+        self.solveCancelled = False
+        self.solveWorker.moveToThread(self.solveThread)
+        self.solveThread.started.connect(self.solveWorker.run)
+        self.solveWorker.progress.connect(self.solveProgress)
+        self.solveWorker.finished.connect(self.solveFinished)
+        self.solveWorker.finished.connect(self.solveThread.quit)
+        self.solveThread.finished.connect(self.solveWorker.deleteLater)
+        self.solveThread.finished.connect(self.solveThread.deleteLater)
+        self.solveThread.finished.connect(lambda thread=self.solveThread: self.solveThreadFinished(thread))
+        self.setSolving(True, cancellable=algorithm in TSPSolver.ANYTIME_ALGORITHMS)
+        self.solveThread.start()
+
+    def solveProgress(self, results):
+        if results['soln'] is not self._solution:
+            self._solution = results['soln']
+            self.displaySolution()
+        self.showResults(results)
+        rate = results['total'] / results['time'] if results['total'] and results['time'] > 0 else None
+        self.statusBar.showMessage('Best {}   queue {}   states {}{}   {:.1f} s'.format(
+            results['cost'], results['max'] if results['max'] is not None else '--',
+            results['total'] if results['total'] is not None else '--',
+            ' ({:.0f}/s)'.format(rate) if rate else '', results['time']))
+
+    def solveFinished(self, results):
+        self.setSolving(False)
         if results:
-            self.statusBar.showMessage('')
-            self.numSolutions.setText( '{}'.format(results['count']) )
-            self.tourCost.setText( '{}'.format(results['cost']) )
-            self.solvedIn.setText( '{:6.6f} seconds'.format(results['time']) )
+            self.statusBar.showMessage('Cancelled, best tour so far' if results.get('cancelled') else '')
+            self.showResults(results)
             self._solution = results['soln']
-            if 'max' in results.keys():
-                self.maxQSize.setText( '{}'.format(results['max']))
-            if 'total' in results.keys():
-                self.totalStates.setText( '{}'.format(results['total']))
-            if 'pruned' in results.keys():
-                self.prunedStates.setText( '{}'.format(results['pruned']))
             self.displaySolution()
         else:
-            print( 'GOT NULL SOLUTION BACK!!' )
+            self.statusBar.showMessage('Cancelled before a tour was found' if self.solveCancelled else '')
+            if not self.solveCancelled:
+                print( 'GOT NULL SOLUTION BACK!!' )
         self.view.repaint()
 
+    def showResults(self, results):
+        self.numSolutions.setText( '{}'.format(results['count']) )
+        self.tourCost.setText( '{}'.format(results['cost']) )
+        self.solvedIn.setText( '{:6.6f} seconds'.format(results['time']) )
+        if 'max' in results.keys():
+            self.maxQSize.setText( '{}'.format(results['max']))
+        if 'total' in results.keys():
+            self.totalStates.setText( '{}'.format(results['total']))
+        if 'pruned' in results.keys():
+            self.prunedStates.setText( '{}'.format(results['pruned']))
+        if 'dominated' in results.keys():
+            self.dominatedStates.setText( '{}'.format(results['dominated']))
+
+    def cancelClicked(self):
+        self.solveCancelled = True
+        self.solveWorker.cancel()
+        self.cancelButton.setEnabled(False)
+        self.statusBar.showMessage('Cancelling...')
+
+    def solveThreadFinished(self, thread):
+        if thread is self.solveThread:  # a later solve may have started since this thread finished
+            self.solveThread = None
+
+    def setSolving(self, solving, cancellable=False):
+        """
+        While a solve runs only Cancel is available (if the algorithm can be cancelled): the scenario and the
+        solver settings can not change under it.
+        """
+        self.solving = solving
+        for widget in (self.solveButton, self.generateButton, self.randSeedButton, self.curSeed, self.size,
+                       self.diffDropDown, self.algDropDown, self.timeLimit):
+            widget.setEnabled(not solving)
+        self.cancelButton.setEnabled(solving and cancellable)
+        if not solving:
+            self.checkGenInputs()
+
     def checkGenInputs(self):
+        if self.solving:
+            return
         seed  = self.curSeed.text()
         size = self.size.text()
         diff = self.diffDropDown.currentText()
@@ -347,7 +496,10 @@ class Proj5GUI( QMainWindow ):
     ALGORITHMS = [ \
         ('Default                            ','defaultRandomTour'), \
         ('Greedy','greedy'), \
+        ('Local Search','localSearch'), \
         ('Branch and Bound','branchAndBound'), \
+        ('Parallel Branch and Bound','parallelBranchAndBound'), \
+        ('Held-Karp','heldKarp'), \
         ('Fancy','fancy') \
     ]															# whitespace hack to get longest to display correctly
 
@@ -372,6 +524,7 @@ class Proj5GUI( QMainWindow ):
         self.randSeedButton = QPushButton('Randomize Seed')
         self.generateButton = QPushButton('Generate Scenario')
         self.solveButton	= QPushButton('Solve TSP')
+        self.cancelButton	= QPushButton('Cancel')
 
         self.curSeed		= QLineEdit('20')
         self.curSeed.setFixedWidth(100)
@@ -388,6 +541,7 @@ class Proj5GUI( QMainWindow ):
         self.maxQSize		= QLineEdit('--')
         self.totalStates	= QLineEdit('--')
         self.prunedStates	= QLineEdit('--')
+        self.dominatedStates	= QLineEdit('--')
 
         self.diffDropDown	= QComboBox(self)
         self.algDropDown	= QComboBox(self)
@@ -417,6 +571,13 @@ class Proj5GUI( QMainWindow ):
         self.prunedStates.setEnabled(False)
         vbox.addLayout(h)
 
+        h = QHBoxLayout()
+        h.addStretch(1)
+        h.addWidget( QLabel( 'dominated states:' ) )
+        h.addWidget( self.dominatedStates )
+        self.dominatedStates.setEnabled(False)
+        vbox.addLayout(h)
+
 
         h = QHBoxLayout()
         h.addWidget( QLabel('Problem Size: ') )
@@ -437,6 +598,7 @@ class Proj5GUI( QMainWindow ):
         h.addWidget( self.timeLimit )
         h.addWidget( QLabel( 'seconds' ) )
         h.addWidget( self.solveButton )
+        h.addWidget( self.cancelButton )
         h.addStretch(1)
         vbox.addLayout(h)
 
@@ -456,6 +618,7 @@ class Proj5GUI( QMainWindow ):
 
         self.lastPath = (None,None)
         self.solveButton.setEnabled(False)
+        self.cancelButton.setEnabled(False)
 
         self.curSeed.textChanged.connect(self.checkGenInputs)
         self.size.textChanged.connect(self.checkGenInputs)
@@ -463,6 +626,7 @@ class Proj5GUI( QMainWindow ):
         self.randSeedButton.clicked.connect(self.randSeedClicked)
         self.generateButton.clicked.connect(self.generateClicked)
         self.solveButton.clicked.connect(self.solveClicked)
+        self.cancelButton.clicked.connect(self.cancelClicked)
 
         self.diffDropDown.addItem('Easy                               ')					# Weird hack to make box wide enough to show all of last item
         self.diffDropDown.addItem('Normal')
@@ -475,8 +639,8 @@ class Proj5GUI( QMainWindow ):
         for alg in self.ALGORITHMS:
             self.algDropDown.addItem( alg[0] )
         self.algDropDown.activated.connect(self.algChanged)
-        self.algDropDown.setCurrentIndex(2)
-        self.algChanged(2) # to handle start state
+        self.algDropDown.setCurrentIndex(3)
+        self.algChanged(3) # to handle start state
 
         self.graphReady = False
 
@@ -0,0 +1,89 @@
+import time
+
+
+class SearchProfile:
+    """
+    Opt-in instrumentation of a branch and bound search (TSPSolver.branchAndBound(profile=True)). The search
+    only calls it when it is given one, so a search without a profile runs the same code as before:
+        - time spent in each of PHASES, and how many times each ran;
+        - how many lower bounds were computed (one per child generated);
+        - how many states were pruned, for each of PRUNE_REASONS (dominated states are not in the search's
+          prunedCount but in its dominatedCount);
+        - a timeline of the queue size and the bssf cost, sampled every sampleInterval seconds.
+    The timeline keeps at most MAX_SAMPLES samples: when it is full every other sample is dropped and the
+    interval doubles, so it always covers the whole search. The profiles of the worker processes of a parallel
+    search are merged into the one of the main process (see merge).
+    """
+    # 'expand' is the time to generate and bound the children, without the time in 'reduce' (reducing their
+    # whole matrices, reduction bound only; incremental bounds, see Node.expandIncremental, are in 'expand').
+    # 'test' checks the children for complete routes and prunes them.
+    PHASES = ('pop', 'expand', 'reduce', 'test', 'push')
+    PRUNE_REASONS = (
+        'popped',     # the state was taken off the queue after the bssf got better than its bound
+        'expanded',   # the child was dropped by the bound while it was generated (batch expansion)
+        'child',      # the child's bound was no better than the bssf
+        'strategy',   # the search strategy did not keep the child (beam)
+        'spilled',    # the state was written to disk and discarded when the bssf got better than its bound
+        'dominated',  # a cheaper path reached the same cities and the same last city (see TranspositionTable)
+    )
+    MAX_SAMPLES = 500
+
+    def __init__(self, sampleInterval=0.01):
+        self.seconds = dict.fromkeys(self.PHASES, 0.0)
+        self.calls = dict.fromkeys(self.PHASES, 0)
+        self.pruned = dict.fromkeys(self.PRUNE_REASONS, 0)
+        self.boundEvaluations = 0
+        self.sampleInterval = sampleInterval
+        self.timeline = []  # [seconds since start, queue size, bssf cost]
+        self.workerTimelines = []  # timeline of every merged profile, its seconds are since that profile started
+        self.startTime = time.perf_counter()
+        self.nextSample = self.startTime
+
+    def add(self, phase, seconds, calls=1):
+        self.seconds[phase] += seconds
+        self.calls[phase] += calls
+
+    def prune(self, reason, count=1):
+        self.pruned[reason] += count
+
+    def sample(self, queueSize, bssfCost):
+        """
+        Adds a sample to the timeline if the last one is at least sampleInterval seconds old.
+        """
+        now = time.perf_counter()
+        if now < self.nextSample:
+            return
+        if len(self.timeline) >= self.MAX_SAMPLES:
+            del self.timeline[1::2]
+            self.sampleInterval *= 2
+        self.timeline.append([round(now - self.startTime, 6), queueSize, bssfCost])
+        self.nextSample = now + self.sampleInterval
+
+    def merge(self, results):
+        """
+        Adds the counters of another profile, as returned by its results() (e.g. sent by a worker process), to
+        this one. Its timeline is kept apart, in workerTimelines.
+        """
+        for phase in self.PHASES:
+            self.add(phase, results['phases'][phase]['seconds'], results['phases'][phase]['calls'])
+        for reason in self.PRUNE_REASONS:
+            self.prune(reason, results['pruned'][reason])
+        self.boundEvaluations += results['bound_evaluations']
+        self.workerTimelines.append(results['timeline'])
+
+    def results(self) -> dict:
+        """
+        :return: the profile as plain data that json.dumps accepts (no infinite bssf cost, it is None)
+        """
+        results = {
+            'phases': {phase: {'seconds': round(self.seconds[phase], 6), 'calls': self.calls[phase]}
+                       for phase in self.PHASES},
+            'bound_evaluations': self.boundEvaluations,
+            'pruned': dict(self.pruned),
+            'sample_interval': self.sampleInterval,
+            'timeline': [[seconds, queueSize, bssfCost if bssfCost != float('inf') else None]
+                         for seconds, queueSize, bssfCost in self.timeline],
+        }
+        if self.workerTimelines:
+            results['worker_timelines'] = self.workerTimelines
+        return results
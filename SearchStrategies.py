@@ -0,0 +1,103 @@
+class SearchStrategy:
+    """
+    Decides the order in which branchAndBound takes states off the priority queue. The queue holds
+    (key, tiebreak, node) tuples and the key of a node is computed only once, when it is pushed.
+    """
+    name = None
+
+    def key(self, node):
+        """
+        :param node: state about to be pushed into the queue
+        :return: priority of the node, lower keys are popped first
+        """
+        raise NotImplementedError
+
+    def select(self, children):
+        """
+        Chooses which of the children of an expanded node are worth pushing into the queue.
+        :param children: children that passed the bound test
+        :return: the children to keep, and the ones that were dropped
+        """
+        return children, []
+
+    def solutionFound(self) -> bool:
+        """
+        Called every time the BSSF improves.
+        :return: True if the keys changed and the queue has to be rebuilt with the new keys
+        """
+        return False
+
+
+class BestFirst(SearchStrategy):
+    """
+    Always expands the state with the lowest bound.
+    """
+    name = 'best'
+
+    def key(self, node):
+        return node.lowerBound
+
+
+class DepthWeighted(SearchStrategy):
+    """
+    Divides the bound by the depth, so deeper states (closer to a complete route) go first.
+    """
+    name = 'depth'
+
+    def key(self, node):
+        return node.lowerBound / max(node.level, 1)
+
+
+class DiveThenBest(SearchStrategy):
+    """
+    Goes depth first (lowest bound among the deepest states) until the first solution is found, then
+    switches to best first.
+    """
+    name = 'dive'
+
+    def __init__(self):
+        self.diving = True
+
+    def key(self, node):
+        if self.diving:
+            return -node.level, node.lowerBound
+        return node.lowerBound, 0
+
+    def solutionFound(self) -> bool:
+        if self.diving:
+            self.diving = False
+            return True
+        return False
+
+
+class Beam(DepthWeighted):
+    """
+    Depth weighted, but only the beamWidth children with the lowest bound of each expanded state are kept.
+    Faster, but it is not guaranteed to find the optimal route.
+    """
+    name = 'beam'
+
+    def __init__(self, beamWidth=3):
+        self.beamWidth = beamWidth
+
+    def select(self, children):
+        if len(children) <= self.beamWidth:
+            return children, []
+        children = sorted(children, key=lambda node: node.lowerBound)
+        return children[:self.beamWidth], children[self.beamWidth:]
+
+
+STRATEGIES = {strategy.name: strategy for strategy in (BestFirst, DepthWeighted, DiveThenBest, Beam)}
+
+
+def makeStrategy(strategy, **options) -> SearchStrategy:
+    """
+    :param strategy: name of the strategy (see STRATEGIES) or an already created SearchStrategy
+    :param options: arguments for the strategy constructor, like beamWidth
+    :return: the strategy to use
+    """
+    if isinstance(strategy, SearchStrategy):
+        return strategy
+    if strategy not in STRATEGIES:
+        raise ValueError('Unknown search strategy: {}'.format(strategy))
+    return STRATEGIES[strategy](**options)
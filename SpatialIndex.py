@@ -0,0 +1,137 @@
+import numpy as np
+
+
+class GridIndex:
+    """
+    Uniform grid over the city coordinates, about POINTS_PER_CELL cities per cell. The cities are sorted by
+    cell, so the cities of a cell are one slice of `order`.
+    """
+    POINTS_PER_CELL = 2.0
+    QUERY_CELLS = 1 << 22  # candidate (city, neighbor) cells looked at in one block of a k nearest query
+
+    def __init__(self, xs, ys):
+        self.xs = np.asarray(xs, dtype=float)
+        self.ys = np.asarray(ys, dtype=float)
+        count = len(self.xs)
+        self.minX, self.minY = (self.xs.min(), self.ys.min()) if count else (0.0, 0.0)
+        width = (self.xs.max() - self.minX) if count else 0.0
+        height = (self.ys.max() - self.minY) if count else 0.0
+        # Cells of equal area, but never so small that the grid has more cells than cities (points on a line)
+        perCell = self.POINTS_PER_CELL / max(count, 1)
+        self.cellSize = max(np.sqrt(width * height * perCell), max(width, height) * perCell, 1e-9)
+        self.columns = int(width / self.cellSize) + 1
+        self.rows = int(height / self.cellSize) + 1
+
+        cellX, cellY = self.cellOf(self.xs, self.ys)
+        cells = cellY * self.columns + cellX
+        self.order = np.argsort(cells, kind='stable')
+        self.cellStarts = np.concatenate(([0], np.cumsum(np.bincount(cells, minlength=self.columns * self.rows))))
+
+    def cellOf(self, xs, ys):
+        """
+        :return: column and row of the cell of every point (points outside the grid go to the border)
+        """
+        cellX = np.clip(((xs - self.minX) / self.cellSize).astype(np.intp), 0, self.columns - 1)
+        cellY = np.clip(((ys - self.minY) / self.cellSize).astype(np.intp), 0, self.rows - 1)
+        return cellX, cellY
+
+    def citiesInCells(self, cellX, cellY):
+        """
+        :param cellX: column of each cell, cells outside the grid are skipped
+        :param cellY: row of each cell
+        :return: the cities in those cells
+        """
+        inside = (cellX >= 0) & (cellX < self.columns) & (cellY >= 0) & (cellY < self.rows)
+        cells = cellY[inside] * self.columns + cellX[inside]
+        starts, ends = self.cellStarts[cells], self.cellStarts[cells + 1]
+        if not len(cells):
+            return np.zeros(0, dtype=np.intp)
+        return np.concatenate([self.order[start:end] for start, end in zip(starts, ends)])
+
+    def ring(self, cellX, cellY, radius):
+        """
+        :return: columns and rows of the cells at Chebyshev distance radius from cell (cellX, cellY)
+        """
+        if radius == 0:
+            return np.array([cellX]), np.array([cellY])
+        side = np.arange(-radius, radius + 1)
+        inner = side[1:-1]
+        dx = np.concatenate((side, side, np.full(len(inner), -radius), np.full(len(inner), radius)))
+        dy = np.concatenate((np.full(len(side), -radius), np.full(len(side), radius), inner, inner))
+        return cellX + dx, cellY + dy
+
+    def nearest(self, k):
+        """
+        The k nearest cities (Euclidean) of every city. Each city looks at the block of cells around its own,
+        2 * radius + 1 cells wide; when the k-th nearest found is farther than the block is guaranteed to
+        reach, the city is looked up again with a bigger block.
+        :return: n x k array of cities, nearest first (padded with -1 when there are fewer than k others)
+        """
+        count = len(self.xs)
+        result = np.full((count, k), -1, dtype=np.intp)
+        if count < 2 or k == 0:
+            return result
+        pending = np.arange(count)
+        largestCell = int(np.diff(self.cellStarts).max())
+        found = min(k, count - 1)
+        radius = 1
+        while len(pending):
+            # Once the block covers the whole grid every city has been looked at
+            wholeGrid = radius >= max(self.columns, self.rows)
+            width = (2 * radius + 1) ** 2 * largestCell
+            blockSize = max(1, self.QUERY_CELLS // width)
+            retry = []
+            for blockStart in range(0, len(pending), blockSize):
+                block = pending[blockStart:blockStart + blockSize]
+                neighbors, distances, reach = self.blockNearest(block, radius, largestCell, k)
+                exact = (distances[:, found - 1] <= reach) | wholeGrid
+                result[block[exact], :found] = neighbors[exact, :found]
+                retry.append(block[~exact])
+            pending = np.concatenate(retry)
+            radius *= 2
+        return result
+
+    def blockNearest(self, block, radius, largestCell, k):
+        """
+        :return: the k nearest cities of every city in block among the cells within radius of its cell, their
+                 distances, and how far from each city that area is sure to reach
+        """
+        cellX, cellY = self.cellOf(self.xs[block], self.ys[block])
+        offsets = np.arange(-radius, radius + 1)
+        dx, dy = np.meshgrid(offsets, offsets)
+        neighborX = cellX[:, np.newaxis] + dx.ravel()
+        neighborY = cellY[:, np.newaxis] + dy.ravel()
+        inside = (neighborX >= 0) & (neighborX < self.columns) & (neighborY >= 0) & (neighborY < self.rows)
+        cells = np.where(inside, neighborY * self.columns + neighborX, 0)
+        starts = np.where(inside, self.cellStarts[cells], 0)
+        sizes = np.where(inside, self.cellStarts[cells + 1] - self.cellStarts[cells], 0)
+
+        # Every (city, cell, slot in the cell) triple, slots past the size of the cell are padding
+        slots = np.arange(largestCell)
+        valid = slots[np.newaxis, np.newaxis, :] < sizes[:, :, np.newaxis]
+        positions = np.minimum(starts[:, :, np.newaxis] + slots, len(self.order) - 1)
+        candidates = self.order[positions].reshape(len(block), -1)
+        valid = valid.reshape(len(block), -1) & (candidates != block[:, np.newaxis])
+
+        distances = np.hypot(self.xs[candidates] - self.xs[block, np.newaxis],
+                             self.ys[candidates] - self.ys[block, np.newaxis])
+        distances[~valid] = np.inf
+        width = min(k, distances.shape[1])
+        nearest = np.argpartition(distances, width - 1, axis=1)[:, :width]
+        nearestDistances = np.take_along_axis(distances, nearest, axis=1)
+        byDistance = np.argsort(nearestDistances, axis=1, kind='stable')
+        nearest = np.take_along_axis(nearest, byDistance, axis=1)
+        nearestDistances = np.take_along_axis(nearestDistances, byDistance, axis=1)
+        neighbors = np.take_along_axis(candidates, nearest, axis=1)
+        if width < k:
+            neighbors = np.pad(neighbors, ((0, 0), (0, k - width)), constant_values=-1)
+            nearestDistances = np.pad(nearestDistances, ((0, 0), (0, k - width)), constant_values=np.inf)
+        neighbors[nearestDistances == np.inf] = -1
+
+        # Distance from each city to the border of the block of cells it looked at
+        left = self.xs[block] - (self.minX + (cellX - radius) * self.cellSize)
+        right = self.minX + (cellX + radius + 1) * self.cellSize - self.xs[block]
+        bottom = self.ys[block] - (self.minY + (cellY - radius) * self.cellSize)
+        top = self.minY + (cellY + radius + 1) * self.cellSize - self.ys[block]
+        reach = np.minimum.reduce([left, right, bottom, top])
+        return neighbors, nearestDistances, reach
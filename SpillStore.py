@@ -0,0 +1,88 @@
+import os
+import shutil
+import tempfile
+from array import array
+
+import numpy as np
+
+from Node import Node
+
+
+class SpillStore:
+    """
+    On-disk storage for search states that do not fit in the priority queue. States are written in batches,
+    each batch is one .npz file with the bounds, levels, paths and reduced matrices of its states.
+    """
+
+    def __init__(self, size, directory=None):
+        """
+        :param size: number of cities
+        :param directory: where the batches are written, a new temporary directory by default
+        """
+        self.size: int = size
+        self.directory: str = tempfile.mkdtemp(prefix='tsp-spill-', dir=directory)
+        self.batches: list = []  # (lowest lower bound in the batch, number of states, file name)
+        self.spilledCount: int = 0
+        self.batchNumber: int = 0
+
+    def hasStates(self) -> bool:
+        return len(self.batches) > 0
+
+    def spill(self, nodes):
+        """
+        Writes the nodes to disk and gives their matrices back to Node.pool.
+        :param nodes: nodes to save, they must not be used anymore after this
+        """
+        count = len(nodes)
+        lowerBounds = np.array([node.lowerBound for node in nodes], dtype=np.int64)
+        levels = np.array([node.level for node in nodes], dtype=np.int32)
+        paths = np.zeros((count, self.size), dtype=np.uint16)
+        matrices = np.empty((count, self.size, self.size), dtype=np.int32)
+        for i, node in enumerate(nodes):
+            paths[i, :len(node.pathVisited)] = node.pathVisited
+            matrices[i] = node.reducedMatrix
+            node.releaseMatrix()
+
+        fileName = os.path.join(self.directory, 'batch{}.npz'.format(self.batchNumber))
+        self.batchNumber += 1
+        np.savez(fileName, lowerBounds=lowerBounds, levels=levels, paths=paths, matrices=matrices)
+        self.batches.append((int(lowerBounds.min()), count, fileName))
+        self.spilledCount += count
+
+    def discardWorseThan(self, bssfCost) -> int:
+        """
+        Deletes, without reading them, the batches where no state can beat bssfCost.
+        :return: number of states deleted
+        """
+        discardedCount = 0
+        for batch in [batch for batch in self.batches if batch[0] >= bssfCost]:
+            self.batches.remove(batch)
+            os.remove(batch[2])
+            discardedCount += batch[1]
+        return discardedCount
+
+    def reload(self) -> list:
+        """
+        Reads back the batch with the lowest bound. Its matrices are copied into Node.pool.
+        :return: the nodes of the batch
+        """
+        batch = min(self.batches)
+        self.batches.remove(batch)
+        with np.load(batch[2]) as data:
+            lowerBounds, levels, paths, matrices = data['lowerBounds'], data['levels'], data['paths'], data['matrices']
+        os.remove(batch[2])
+
+        nodes = []
+        for i in range(len(lowerBounds)):
+            slot = Node.pool.acquire()
+            np.copyto(Node.pool.matrix(slot), matrices[i])
+            level = int(levels[i])
+            nodes.append(Node.restore(slot, level, array('H', paths[i, :level + 1].tolist()), int(lowerBounds[i])))
+        return nodes
+
+    def close(self):
+        """
+        Removes every file written by the store.
+        """
+        shutil.rmtree(self.directory, ignore_errors=True)
+        self.batches = []
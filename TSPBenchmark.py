@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite: runs the solvers over size x seed x difficulty and records, for every run, the results
+dict (cost, count, max, total, pruned), wall time, states per second and peak memory. Every run happens in
+its own process (so peak RSS is per run and one run can not warm up the next), builds its scenario with a
+generator of its own and seeds numpy's global generator (used by defaultRandomTour) with the scenario seed,
+so runs are repeatable and several can run at once (--jobs). Rows are written to <out>.csv and <out>.json,
+and compared against a baseline JSON from an earlier run to catch regressions.
+
+    python TSPBenchmark.py --sizes 10 15 20 --seeds 1 2 3 --out results/today
+    python TSPBenchmark.py --sizes 15 20 --algorithms branchAndBound --option bound=assignment \\
+        --baseline results/today.json --fail-on-regression
+"""
+import argparse
+import csv
+import inspect
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from TSPClasses import DIFFICULTIES
+
+ALGORITHMS = ('defaultRandomTour', 'greedy', 'localSearch', 'branchAndBound', 'parallelBranchAndBound', 'heldKarp')
+# Largest size run for these algorithms: above 20 cities the Held-Karp table is over its default memory budget, so
+# heldKarp would only measure its branchAndBound fallback
+MAX_SIZES = {'heldKarp': 20}
+COLUMNS = ('algorithm', 'size', 'seed', 'difficulty', 'cost', 'time', 'wall_time', 'count', 'max', 'total',
+           'pruned', 'states_per_sec', 'peak_rss_kb', 'options')
+# Fields compared against the baseline, smaller is better for all of them
+COMPARED = ('time', 'cost', 'total', 'peak_rss_kb')
+
+
+def peakRssKb() -> int:
+    """
+    :return: peak resident memory of this process in kilobytes (ru_maxrss is in bytes on macOS)
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def acceptedOptions(method, options) -> dict:
+    """
+    :return: the options method takes (all of them if it takes **kwargs)
+    """
+    parameters = inspect.signature(method).parameters
+    if any(parameter.kind == inspect.Parameter.VAR_KEYWORD for parameter in parameters.values()):
+        return dict(options)
+    return {key: value for key, value in options.items() if key in parameters}
+
+
+def measureRun(algorithm, size, seed, difficulty, time_allowance, options) -> dict:
+    """
+    One benchmark run, in the current process.
+    :return: a row with the COLUMNS fields
+    """
+    import TSPRunner
+    from TSPSolver import TSPSolver
+
+    np.random.seed(seed)
+    # Hard gets a stream of its own, with the default generator it would be the Hard (Deterministic) scenario
+    rng = np.random.default_rng([seed, 1]) if difficulty == 'Hard' else None
+    scenario = TSPRunner.buildScenario(size, seed, difficulty, rng=rng)
+    options = acceptedOptions(getattr(TSPSolver, algorithm), options)
+    start = time.perf_counter()
+    results = TSPRunner.runSolver(scenario, algorithm, time_allowance, **options)
+    wallTime = time.perf_counter() - start
+
+    results = TSPRunner.jsonValue(results)
+    row = {'algorithm': algorithm, 'size': size, 'seed': seed, 'difficulty': difficulty,
+           'wall_time': wallTime, 'peak_rss_kb': peakRssKb(), 'options': json.dumps(options, sort_keys=True)}
+    for field in ('cost', 'time', 'count', 'max', 'total', 'pruned'):
+        row[field] = results.get(field)
+    row['states_per_sec'] = row['total'] / row['time'] if row['total'] and row['time'] else None
+    return row
+
+
+def runInSubprocess(algorithm, size, seed, difficulty, time_allowance, options) -> dict:
+    """
+    Runs measureRun in a fresh Python process.
+    """
+    spec = json.dumps([algorithm, size, seed, difficulty, time_allowance, options])
+    script = os.path.abspath(__file__)
+    output = subprocess.run([sys.executable, script, '--measure', spec], capture_output=True, text=True,
+                            cwd=os.path.dirname(script))
+    if output.returncode != 0:
+        raise RuntimeError('{} failed on size {} seed {} {}:\n{}'.format(algorithm, size, seed, difficulty,
+                                                                       output.stderr))
+    return json.loads(output.stdout.splitlines()[-1])
+
+
+def runSuite(algorithms, sizes, seeds, difficulties, time_allowance, options, progress=None, jobs=1,
+             maxSizes=None) -> list:
+    """
+    :param progress: called with every row as soon as it is measured
+    :param jobs: number of runs measured at the same time (their times then compete for the cores)
+    :param maxSizes: largest size run for some of the algorithms (see MAX_SIZES), no limit by default
+    :return: one row per algorithm x size x seed x difficulty, without the sizes over the limits
+    """
+    maxSizes = maxSizes or {}
+    runs = [(algorithm, size, seed, difficulty) for size in sizes for seed in seeds for difficulty in difficulties
+            for algorithm in algorithms if size <= maxSizes.get(algorithm, size)]
+    rows = []
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(runInSubprocess, algorithm, size, seed, difficulty, time_allowance, options)
+                   for algorithm, size, seed, difficulty in runs]
+        for future in futures:
+            row = future.result()
+            rows.append(row)
+            if progress is not None:
+                progress(row)
+    return rows
+
+
+def writeRows(rows, out):
+    """
+    Writes rows to out.csv and out.json.
+    """
+    directory = os.path.dirname(out)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(out + '.csv', 'w', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+    with open(out + '.json', 'w') as file:
+        json.dump(rows, file, indent=1)
+
+
+def rowKey(row):
+    return row['algorithm'], row['size'], row['seed'], row['difficulty'], row['options']
+
+
+def compareRows(rows, baselineRows, tolerance=0.25, minTime=0.05) -> list:
+    """
+    Matches rows with the baseline rows of the same run and computes new / baseline for the COMPARED fields.
+    A run regresses when its cost gets worse, or its time, states or memory grow by more than tolerance
+    (times under minTime seconds are too noisy to compare).
+    :return: one comparison dict per matched row
+    """
+    baseline = {rowKey(row): row for row in baselineRows}
+    comparisons = []
+    for row in rows:
+        old = baseline.get(rowKey(row))
+        if old is None:
+            continue
+        comparison = {'algorithm': row['algorithm'], 'size': row['size'], 'seed': row['seed'],
+                      'difficulty': row['difficulty'], 'options': row['options'], 'regressions': []}
+        for field in COMPARED:
+            new, previous = row[field], old[field]
+            ratio = None
+            if new is not None and previous:
+                ratio = new / previous
+            elif new is None and previous is None:
+                ratio = 1.0
+            comparison[field + '_ratio'] = ratio
+            if field == 'cost':
+                worse = (new is None and previous is not None) or (ratio is not None and ratio > 1)
+            elif field == 'time':
+                worse = ratio is not None and ratio > 1 + tolerance and row['time'] >= minTime
+            else:
+                worse = ratio is not None and ratio > 1 + tolerance
+            if worse:
+                comparison['regressions'].append(field)
+        comparisons.append(comparison)
+    return comparisons
+
+
+def writeComparison(comparisons, out):
+    fields = ['algorithm', 'size', 'seed', 'difficulty', 'options'] + \
+             [field + '_ratio' for field in COMPARED] + ['regressions']
+    with open(out + '_comparison.csv', 'w', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=fields)
+        writer.writeheader()
+        for comparison in comparisons:
+            writer.writerow(dict(comparison, regressions=' '.join(comparison['regressions'])))
+
+
+def formatRow(row) -> str:
+    cost = row['cost'] if row['cost'] is not None else 'inf'
+    return '{algorithm:>22} {size:>4} {seed:>5} {difficulty:>20} cost {cost:>8} time {time:8.3f}s ' \
+           'states {total} rss {peak_rss_kb}kB'.format(**dict(row, cost=cost))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the TSP solvers over sizes, seeds and difficulties.')
+    parser.add_argument('--measure', help=argparse.SUPPRESS)  # one run, used by runInSubprocess
+    parser.add_argument('--algorithms', nargs='+', default=list(ALGORITHMS), help='TSPSolver methods')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 15, 20, 25, 30])
+    parser.add_argument('--seeds', type=int, nargs='+', default=[1, 2, 3])
+    parser.add_argument('--difficulties', nargs='+', default=list(DIFFICULTIES), choices=DIFFICULTIES)
+    parser.add_argument('--time', type=float, default=60.0, help='time allowance of every run in seconds')
+    parser.add_argument('--option', action='append', default=[],
+                        help='key=value for the solvers that take it, can be repeated')
+    parser.add_argument('--jobs', type=int, default=1, help='runs measured at the same time')
+    parser.add_argument('--out', default='benchmark', help='output path without extension')
+    parser.add_argument('--baseline', help='JSON written by an earlier run to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed growth before a regression')
+    parser.add_argument('--fail-on-regression', action='store_true', help='exit with 1 if anything regressed')
+    args = parser.parse_args(argv)
+
+    if args.measure:
+        print(json.dumps(measureRun(*json.loads(args.measure))))
+        return 0
+
+    from TSPRunner import parseOption
+    options = dict(parseOption(option) for option in args.option)
+    rows = runSuite(args.algorithms, args.sizes, args.seeds, args.difficulties, args.time, options,
+                    progress=lambda row: print(formatRow(row), flush=True), jobs=args.jobs, maxSizes=MAX_SIZES)
+    writeRows(rows, args.out)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            comparisons = compareRows(rows, json.load(file), tolerance=args.tolerance)
+        writeComparison(comparisons, args.out)
+        regressed = [comparison for comparison in comparisons if comparison['regressions']]
+        print('{} runs compared with the baseline, {} regressed'.format(len(comparisons), len(regressed)))
+        for comparison in regressed:
+            print('  {algorithm} size {size} seed {seed} {difficulty}: {fields}'.format(
+                fields=', '.join(comparison['regressions']), **comparison))
+        if regressed and args.fail_on_regression:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -3,9 +3,13 @@
 
 import math
 import numpy as np
+import os
 import random
 import time
 
+from CostMatrix import MAP_SCALE, MISSING, DenseCostMatrix, EdgeMask, HashedEdges, MemmapCostMatrix, TiledCostMatrix
+from SpatialIndex import GridIndex
+
 
 class TSPSolution:
     def __init__(self, listOfCities):
@@ -17,28 +21,25 @@ class TSPSolution:
         Calculates the cost of the route this class holds.
         :return: the cost of the route
         """
-        cost = 0
-        last = self.route[0]
-        for city in self.route[1:]:
-            cost += last.costTo(city)
-            last = city
-        cost += self.route[-1].costTo(self.route[0])
-        return cost
+        cost = self.edgeCosts().sum()
+        return int(cost) if cost < np.inf else np.inf
+
+    def edgeCosts(self):
+        """
+        Looks up the cost of every edge of the route (including the one back to the start) in the
+        scenario cost matrix.
+        :return: array with the cost of each edge, in route order
+        """
+        indices = np.fromiter((city.index for city in self.route), dtype=np.intp, count=len(self.route))
+        costs = self.route[0].scenario.getCosts()
+        return costs[indices, np.roll(indices, -1)]
 
     def enumerateEdges(self):
-        elist = []
-        c1 = self.route[0]
-        for c2 in self.route[1:]:
-            dist = c1.costTo(c2)
-            if dist == np.inf:
-                return None
-            elist.append((c1, c2, int(math.ceil(dist))))
-            c1 = c2
-        dist = self.route[-1].costTo(self.route[0])
-        if dist == np.inf:
+        costs = self.edgeCosts()
+        if np.isinf(costs).any():
             return None
-        elist.append((self.route[-1], self.route[0], int(math.ceil(dist))))
-        return elist
+        nextCities = self.route[1:] + self.route[:1]
+        return [(c1, c2, int(cost)) for c1, c2, cost in zip(self.route, nextCities, costs)]
 
 
 def nameForInt(num):
@@ -50,76 +51,331 @@ def nameForInt(num):
         return nameForInt((num - 1) // 26) + nameForInt((num - 1) % 26 + 1)
 
 
+DIFFICULTIES = ('Easy', 'Normal', 'Hard', 'Hard (Deterministic)')
+DATA_RANGE = {'x': [-1.5, 1.5], 'y': [-1.0, 1.0]}
+
+
+def generatePoints(npoints, seed, data_range=DATA_RANGE):
+    """
+    Random city locations, the same ones the GUI generates for this size and seed. They come from a
+    random.Random of their own, the global random generator is left alone.
+    :return: list of (x, y) tuples
+    """
+    generator = random.Random(seed)
+    xr = data_range['x']
+    yr = data_range['y']
+    ptlist = []
+    while len(ptlist) < npoints:
+        x = generator.uniform(0.0, 1.0)
+        y = generator.uniform(0.0, 1.0)
+        ptlist.append((xr[0] + (xr[1] - xr[0]) * x, yr[0] + (yr[1] - yr[0]) * y))
+    return ptlist
+
+
+def pointCoordinates(pt):
+    """
+    :param pt: (x, y) tuple or a Qt point
+    :return: (x, y)
+    """
+    if isinstance(pt, (tuple, list)):
+        return pt[0], pt[1]
+    return pt.x(), pt.y()
+
+
 class Scenario:
     HARD_MODE_FRACTION_TO_REMOVE = 0.20  # Remove 20% of the edges
+    CANDIDATES = 10  # default length of the candidate lists
+    STORAGES = ('dense', 'tiled', 'memmap')
+    LARGE_CITIES = 10000  # above this many cities the costs are not kept in memory by default
+    EXPLICIT = 'Explicit'  # difficulty of scenarios whose costs are given (see fromCostMatrix), not computed
 
-    def __init__(self, city_locations, difficulty, rand_seed):
+    def __init__(self, city_locations, difficulty, rand_seed, rng=None, storage=None, storage_path=None):
+        """
+        :param city_locations: points of the cities, (x, y) tuples or Qt points (anything with x() and y())
+        :param difficulty: 'Easy', 'Normal', 'Hard' or 'Hard (Deterministic)'
+        :param rand_seed: seed of the scenario
+        :param rng: numpy Generator the elevations and removed edges are drawn from. By default it is seeded
+                    with rand_seed, except for 'Hard' which is different every time. Global random state
+                    is never used, so scenarios can be built concurrently.
+        :param storage: how the costs are kept (see getCosts), 'dense' up to LARGE_CITIES cities and 'tiled'
+                        above by default:
+                        'dense': an n x n float matrix in memory,
+                        'tiled': computed on demand from the city arrays, nothing n x n is kept,
+                        'memmap': an n x n int32 file mapped into memory, written in blocks of rows.
+                        Hard scenarios that are not dense remove their edges with HashedEdges instead of an
+                        n x n bitmap (so their missing edges differ from the dense scenario of the same seed).
+        :param storage_path: file for 'memmap', a temporary file by default
+        """
         self.difficulty = difficulty
-
-        if difficulty == "Normal" or difficulty == "Hard":
-            self.cities = [City(pt.x(), pt.y(), \
-                                 random.uniform(0.0, 1.0) \
-                                 ) for pt in city_locations]
-        elif difficulty == "Hard (Deterministic)":
-            random.seed(rand_seed)
-            self.cities = [City(pt.x(), pt.y(), \
-                                 random.uniform(0.0, 1.0) \
-                                 ) for pt in city_locations]
+        if rng is None:
+            rng = np.random.default_rng(None if difficulty == "Hard" else rand_seed)
+        city_locations = [pointCoordinates(pt) for pt in city_locations]
+        ncities = len(city_locations)
+
+        # The cities as arrays, the City objects are built from them
+        coordinates = np.array(city_locations, dtype=float).reshape(ncities, 2)
+        if difficulty in ("Normal", "Hard", "Hard (Deterministic)"):
+            elevations = rng.random(ncities)
         else:
-            self.cities = [City(pt.x(), pt.y()) for pt in city_locations]
-
-        num = 0
-        for city in self.cities:
+            elevations = np.zeros(ncities)
+        self.setCities(coordinates[:, 0], coordinates[:, 1], elevations)
+
+        storage = self.checkStorage(storage)
+        self.edge_exists = None
+        self.removed_edges = None
+        if storage == 'dense':
+            # Assume all edges exists except self-edges
+            self.edge_exists = ~np.eye(ncities, dtype=bool)
+            if difficulty == "Hard" or difficulty == "Hard (Deterministic)":
+                self.thinEdges(rng)
+        elif difficulty == "Hard" or difficulty == "Hard (Deterministic)":
+            self.removed_edges = self.hashedEdges(rng)
+        self.setupCosts(storage, storage_path)
+
+    def setCities(self, xs, ys, elevations):
+        """
+        Builds the City objects from the city arrays.
+        """
+        self.xs, self.ys, self.elevations = xs, ys, elevations
+        self.cities = [City(x, y, elevation) for x, y, elevation in
+                       zip(self.xs.tolist(), self.ys.tolist(), self.elevations.tolist())]
+        for num, city in enumerate(self.cities):
             city.setScenario(self)
             city.setIndexAndName(num, nameForInt(num + 1))
-            num += 1
 
-        # Assume all edges exists except self-edges
-        ncities = len(self.cities)
-        self.edge_exists = (np.ones((ncities, ncities)) - np.diag(np.ones(ncities))) > 0
+    def checkStorage(self, storage):
+        """
+        :return: storage, or the default one for the number of cities if it is None
+        """
+        if storage is None:
+            storage = 'dense' if len(self.cities) <= self.LARGE_CITIES else 'tiled'
+        if storage not in self.STORAGES:
+            raise ValueError('Unknown storage {}, expected one of {}'.format(storage, ', '.join(self.STORAGES)))
+        return storage
 
-        if difficulty == "Hard":
-            self.thinEdges()
-        elif difficulty == "Hard (Deterministic)":
-            self.thinEdges(deterministic=True)
+    def setupCosts(self, storage, storage_path=None, stored_costs=None):
+        """
+        Sets up the CostMatrix of the scenario from its cities and missing edges (edge_exists if it has the
+        bitmap, removed_edges otherwise).
+        :param stored_costs: n x n int32 costs already computed (see save), used as they are unless the storage
+                             is 'dense'
+        """
+        if stored_costs is not None and storage != 'dense':
+            storage = 'memmap'
+        self.storage = storage
+        self.cost_matrix = None
+        if storage == 'dense':
+            if stored_costs is not None:
+                self.cost_matrix = np.where(stored_costs == MISSING, np.inf, stored_costs.astype(float))
+            else:
+                self.cost_matrix = self.buildCostMatrix()
+            self.costs = DenseCostMatrix(self.cost_matrix)
+        elif stored_costs is not None:
+            self.costs = MemmapCostMatrix(stored_costs)
+        else:
+            removedEdges = EdgeMask(self.edge_exists) if self.edge_exists is not None else self.removed_edges
+            self.costs = TiledCostMatrix(self.xs, self.ys, self.elevations, self.difficulty != 'Easy',
+                                         removedEdges)
+            if storage == 'memmap':
+                self.costs = MemmapCostMatrix.fromCosts(self.costs, storage_path)
+        self.spatial_index = None
+        self.candidate_lists = {}
+
+    @classmethod
+    def fromCostMatrix(cls, xs, ys, cost_matrix):
+        """
+        Scenario with the given costs instead of costs computed from the cities (e.g. a TSPLIB instance).
+        :param xs: x of the cities, only used to draw them and to find their neighbors
+        :param ys: y of the cities
+        :param cost_matrix: n x n float matrix, np.inf where there is no edge
+        """
+        scenario = cls.__new__(cls)
+        scenario.difficulty = cls.EXPLICIT
+        scenario.setCities(np.asarray(xs, dtype=float), np.asarray(ys, dtype=float), np.zeros(len(cost_matrix)))
+        scenario.edge_exists = np.isfinite(cost_matrix)
+        scenario.removed_edges = None
+        scenario.storage = 'dense'
+        scenario.cost_matrix = cost_matrix
+        scenario.costs = DenseCostMatrix(cost_matrix)
+        scenario.spatial_index = None
+        scenario.candidate_lists = {}
+        return scenario
+
+    def save(self, path, costs=False):
+        """
+        Saves the scenario as numpy arrays: the city arrays, the difficulty, the missing edges (edge_exists, or
+        the key and kept tour of removed_edges) and, with costs (always for Explicit scenarios), the costs as
+        an int32 matrix written block by block (see CostMatrix.fillInt32).
+        :param path: a .npz file (compressed), or a directory of .npy files that load maps without copying
+        """
+        arrays = {'xs': self.xs, 'ys': self.ys, 'elevations': self.elevations,
+                  'difficulty': np.array(self.difficulty)}
+        if self.edge_exists is not None:
+            arrays['edge_exists'] = self.edge_exists
+        if self.removed_edges is not None:
+            arrays['edge_key'] = np.array(self.removed_edges.key)
+            arrays['kept_next'] = self.removed_edges.keptNext
+        costs = costs or self.difficulty == self.EXPLICIT
+
+        if path.endswith('.npz'):
+            if costs:
+                arrays['costs'] = self.costs.fillInt32(np.empty(self.costs.shape, dtype=np.int32))
+            np.savez_compressed(path, **arrays)
+            return
+        os.makedirs(path, exist_ok=True)
+        for name in os.listdir(path):
+            if name.endswith('.npy'):
+                os.remove(os.path.join(path, name))
+        for name, array in arrays.items():
+            np.save(os.path.join(path, name + '.npy'), array)
+        if costs:
+            stored = np.lib.format.open_memmap(os.path.join(path, 'costs.npy'), mode='w+', dtype=np.int32,
+                                               shape=self.costs.shape)
+            self.costs.fillInt32(stored).flush()
+
+    @classmethod
+    def load(cls, path, storage=None, storage_path=None):
+        """
+        Loads a scenario written by save. A directory is mapped into memory, nothing is read until it is used.
+        :param storage: see __init__, by default the saved costs when there are some (mapped without copying
+                        from a directory), otherwise picked from the number of cities
+        :param storage_path: see __init__
+        """
+        if os.path.isdir(path):
+            arrays = {name[:-len('.npy')]: np.load(os.path.join(path, name), mmap_mode='r')
+                      for name in os.listdir(path) if name.endswith('.npy')}
+        else:
+            with np.load(path) as file:
+                arrays = {name: file[name] for name in file.files}
+
+        scenario = cls.__new__(cls)
+        scenario.difficulty = str(arrays['difficulty'])
+        scenario.setCities(arrays['xs'], arrays['ys'], arrays['elevations'])
+        scenario.edge_exists = arrays.get('edge_exists')
+        scenario.removed_edges = None
+        if 'edge_key' in arrays:
+            scenario.removed_edges = HashedEdges(int(arrays['edge_key']), cls.HARD_MODE_FRACTION_TO_REMOVE,
+                                                 np.asarray(arrays['kept_next']))
+        stored = arrays.get('costs')
+        if storage is None and stored is not None:
+            storage = 'memmap'
+        scenario.setupCosts(scenario.checkStorage(storage), storage_path, stored)
+        return scenario
 
     def getCities(self):
         return self.cities
 
-    def randperm(self, n):
-        perm = np.arange(n)
-        for i in range(n):
-            randind = random.randint(i, n - 1)
-            save = perm[i]
-            perm[i] = perm[randind]
-            perm[randind] = save
-        return perm
+    def getCosts(self):
+        """
+        :return: CostMatrix of the scenario, indexed like a numpy matrix whatever the storage
+        """
+        return self.costs
 
-    def thinEdges(self, deterministic=False):
+    def getCostMatrix(self):
+        """
+        :return: the whole n x n float matrix (built in memory each time unless the storage is 'dense')
+        """
+        if self.cost_matrix is not None:
+            return self.cost_matrix
+        return self.costs.dense()
+
+    def getSpatialIndex(self):
+        """
+        :return: GridIndex over the city coordinates, built the first time it is needed
+        """
+        if self.spatial_index is None:
+            self.spatial_index = GridIndex(self.xs, self.ys)
+        return self.spatial_index
+
+    def candidateLists(self, k=CANDIDATES):
+        """
+        The k cities worth going to next from every city: out of its 2k nearest cities (by distance), the ones
+        it has an edge to, cheapest edge first.
+        :return: n x k array of city indices, padded with -1 when a city has fewer candidates
+        """
+        if k not in self.candidate_lists:
+            neighbors = self.getSpatialIndex().nearest(2 * k)
+            rows = np.arange(len(neighbors))[:, np.newaxis]
+            costs = np.where(neighbors >= 0, self.costs[rows, np.maximum(neighbors, 0)], np.inf)
+            cheapest = np.argsort(costs, axis=1, kind='stable')[:, :k]
+            candidates = np.take_along_axis(neighbors, cheapest, axis=1)
+            candidates[np.take_along_axis(costs, cheapest, axis=1) == np.inf] = -1
+            self.candidate_lists[k] = candidates
+        return self.candidate_lists[k]
+
+    def buildCostMatrix(self):
+        """
+        Computes the cost of every edge at once, following the same rules as City.costTo.
+        :return: n x n matrix, cell [i, j] is the cost from city i to city j (infinity if there is no edge)
+        """
+        xs, ys, elevations = self.xs, self.ys, self.elevations
+
+        # Euclidean Distance, squared in place to keep the temporaries down for big scenarios
+        cost = xs[np.newaxis, :] - xs[:, np.newaxis]
+        np.square(cost, out=cost)
+        dy = ys[np.newaxis, :] - ys[:, np.newaxis]
+        np.square(dy, out=dy)
+        cost += dy
+        del dy
+        np.sqrt(cost, out=cost)
+
+        # For Medium and Hard modes, add in an asymmetric cost (in easy mode it is zero).
+        if not self.difficulty == 'Easy':
+            cost += elevations[np.newaxis, :] - elevations[:, np.newaxis]
+            np.maximum(cost, 0.0, out=cost)
+
+        cost *= MAP_SCALE
+        np.ceil(cost, out=cost)
+        if self.edge_exists is not None:
+            cost[~self.edge_exists] = np.inf
+        else:
+            np.fill_diagonal(cost, np.inf)
+            if self.removed_edges is not None:
+                rows, cols = np.indices(cost.shape)
+                cost[self.removed_edges.missing(rows, cols)] = np.inf
+        return cost
+
+    def hashedEdges(self, rng):
+        """
+        The edges removed from a Hard scenario that does not keep them in a bitmap, see HashedEdges.
+        :param rng: numpy Generator the kept tour and the hash key are drawn from
+        """
+        route_keep = rng.permutation(len(self.cities))
+        kept_next = np.empty_like(route_keep)
+        kept_next[route_keep] = np.roll(route_keep, -1)
+        return HashedEdges(rng.integers(0, 1 << 63, dtype=np.uint64), self.HARD_MODE_FRACTION_TO_REMOVE, kept_next)
+
+    def thinEdges(self, rng):
+        """
+        Removes HARD_MODE_FRACTION_TO_REMOVE of the edges, picked uniformly at random, except the edges of one
+        random tour (so there is always a solution). The edges are drawn in bulk: every round draws more cells
+        than still needed and removes the distinct ones that can be deleted (a random subset of them on the
+        last round), which picks the same way as drawing one edge at a time.
+        :param rng: numpy Generator the edges are drawn from
+        """
         ncities = len(self.cities)
         edge_count = ncities * (ncities - 1)  # can't have self-edge
-        num_to_remove = np.floor(self.HARD_MODE_FRACTION_TO_REMOVE * edge_count)
-
-        can_delete = self.edge_exists.copy()
+        num_to_remove = int(np.floor(self.HARD_MODE_FRACTION_TO_REMOVE * edge_count))
 
         # Set aside a route to ensure at least one tour exists
-        route_keep = np.random.permutation(ncities)
-        if deterministic:
-            route_keep = self.randperm(ncities)
-        for i in range(ncities):
-            can_delete[route_keep[i], route_keep[(i + 1) % ncities]] = False
+        route_keep = rng.permutation(ncities)
+        can_delete = self.edge_exists.copy()
+        can_delete[route_keep, np.roll(route_keep, -1)] = False
+        num_to_remove = min(num_to_remove, int(np.count_nonzero(can_delete)))
 
-        # Now remove edges until
+        deletable = can_delete.reshape(-1)
+        exists = self.edge_exists.reshape(-1)
+        drawn = np.zeros(ncities * ncities, dtype=bool)
         while num_to_remove > 0:
-            if deterministic:
-                src = random.randint(0, ncities - 1)
-                dst = random.randint(0, ncities - 1)
-            else:
-                src = np.random.randint(ncities)
-                dst = np.random.randint(ncities)
-            if self.edge_exists[src, dst] and can_delete[src, dst]:
-                self.edge_exists[src, dst] = False
-                num_to_remove -= 1
+            drawn[:] = False
+            drawn[rng.integers(0, ncities * ncities, size=num_to_remove + num_to_remove // 4 + 16)] = True
+            drawn &= deletable
+            cells = np.flatnonzero(drawn)
+            if len(cells) > num_to_remove:
+                cells = rng.choice(cells, num_to_remove, replace=False)
+            deletable[cells] = False
+            exists[cells] = False
+            num_to_remove -= len(cells)
 
 
 class City:
@@ -130,13 +386,6 @@ class City:
         self.scenario = None
         self.index = -1
         self.name = None
-        self.visited = False
-
-    def setVisited(self, visited: bool):
-        self.visited = visited
-
-    def hasBeenVisited(self):
-        return self.visited
 
     def setIndexAndName(self, index, name):
         self.index = index
@@ -151,36 +400,21 @@ class City:
 		 
 		In advanced mode, it returns infinity when there is no connection.
 		</summary> '''
-    MAP_SCALE = 1000.0
+    MAP_SCALE = MAP_SCALE
 
     def costTo(self, other_city):
-
-        assert (type(other_city) == City)
-
-        # In hard mode, remove edges; this slows down the calculation...
-        # Use this in all difficulties, it ensures INF for self-edge
-
-        # If there is no edge between cities with index self._index to other_city._index
-        if not self.scenario.edge_exists[self.index, other_city.index]:
+        # The scenario knows every edge (see Scenario.getCosts), missing edges and self-edges are
+        # already INF there.
+        cost = self.scenario.costs[self.index, other_city.index]
+        if cost == np.inf:
             return np.inf
-
-        # Euclidean Distance
-        cost = math.sqrt((other_city.x - self.x) ** 2 +
-                         (other_city.y - self.y) ** 2)
-
-        # For Medium and Hard modes, add in an asymmetric cost (in easy mode it is zero).
-        if not self.scenario.difficulty == 'Easy':
-            cost += (other_city.elevation - self.elevation)
-            if cost < 0.0:
-                cost = 0.0
-
-        return int(math.ceil(cost * self.MAP_SCALE))
+        return int(cost)
 
     def __str__(self):
-        return f"City({self.name}): Elevation: {self.elevation}, Index: {self.index}, Coordinates: ({self.x}, {self.y}), Visited: {self.visited}"
+        return f"City({self.name}): Elevation: {self.elevation}, Index: {self.index}, Coordinates: ({self.x}, {self.y})"
 
     def __repr__(self):
-        return f"City({self.name}): Elevation: {self.elevation}, Index: {self.index}, Coordinates: ({self.x}, {self.y}), Visited: {self.visited}"
+        return f"City({self.name}): Elevation: {self.elevation}, Index: {self.index}, Coordinates: ({self.x}, {self.y})"
 
 
     def __eq__(self, other):
@@ -0,0 +1,156 @@
+"""
+TSPLIB (.tsp / .atsp) import and export, so the solvers can be run on the standard public instances.
+
+    scenario = readTsplib('att48.tsp')
+    writeTsplib(scenario, 'scenario.atsp')
+
+Imported scenarios are Explicit (see Scenario.fromCostMatrix): their costs follow the EDGE_WEIGHT_TYPE of the
+file, so tour costs can be compared with the published optimal ones.
+"""
+import math
+
+import numpy as np
+
+from TSPClasses import Scenario
+
+# Edge weight functions of TSPLIB, from the coordinate differences (GEO is handled on its own)
+DISTANCES = {
+    'EUC_2D': lambda dx, dy: np.floor(np.sqrt(dx * dx + dy * dy) + 0.5),
+    'CEIL_2D': lambda dx, dy: np.ceil(np.sqrt(dx * dx + dy * dy)),
+    'ATT': lambda dx, dy: attDistance(np.sqrt((dx * dx + dy * dy) / 10.0)),
+}
+EXPLICIT_FORMATS = ('FULL_MATRIX', 'UPPER_ROW', 'LOWER_ROW', 'UPPER_DIAG_ROW', 'LOWER_DIAG_ROW')
+SECTIONS = ('NODE_COORD_SECTION', 'DISPLAY_DATA_SECTION', 'EDGE_WEIGHT_SECTION')
+
+
+def attDistance(r):
+    t = np.floor(r + 0.5)
+    return np.where(t < r, t + 1, t)
+
+
+def geoDistance(xs, ys):
+    """
+    :return: the GEO distances of TSPLIB, x is the latitude and y the longitude in DDD.MM
+    """
+    def radians(values):
+        degrees = np.trunc(values)
+        return 3.141592 * (degrees + 5.0 * (values - degrees) / 3.0) / 180.0
+
+    latitude, longitude = radians(xs), radians(ys)
+    q1 = np.cos(longitude[:, np.newaxis] - longitude)
+    q2 = np.cos(latitude[:, np.newaxis] - latitude)
+    q3 = np.cos(latitude[:, np.newaxis] + latitude)
+    return np.trunc(6378.388 * np.arccos(np.clip(0.5 * ((1 + q1) * q2 - (1 - q1) * q3), -1, 1)) + 1.0)
+
+
+def parseTsplib(path):
+    """
+    :return: the header (keyword -> value) and the numbers of every section in SECTIONS (name -> float array)
+    """
+    header, sections = {}, {}
+    current = None
+    with open(path) as file:
+        for line in file:
+            line = line.strip()
+            if not line:
+                continue
+            keyword = line.split(':')[0].strip().upper()
+            if keyword == 'EOF':
+                break
+            if keyword in SECTIONS:
+                current = sections.setdefault(keyword, [])
+            elif keyword.endswith('_SECTION'):
+                current = None  # a section that is not needed (TOUR_SECTION, DEPOT_SECTION...), skipped
+            elif ':' in line and not line[0].isdigit() and line[0] not in '+-.':
+                header[keyword] = line.split(':', 1)[1].strip()
+                current = None
+            elif current is not None:
+                current.append(line)
+    return header, {name: np.array(' '.join(lines).split(), dtype=float) for name, lines in sections.items()}
+
+
+def explicitMatrix(weights, numberCities, weightFormat):
+    """
+    :param weights: the numbers of the EDGE_WEIGHT_SECTION
+    :return: the n x n matrix they stand for
+    """
+    if weightFormat == 'FULL_MATRIX':
+        return weights[:numberCities * numberCities].reshape(numberCities, numberCities).copy()
+    if weightFormat not in EXPLICIT_FORMATS:
+        raise ValueError('Unsupported EDGE_WEIGHT_FORMAT {}'.format(weightFormat))
+    # The triangle is listed row by row, the same order numpy lists its indices in
+    diagonal = 0 if 'DIAG' in weightFormat else 1
+    if weightFormat.startswith('UPPER'):
+        rows, cols = np.triu_indices(numberCities, diagonal)
+    else:
+        rows, cols = np.tril_indices(numberCities, -diagonal)
+    matrix = np.zeros((numberCities, numberCities))
+    matrix[rows, cols] = weights[:len(rows)]
+    matrix[cols, rows] = weights[:len(rows)]
+    return matrix
+
+
+def readTsplib(path):
+    """
+    :param path: a .tsp or .atsp file with NODE_COORD_SECTION (EUC_2D, CEIL_2D, ATT or GEO) or with an
+                 EXPLICIT EDGE_WEIGHT_SECTION in one of EXPLICIT_FORMATS
+    :return: Explicit Scenario with the costs of the file, self-edges are missing
+    """
+    header, sections = parseTsplib(path)
+    numberCities = int(header['DIMENSION'])
+    weightType = header.get('EDGE_WEIGHT_TYPE', 'EUC_2D').upper()
+    coordinates = sections.get('NODE_COORD_SECTION', sections.get('DISPLAY_DATA_SECTION'))
+    if coordinates is not None:
+        coordinates = coordinates.reshape(numberCities, -1)
+        xs, ys = coordinates[:, 1], coordinates[:, 2]
+    else:
+        # Nothing to draw, the cities go around a circle
+        angles = np.linspace(0, 2 * math.pi, numberCities, endpoint=False)
+        xs, ys = np.cos(angles), np.sin(angles)
+
+    if weightType == 'EXPLICIT':
+        matrix = explicitMatrix(sections['EDGE_WEIGHT_SECTION'], numberCities,
+                                header.get('EDGE_WEIGHT_FORMAT', 'FULL_MATRIX').upper())
+    elif weightType == 'GEO':
+        matrix = geoDistance(xs, ys)
+    elif weightType in DISTANCES:
+        dx, dy = xs[np.newaxis, :] - xs[:, np.newaxis], ys[np.newaxis, :] - ys[:, np.newaxis]
+        matrix = DISTANCES[weightType](dx, dy)
+    else:
+        raise ValueError('Unsupported EDGE_WEIGHT_TYPE {}'.format(weightType))
+    matrix = matrix.astype(float)
+    np.fill_diagonal(matrix, np.inf)
+    return Scenario.fromCostMatrix(xs, ys, matrix)
+
+
+def writeTsplib(scenario, path, name=None):
+    """
+    Writes scenario as an EXPLICIT FULL_MATRIX instance (TYPE TSP when the costs are symmetric, ATSP
+    otherwise) with the cities as display data. TSPLIB has no missing edges, they are written with a cost
+    higher than any tour without them, so a tour only uses one when there is no other way.
+    """
+    costs = scenario.getCosts()
+    numberCities = len(costs)
+    # Largest finite cost and symmetry, a block of rows at a time
+    largest, symmetric = 0.0, True
+    for start, stop, block in costs.rowBlocks():
+        finite = block[np.isfinite(block)]
+        largest = max(largest, finite.max() if len(finite) else 0.0)
+        symmetric = symmetric and np.array_equal(block, costs[:, start:stop].T)
+    missing = int(largest) * numberCities + 1
+
+    with open(path, 'w') as file:
+        file.write('NAME : {}\n'.format(name or 'scenario{}'.format(numberCities)))
+        file.write('TYPE : {}\n'.format('TSP' if symmetric else 'ATSP'))
+        file.write('COMMENT : missing edges cost {}\n'.format(missing))
+        file.write('DIMENSION : {}\n'.format(numberCities))
+        file.write('EDGE_WEIGHT_TYPE : EXPLICIT\nEDGE_WEIGHT_FORMAT : FULL_MATRIX\n')
+        file.write('DISPLAY_DATA_TYPE : TWOD_DISPLAY\nEDGE_WEIGHT_SECTION\n')
+        for start, stop, block in costs.rowBlocks():
+            block = np.where(np.isfinite(block), block, missing)
+            np.fill_diagonal(block[:, start:stop], 0)
+            np.savetxt(file, block, fmt='%d')
+        file.write('DISPLAY_DATA_SECTION\n')
+        for city, (x, y) in enumerate(zip(scenario.xs, scenario.ys)):
+            file.write('{} {!r} {!r}\n'.format(city + 1, float(x), float(y)))
+        file.write('EOF\n')
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Runs the solvers without the GUI (and without importing Qt). Scenarios are built the same way as in
+Proj5GUI.py from their size, seed and difficulty. Every run prints one line of JSON with the results dict.
+
+    python TSPRunner.py --size 15 --seed 20 --difficulty Hard --algorithm branchAndBound --time 60
+    python TSPRunner.py --size 20 --seed 1 2 3 --algorithm greedy localSearch
+    python TSPRunner.py --size 20 --algorithm branchAndBound --option strategy=best --option bound=assignment
+    python TSPRunner.py --size 100000 --difficulty Normal --algorithm greedy --storage tiled
+    python TSPRunner.py --scenario att48.tsp saved.npz --algorithm greedy localSearch
+    python TSPRunner.py --size 30 --algorithm branchAndBound --anytime    # a line for every better tour
+"""
+import argparse
+import contextlib
+import json
+import math
+import sys
+
+import numpy as np
+
+from TSPClasses import DIFFICULTIES, Scenario, TSPSolution, generatePoints
+from TSPLIB import readTsplib
+from TSPSolver import TSPSolver
+
+
+def buildScenario(size, seed, difficulty, rng=None, storage=None):
+    """
+    :param rng: numpy Generator for the scenario (see Scenario), seeded with seed by default
+    :param storage: how the scenario keeps its costs (see Scenario), picked from the size by default
+    :return: the Scenario the GUI generates for this size, seed and difficulty
+    """
+    return Scenario(city_locations=generatePoints(size, seed), difficulty=difficulty, rand_seed=seed, rng=rng,
+                    storage=storage)
+
+
+def loadScenario(path, storage=None):
+    """
+    :param path: a TSPLIB .tsp / .atsp file, or a scenario written by Scenario.save
+    """
+    if path.lower().endswith(('.tsp', '.atsp')):
+        return readTsplib(path)
+    return Scenario.load(path, storage=storage)
+
+
+def runSolver(scenario, algorithm, time_allowance=60.0, **options):
+    """
+    :param algorithm: name of a TSPSolver method, e.g. 'greedy' or 'branchAndBound'
+    :param options: extra arguments for that method
+    :return: the results dict of the solver
+    """
+    solver = TSPSolver(None)
+    solver.setupWithScenario(scenario)
+    if not callable(getattr(solver, algorithm, None)):
+        raise ValueError('Unknown algorithm: {}'.format(algorithm))
+    # stdout only gets the JSON lines, whatever the solvers print goes to stderr
+    with contextlib.redirect_stdout(sys.stderr):
+        return getattr(solver, algorithm)(time_allowance=time_allowance, **options)
+
+
+def runAnytime(scenario, algorithm, time_allowance=60.0, **options):
+    """
+    :param algorithm: one of TSPSolver.ANYTIME_ALGORITHMS
+    :return: generator of the results dict of every better solution (see TSPSolver.anytime) with 'final'
+             False, then of the final results dict with 'final' True
+    """
+    solver = TSPSolver(None)
+    solver.setupWithScenario(scenario)
+    improvements = solver.anytime(algorithm, time_allowance, **options)
+    while True:
+        # Only what the solver prints goes to stderr, not what the caller prints between improvements
+        with contextlib.redirect_stdout(sys.stderr):
+            try:
+                results = dict(next(improvements), final=False)
+            except StopIteration as stop:
+                results = dict(stop.value, final=True)
+        yield results
+        if results['final']:
+            return
+
+
+def jsonValue(value):
+    """
+    Makes a result value JSON friendly: routes become city indices, infinity becomes None.
+    """
+    if isinstance(value, TSPSolution):
+        return [city.index for city in value.route]
+    if isinstance(value, dict):
+        return {key: jsonValue(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [jsonValue(item) for item in value]
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and math.isinf(value):
+        return None
+    return value
+
+
+def parseOption(text):
+    """
+    :param text: key=value, the value is read as JSON when it can be (numbers, true, null...)
+    """
+    key, separator, value = text.partition('=')
+    if not separator:
+        raise argparse.ArgumentTypeError('Options are key=value, got {}'.format(text))
+    try:
+        return key, json.loads(value)
+    except ValueError:
+        return key, value
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Solve TSP scenarios without the GUI, results as JSON lines.')
+    parser.add_argument('--size', type=int, nargs='+', default=[15], help='number of cities')
+    parser.add_argument('--seed', type=int, nargs='+', default=[20], help='random seed')
+    parser.add_argument('--difficulty', nargs='+', default=['Hard (Deterministic)'], choices=DIFFICULTIES)
+    parser.add_argument('--algorithm', nargs='+', default=['branchAndBound'], help='TSPSolver method')
+    parser.add_argument('--time', type=float, default=60.0, help='time allowance in seconds')
+    parser.add_argument('--scenario', nargs='+', default=[],
+                        help='TSPLIB or saved scenario files to solve instead of generated scenarios')
+    parser.add_argument('--storage', choices=Scenario.STORAGES, help='how scenarios keep their costs')
+    parser.add_argument('--anytime', action='store_true',
+                        help="also print a line for every better solution found, with 'final' false")
+    parser.add_argument('--option', type=parseOption, action='append', default=[],
+                        help="key=value passed to every solver run, can be repeated")
+    args = parser.parse_args(argv)
+
+    options = dict(args.option)
+    if args.scenario:
+        runs = (({'scenario': path}, loadScenario(path, args.storage)) for path in args.scenario)
+    else:
+        runs = (({'size': size, 'seed': seed, 'difficulty': difficulty},
+                 buildScenario(size, seed, difficulty, storage=args.storage))
+                for size in args.size for seed in args.seed for difficulty in args.difficulty)
+    for description, scenario in runs:
+        for algorithm in args.algorithm:
+            if args.anytime:
+                lines = runAnytime(scenario, algorithm, args.time, **options)
+            else:
+                lines = [runSolver(scenario, algorithm, args.time, **options)]
+            for results in lines:
+                line = dict(description, algorithm=algorithm)
+                line.update(jsonValue(results))
+                print(json.dumps(line), flush=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
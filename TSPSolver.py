@@ -1,21 +1,23 @@
 #!/usr/bin/python3
 import heapq
-from which_pyqt import PYQT_VER
-
-if PYQT_VER == 'PYQT5':
-    from PyQt5.QtCore import QLineF, QPointF
-else:
-    raise Exception('Unsupported Version of PyQt: {}'.format(PYQT_VER))
-
 import time
 import numpy as np
 from TSPClasses import *
 from Node import *
+from BranchAndBound import BranchAndBoundSearch
+from SearchProfile import SearchProfile
+from ParallelBranchAndBound import ParallelBranchAndBound
+from HeldKarp import heldKarpTour, heldKarpTableBytes
+from Greedy import candidateTour, greedyBlocks
+from LocalSearch import improveTour, improvingMoves
 import heapq
 import itertools
 
 
 class TSPSolver:
+    # Above this many cities greedy and local search only look at the candidate lists of the scenario
+    CANDIDATE_CITIES = 2000
+
     def __init__(self, gui_view):
         self.scenario = None
 
@@ -64,199 +66,345 @@ class TSPSolver:
         return results
 
     ''' <summary>
-		This is the entry point for the greedy solver, which you must implement for
-		the group project (but it is probably a good idea to just do it for the branch-and
-		bound project as a way to get your feet wet).  Note this could be used to find your
-		initial BSSF.
+		This is the entry point for the greedy solver: nearest neighbor from every start city
+		(or evenly spread ones, see Greedy.ALL_STARTS_WORK), keeping the cheapest tour.  Note this
+		could be used to find your initial BSSF.
 		</summary>
 		<returns>results dictionary for GUI that contains three ints: cost of best solution,
-		time spent to find best solution, total number of solutions found, the best
+		time spent to find best solution, number of start cities that found a tour, the best
 		solution found, and three null values for fields not used for this
 		algorithm</returns>
 	'''
     def greedy(self, time_allowance = 60.0):
-        results = {}
+        return self.finish(self.greedyImprovements(time_allowance))
+
+    def greedyImprovements(self, time_allowance=60.0, progress_interval=None):
+        """
+        greedy as an anytime generator (see anytime), with progress_interval the results are also reported after
+        the first block of starts that ends at least that many seconds after the last report.
+        """
         cities = self.scenario.getCities()
-        numberCities = len(cities)
-        foundTour = False  # There is a path from a start city to that same start city (tour)
-        bssf = None
         start_time = time.time()
 
-        startCityIndex = 0
-        allCitiesHaveBeenAStart = startCityIndex == numberCities  # Used to check if I should keep traversing cities
+        if len(cities) > self.CANDIDATE_CITIES:
+            blocks = [self.candidateGreedy(start_time + time_allowance)]
+        else:
+            # Every city (evenly spread ones for bigger scenarios) is tried as the start (see Greedy.py), the
+            # cheapest tour is kept
+            costMatrix = self.convertCitiesIntoStartMatrix(cities, len(cities))
+            blocks = greedyBlocks(costMatrix, deadline=start_time + time_allowance)
+
+        bssf, successes = None, 0
+        nextProgress = start_time + progress_interval if progress_interval is not None else math.inf
+        for cost, route, successes in blocks:
+            improved = cost < (bssf.cost if bssf else math.inf)
+            if improved:
+                bssf = TSPSolution([cities[i] for i in route])
+            if improved or time.time() >= nextProgress:
+                if progress_interval is not None:
+                    nextProgress = time.time() + progress_interval
+                yield self.solutionResults(start_time, bssf, successes)
+        return self.solutionResults(start_time, bssf, successes)
+
+    def candidateGreedy(self, deadline):
+        """
+        Greedy for big scenarios: nearest neighbor over the candidate lists, from city 0, 1, 2... until one
+        start finds a tour or the deadline passes.
+        :return: (cost, route as city indices, 1 if a tour was found else 0)
+        """
+        costMatrix = self.scenario.getCosts()
+        candidates = self.scenario.candidateLists()
+        index = self.scenario.getSpatialIndex()
+        for start in range(len(candidates)):
+            if time.time() >= deadline:
+                break
+            cost, route = candidateTour(costMatrix, candidates, index, start)
+            if route is not None:
+                return cost, route, 1
+        return math.inf, None, 0
 
-        while not foundTour and time.time() - start_time < time_allowance:
-            if not allCitiesHaveBeenAStart:
-                bssf, foundTour = self.findTourGreedy(cities[startCityIndex], cities, numberCities)
-                self.setCitiesToUnvisited(cities)
-                if foundTour:
-                    break
-                else:
-                    startCityIndex += 1
-                    allCitiesHaveBeenAStart = startCityIndex == numberCities
+    ''' <summary>
+		Local search (2-opt and Or-opt moves, see LocalSearch.py) that improves a tour until no
+		move makes it cheaper or the time runs out. It starts from solution, or from the greedy
+		tour (a random one if greedy finds none) when no solution is given. Above CANDIDATE_CITIES
+		cities only moves that add an edge to a candidate list are tried.
+		</summary>
+		<returns>results dictionary for GUI that contains three ints: cost of the improved solution,
+		time spent to find it, number of improving moves applied, the improved solution (None, at an
+		infinite cost, if no tour to start from was found), and three null values for fields not
+		used for this algorithm</returns>
+	'''
+    def localSearch(self, time_allowance=60.0, solution=None):
+        cities = self.scenario.getCities()
+        start_time = time.time()
 
-            else:  # Every city was a start point and no route was found
-                break  # ... out of the loop and finish
+        # Same as localSearchImprovements, without a TSPSolution for every move
+        solution, costMatrix, candidates = self.localSearchStart(time_allowance, solution)
+        if solution is None:
+            return self.solutionResults(start_time, None, 0)
+        cost, route, moves = improveTour(costMatrix, [city.index for city in solution.route],
+                                         deadline=start_time + time_allowance, candidates=candidates)
+        return self.solutionResults(start_time, TSPSolution([cities[i] for i in route]), moves)
 
-        end_time = time.time()
+    def localSearchImprovements(self, time_allowance=60.0, solution=None, progress_interval=None):
+        """
+        localSearch as an anytime generator (see anytime), the tour it starts from comes first.
+        """
+        cities = self.scenario.getCities()
+        start_time = time.time()
 
-        results['cost'] = bssf.cost if foundTour else math.inf
-        results['time'] = end_time - start_time
-        results['count'] = 1 if foundTour else 0
-        results['soln'] = bssf
-        results['max'] = None
-        results['total'] = None
-        results['pruned'] = None
+        solution, costMatrix, candidates = self.localSearchStart(time_allowance, solution)
+        if solution is None:
+            return self.solutionResults(start_time, None, 0)
+        bssf, moves = solution, 0
+        if bssf.cost < math.inf:
+            yield self.solutionResults(start_time, bssf, moves)
+        lastMoves = 0
+        for cost, route, moves in improvingMoves(costMatrix, [city.index for city in solution.route],
+                                                 deadline=start_time + time_allowance, candidates=candidates,
+                                                 progressInterval=progress_interval):
+            if moves > lastMoves:
+                bssf, lastMoves = TSPSolution([cities[i] for i in route]), moves
+            yield self.solutionResults(start_time, bssf, moves)
+        return self.solutionResults(start_time, bssf, moves)
+
+    def localSearchStart(self, time_allowance, solution):
+        """
+        :return: the tour local search starts from (solution, the greedy one or a random one, None if there was
+                 no time to find any), the costs and the candidate lists it uses (None to try every move)
+        """
+        cities = self.scenario.getCities()
+        if solution is None:
+            solution = self.greedy(time_allowance)['soln'] or self.defaultRandomTour(time_allowance)['soln']
+        if len(cities) > self.CANDIDATE_CITIES:
+            return solution, self.scenario.getCosts(), self.scenario.candidateLists()
+        return solution, self.convertCitiesIntoStartMatrix(cities, len(cities)), None
 
-        return results
+    ANYTIME_ALGORITHMS = ('greedy', 'localSearch', 'branchAndBound')
 
-    def findTourGreedy(self, startCity, cities, numberCities):
+    def anytime(self, algorithm='branchAndBound', time_allowance=60.0, **options):
         """
-        Used by greedy algorithm.
-        Tries to traverse through all the cities, starting and ending in the startCity.
-        :param startCity: the city that will be origin and the end
-        :param cities: all the cities to visit
-        :param numberCities: total number of cities, 1 based.
-        :return:    bssf -> TSPSolution, includes the route and the cost using ._costOfRoute()
-                    thereIsTour: bool, true if there is a route, false otherwise
+        Runs algorithm (with the options it takes) as a generator that yields a results dictionary every time
+        a better solution is found: the solution, its cost, 'time' since the start and the counters of the
+        algorithm at that moment. Stopping the iteration (or closing the generator) stops the solver. The
+        generator returns the final results dictionary, the one the algorithm itself returns.
+        With progress_interval (seconds) in the options, the current results are also yielded about that
+        often while no better solution turns up, so the counters can be followed live (and the generator
+        closed) during long searches; those reports keep the cost of the last improvement.
+
+            for results in solver.anytime('branchAndBound', 60):
+                if results['time'] > 5:
+                    break
         """
-        thereIsTour = False
-        route = [startCity]
-        currentCity = startCity
-        currentCity.setVisited(True)
-
-        for i in range(numberCities-1):
-            nextCity = self.findShortestPathFrom(currentCity, cities, numberCities)
-            if nextCity is None:
-                return None, thereIsTour
-            currentCity = nextCity
-            currentCity.setVisited(True)
-            route.append(currentCity)
-
-        # After going through every city, and getting to the last one, check if that last one can go back to start city
-        if currentCity.costTo(startCity) != np.inf:
-            thereIsTour = True
-        else:  # the last city in route[] does not go connect to startCity, therefore there is no route
-            return None, thereIsTour
-
-        bssf = TSPSolution(route)
-
-        return bssf, thereIsTour
-
-    def setCitiesToUnvisited(self, cities):
+        if algorithm not in self.ANYTIME_ALGORITHMS:
+            raise ValueError('No anytime version of {}, expected one of {}'.format(
+                algorithm, ', '.join(self.ANYTIME_ALGORITHMS)))
+        return getattr(self, algorithm + 'Improvements')(time_allowance, **options)
+
+    @staticmethod
+    def finish(improvements):
         """
-        Set all the cities in an array to unvisited.
+        Runs an anytime generator to the end.
+        :return: the final results dictionary it returns
         """
-        for city in cities:
-            city.setVisited(False)
-
-
+        while True:
+            try:
+                next(improvements)
+            except StopIteration as stop:
+                return stop.value
 
-    def findShortestPathFrom(self, originCity, cities, numberCities):
+    def solutionResults(self, start_time, bssf, count, maxQueue=None, total=None, pruned=None):
         """
-        Goes through each edge coming from originCity and returns the city with the minimum cost edge.
-        :param numberCities: cities length
-        :param cities: array of cities
-        :param originCity: city where the edge will be going to another city.
-        :return: the city with the lowest edge cost
+        :return: results dictionary for the GUI for solution bssf (None if there is none) at this time
         """
-        lowestCity = None  # Update as I go through each city
-        lowestCost = np.inf
+        return {'cost': bssf.cost if bssf else math.inf, 'time': time.time() - start_time, 'count': count,
+                'soln': bssf, 'max': maxQueue, 'total': total, 'pruned': pruned}
 
-        for i in range(numberCities):
-            destinationCity = cities[i]
-            if destinationCity.hasBeenVisited():
-                continue
-            costToDestinationCity = originCity.costTo(destinationCity)
-            if costToDestinationCity < lowestCost:
-                lowestCost = costToDestinationCity
-                lowestCity = destinationCity
+    INITIAL_BSSF_PROVIDERS = ('greedy', 'localSearch')
 
-        return lowestCity
+    def findInitialBssf(self, provider, time_allowance):
+        """
+        :param provider: 'greedy' or 'localSearch' (greedy tour improved with local search)
+        :param time_allowance: seconds the provider can run
+        :return: the TSPSolution branch and bound starts with, None if no tour was found
+        """
+        if provider not in self.INITIAL_BSSF_PROVIDERS:
+            raise ValueError('Unknown initial BSSF provider: {}'.format(provider))
+        if provider == 'localSearch':
+            bssf = self.localSearch(time_allowance)['soln']
+            return bssf if bssf is not None and bssf.cost < np.inf else None
+        return self.greedy(time_allowance)['soln']
 
     ''' <summary>
 		This is the entry point for the branch-and-bound algorithm that you will implement
+		With batchExpansion, all the children of a state are reduced together and the ones
+		that can not beat the BSSF are pruned before a Node is created for them. On big
+		scenarios only the rows and columns a child changes are reduced again (see
+		Node.expandIncremental).
+		strategy picks the order states are taken off the queue: 'best', 'depth' (default),
+		'dive' or 'beam' (see SearchStrategies.py), strategyOptions go to its constructor.
+		queueLimit (states) and/or queueBytesLimit (bytes) bound the queue, once it is full
+		onQueueFull='dfs' searches the best subtree depth first and onQueueFull='spill'
+		writes the worst states to disk (see BranchAndBound.py).
+		bound picks the lower bound: 'reduction' (reduced cost matrices, default) or
+		'assignment' (assignment problem, tighter on asymmetric scenarios, see Bounds.py).
+		initialBssf picks where the first BSSF comes from: 'greedy' (default) or 'localSearch'.
+		profile=True adds 'profile' to the results: time per phase, bound evaluations, states
+		pruned for each reason and a timeline of queue size and BSSF (see SearchProfile.py),
+		ready for json.dumps. It is off by default, the search then does not time anything.
+		transpositionSize is how many (visited cities, last city) pairs are remembered to prune
+		paths that are dominated by a cheaper path to the same pair (0 turns it off, see
+		TranspositionTable.py).
 		</summary>
 		<returns>results dictionary for GUI that contains three ints: cost of best solution,
 		time spent to find best solution, total number solutions found during search (does
 		not include the initial BSSF), the best solution found, and three more ints:
-		max queue size, total number of states created, and number of pruned states.</returns>
+		max queue size, total number of states created, and number of pruned states. The
+		states pruned as dominated are counted apart, in 'dominated'.</returns>
 	'''
-    def branchAndBound(self, time_allowance = 60.0):
-        Node.resetCount()
-        results = {}
+    def branchAndBound(self, time_allowance = 60.0, batchExpansion=True, strategy='depth', queueLimit=None,
+                       queueBytesLimit=None, onQueueFull='dfs', bound='reduction', initialBssf='greedy',
+                       profile=False, **strategyOptions):
+        return self.finish(self.branchAndBoundImprovements(
+            time_allowance, batchExpansion=batchExpansion, strategy=strategy, queueLimit=queueLimit,
+            queueBytesLimit=queueBytesLimit, onQueueFull=onQueueFull, bound=bound, initialBssf=initialBssf,
+            profile=profile, **strategyOptions))
+
+    def branchAndBoundImprovements(self, time_allowance=60.0, batchExpansion=True, strategy='depth',
+                                   queueLimit=None, queueBytesLimit=None, onQueueFull='dfs', bound='reduction',
+                                   initialBssf='greedy', progress_interval=None, profile=False,
+                                   **strategyOptions):
+        """
+        branchAndBound as an anytime generator (see anytime), the initial BSSF comes first.
+        """
         cities = self.scenario.getCities()
         numberCities = len(cities)
-        bssf = None
         start_time = time.time()
-        maxPriorityQueueSize = 0
-        # childrenCount = 0
-        prunedCount = 0
-        solutionsCount = 0
-        bssfToTestPathToOrigin = None
 
         #  Creating the first matrix
         rootMatrix = self.convertCitiesIntoStartMatrix(cities, numberCities)
 
-        #  Creating first node and pushing it into the PQ
-        root = Node(rootMatrix.copy(), 0, [], cities[0], cities, 0, 0)
-        priorityQueue = []
-        heapq.heappush(priorityQueue, root)
-
-        #  Initializing bssf from greedy algorithm
-        greedyResults = self.greedy()
-        bssf = greedyResults['soln']
-
-        while priorityQueue and time.time() - start_time < time_allowance:
-            # print("{:.1f}".format(time.time() - start_time))
-            maxPriorityQueueSize = max(len(priorityQueue), maxPriorityQueueSize)
-            poppedNode = heapq.heappop(priorityQueue)
-            if poppedNode.lowerBound < bssf.cost:
-                children = poppedNode.expandTree()
-                for node in children:
-                    print(bssf.cost)
-                    test = node.test()
-                    if test != np.inf:
-                        bssfToTestPathToOrigin = TSPSolution(node.pathVisited)
-                        if bssfToTestPathToOrigin.cost < bssf.cost:
-                            solutionsCount += 1
-                            bssf = bssfToTestPathToOrigin
-                    elif node.lowerBound < bssf.cost:
-                        heapq.heappush(priorityQueue, node)
-                    else:
-                        prunedCount += 1
-            else:
-                prunedCount += 1
+        #  Initializing bssf from greedy algorithm (or local search)
+        bssf = self.findInitialBssf(initialBssf, time_allowance)
+        if bssf:
+            yield self.solutionResults(start_time, bssf, 0, 0, 0, 0)
+
+        search = BranchAndBoundSearch(rootMatrix, bssfCost=bssf.cost if bssf else math.inf,
+                                      batchExpansion=batchExpansion, strategy=strategy, queueLimit=queueLimit,
+                                      queueBytesLimit=queueBytesLimit, onQueueFull=onQueueFull, bound=bound,
+                                      profile=SearchProfile() if profile else None, **strategyOptions)
+        solutions = 0
+        for _ in search.improvements(start_time, time_allowance, progress_interval):
+            if search.solutionsCount > solutions:
+                bssf, solutions = TSPSolution([cities[i] for i in search.bssfPath]), search.solutionsCount
+            yield self.solutionResults(start_time, bssf, search.solutionsCount, search.maxPriorityQueueSize,
+                                       Node.nodesCreated, search.prunedCount)
+
+        results = self.solutionResults(start_time, bssf, search.solutionsCount, search.maxPriorityQueueSize,
+                                       Node.nodesCreated, search.prunedCount)
+        results['dominated'] = search.dominatedCount
+        results['strategy'] = search.strategy.name
+        results['bound'] = search.bound.name
+        # Estimated memory of one queued state, taken from the deepest state on the queue (or the root)
+        deepestNode = max(search.remainingNodes(), key=lambda node: node.level, default=search.root)
+        results['bytes_per_state'] = deepestNode.memoryFootprint()
+        if queueLimit is not None or queueBytesLimit is not None:
+            results['queue_limit'] = search.queueLimit
+            results['dives'] = search.divesCount
+            results['spilled'] = search.spillStore.spilledCount if search.spillStore else 0
+        if search.profile is not None:
+            results['profile'] = search.profile.results()
+        return results
+
+
+    ''' <summary>
+		Branch-and-bound on several processes (all the cores unless workers is given).
+		The workers share the BSSF cost and steal work from each other, see
+		ParallelBranchAndBound.py. initialBssf and options are the same as for branchAndBound,
+		except the queue limits (queueLimit, queueBytesLimit and onQueueFull raise a ValueError).
+		</summary>
+		<returns>results dictionary for GUI, same fields as branchAndBound. The counters (and
+		the profile, with profile=True) are added up over every process.</returns>
+	'''
+    def parallelBranchAndBound(self, time_allowance=60.0, workers=None, initialBssf='greedy', **options):
+        results = {}
+        cities = self.scenario.getCities()
+        start_time = time.time()
+
+        #  Initializing bssf from greedy algorithm (or local search)
+        bssf = self.findInitialBssf(initialBssf, time_allowance)
+
+        rootMatrix = self.convertCitiesIntoStartMatrix(cities, len(cities))
+        search = ParallelBranchAndBound(rootMatrix, bssfCost=bssf.cost if bssf else math.inf, workers=workers,
+                                        **options)
+        search.run(start_time, time_allowance)
+        if search.search.bssfPath is not None:
+            bssf = TSPSolution([cities[i] for i in search.search.bssfPath])
 
         end_time = time.time()
-        print(bssf.cost)
-        results['cost'] = bssf.cost
+        results['cost'] = bssf.cost if bssf else math.inf
         results['time'] = end_time - start_time
-        results['count'] = solutionsCount
         results['soln'] = bssf
-        results['max'] = maxPriorityQueueSize
-        results['total'] = Node.nodesCreated
-        results['pruned'] = prunedCount
+        results.update(search.results())
+        results['bound'] = search.search.bound.name
+        results['workers'] = search.workers
+        if search.profile is not None:
+            results['profile'] = search.profile.results()
         return results
 
+    ''' <summary>
+		Exact solver using the Held-Karp dynamic program over subsets of cities (see HeldKarp.py).
+		Its table doubles with every city, so when it would need more than memory_budget bytes
+		(about 20 cities for the default) it falls back to branchAndBound.
+		</summary>
+		<returns>results dictionary for GUI that contains three ints: cost of the optimal solution,
+		time spent to find it, 1 if a solution was found (0 otherwise), the solution found, and
+		three null values for fields not used for this algorithm. 'fallback' names the algorithm
+		that was used instead, if any, in the time that was left; the count is then its own.</returns>
+	'''
+    HELD_KARP_MEMORY_BUDGET = 256 * 1024 * 1024
+
+    def heldKarp(self, time_allowance=60.0, memory_budget=HELD_KARP_MEMORY_BUDGET):
+        cities = self.scenario.getCities()
+        start_time = time.time()
+
+        if heldKarpTableBytes(len(cities)) > memory_budget:
+            results = self.branchAndBound(start_time + time_allowance - time.time())
+            results['fallback'] = 'branchAndBound'
+            return results
+
+        results = {}
+        bssf = None
+        count = 0
+        found = heldKarpTour(self.scenario.getCostMatrix(), deadline=start_time + time_allowance)
+        if found is None:
+            # Out of time before the table was complete, keep a greedy route found in the time left
+            greedyResults = self.greedy(start_time + time_allowance - time.time())
+            bssf, count = greedyResults['soln'], greedyResults['count']
+            results['fallback'] = 'greedy'
+        elif found[1] is not None:
+            bssf, count = TSPSolution([cities[i] for i in found[1]]), 1
+
+        end_time = time.time()
+        results['cost'] = bssf.cost if bssf else math.inf
+        results['time'] = end_time - start_time
+        results['count'] = count
+        results['soln'] = bssf
+        results['max'] = None
+        results['total'] = None
+        results['pruned'] = None
+        return results
 
     def convertCitiesIntoStartMatrix(self, cities, length):
         """
         Creates a 2d array or matrix from the data of a list cities
         :param cities: source data
         :param length: number of rows or columns the matrix will have
-        :return: the created matrix (it has not been reduced yet)
+        :return: the created matrix as a numpy array (it has not been reduced yet)
         """
-        # Initialize matrix with inf
-        matrix = [[np.inf for _ in range(length)] for _ in range(length)]
-
-        # Populate, go through each cell in the matrix
-        for row in range(length):
-            originCity = cities[row]
-            for col in range(length):
-                destinationCity = cities[col]
-                # Distance from row to col
-                matrix[row][col] = originCity.costTo(destinationCity)
+        # Cell [row][col] is the distance from row to col, already computed by the scenario
+        indices = [city.index for city in cities[:length]]
+        matrix = self.scenario.getCostMatrix()[np.ix_(indices, indices)]
 
         return matrix
 
@@ -0,0 +1,43 @@
+from collections import OrderedDict
+
+
+class TranspositionTable:
+    """
+    Cheapest known cost of reaching each (visited cities, last city) pair, for dominance pruning: two partial
+    paths that visited the same cities and end at the same city have the same completions, so the one that
+    got there at a higher cost can never lead to a better route. At most `size` pairs are kept, the least
+    recently used pair is forgotten first; forgetting a pair only means less pruning, never a wrong one.
+    """
+
+    def __init__(self, size):
+        """
+        :param size: number of pairs kept
+        """
+        self.size: int = size
+        self.costs: OrderedDict = OrderedDict()  # (visited mask, last city) -> cost of the path
+
+    def offer(self, visitedMask, lastCity, cost) -> bool:
+        """
+        Records a path that was just generated.
+        :return: False if the pair was already reached at a cost no higher than cost (the path is dominated)
+        """
+        key = (visitedMask, lastCity)
+        best = self.costs.get(key)
+        if best is not None:
+            self.costs.move_to_end(key)
+            if best <= cost:
+                return False
+        self.costs[key] = cost
+        if len(self.costs) > self.size:
+            self.costs.popitem(last=False)
+        return True
+
+    def beaten(self, visitedMask, lastCity, cost) -> bool:
+        """
+        :return: True if the pair was reached at a lower cost than cost since a path of that cost was offered
+        """
+        best = self.costs.get((visitedMask, lastCity))
+        return best is not None and best < cost
+
+    def __len__(self):
+        return len(self.costs)
@@ -0,0 +1,167 @@
+import itertools
+import math
+import time
+from unittest import TestCase
+
+import numpy as np
+
+from BranchAndBound import BranchAndBoundSearch
+from Bounds import AssignmentBound, ReductionBound
+from Node import Node
+from ParallelBranchAndBound import ParallelBranchAndBound
+from SpillStore import SpillStore
+from TranspositionTable import TranspositionTable
+
+
+def randomCostMatrix(size, seed, missingFraction=0.2):
+    rng = np.random.default_rng(seed)
+    matrix = rng.integers(100, 5000, (size, size)).astype(float)
+    matrix[rng.random((size, size)) < missingFraction] = np.inf
+    np.fill_diagonal(matrix, np.inf)
+    return matrix
+
+
+def bruteForceCost(matrix):
+    best = math.inf
+    for perm in itertools.permutations(range(1, len(matrix))):
+        route = (0,) + perm
+        best = min(best, sum(matrix[route[i], route[(i + 1) % len(route)]] for i in range(len(route))))
+    return best
+
+
+class TestBranchAndBoundSearch(TestCase):
+    def runSearch(self, matrix, **options):
+        search = BranchAndBoundSearch(matrix, **options)
+        search.run(time.time(), 60)
+        return search
+
+    def test_finds_optimal_route(self):
+        for seed in range(3):
+            matrix = randomCostMatrix(7, seed)
+            expected = bruteForceCost(matrix)
+            for options in [{}, {'batchExpansion': False}, {'strategy': 'best'}, {'strategy': 'dive'},
+                            {'bound': 'assignment'}, {'bound': 'assignment', 'strategy': 'best'},
+                            {'transpositionSize': 0}, {'transpositionSize': 4}]:
+                search = self.runSearch(matrix, **options)
+                self.assertEqual(expected, search.bssfCost, options)
+                if expected < math.inf:
+                    self.assertEqual(expected, search.routeCost(search.bssfPath))
+
+    def test_incremental_bound_is_optimal(self):
+        matrix = randomCostMatrix(8, 6)
+        batch = self.runSearch(matrix, strategy='best')
+        batchCreated = Node.nodesCreated
+        cells = ReductionBound.INCREMENTAL_CELLS
+        ReductionBound.INCREMENTAL_CELLS = 0  # every state bounds its children incrementally
+        try:
+            incremental = self.runSearch(matrix, strategy='best')
+        finally:
+            ReductionBound.INCREMENTAL_CELLS = cells
+        self.assertEqual(bruteForceCost(matrix), incremental.bssfCost)
+        # Same bounds, so the same states
+        self.assertEqual(batchCreated, Node.nodesCreated)
+
+    def test_assignment_bound_is_tighter(self):
+        matrix = randomCostMatrix(9, 4, missingFraction=0.1)
+        reduction = self.runSearch(matrix, strategy='best')
+        assignment = self.runSearch(matrix, strategy='best', bound='assignment')
+        self.assertEqual(reduction.bssfCost, assignment.bssfCost)
+        self.assertGreaterEqual(assignment.root.lowerBound, reduction.root.lowerBound)
+
+    def test_incremental_assignment_matches_from_scratch(self):
+        matrix = randomCostMatrix(8, 5, missingFraction=0.1)
+        bound = AssignmentBound()
+        bound.setup(matrix)
+        stack = [bound.createRoot(matrix)]
+        while stack:
+            node = stack.pop()
+            children, _ = bound.expand(node, math.inf)
+            for child in children:
+                # The AP of a child solved again from scratch, over the rows and columns left
+                path = list(child.pathVisited)
+                rows = [city for city in range(len(matrix)) if city not in path] + [path[-1]]
+                cols = rows[:-1] + [0]
+                sub = matrix[np.ix_(rows, cols)].copy()
+                if len(rows) > 1:
+                    sub[-1, -1] = np.inf
+                pathCost = sum(matrix[path[i], path[i + 1]] for i in range(len(path) - 1))
+                best = min(sum(sub[i, perm[i]] for i in range(len(rows)))
+                           for perm in itertools.permutations(range(len(cols))))
+                self.assertEqual(pathCost + best, child.lowerBound, path)
+            stack.extend(child for child in children if child.level < 4)
+
+    def test_bounded_queue_is_still_optimal(self):
+        matrix = randomCostMatrix(8, 7)
+        expected = bruteForceCost(matrix)
+
+        search = self.runSearch(matrix, strategy='best', queueLimit=6, onQueueFull='dfs')
+        self.assertEqual(expected, search.bssfCost)
+        self.assertGreater(search.divesCount, 0)
+
+        search = self.runSearch(matrix, strategy='best', queueLimit=6, onQueueFull='spill')
+        self.assertEqual(expected, search.bssfCost)
+        self.assertGreater(search.spillStore.spilledCount, 0)
+        # The queue may only go over the limit by the children of one expansion
+        self.assertLess(search.maxPriorityQueueSize, 6 + len(matrix))
+
+        # Spilling half of a queue of one state empties it
+        search = self.runSearch(matrix, strategy='best', queueLimit=1, onQueueFull='spill')
+        self.assertEqual(expected, search.bssfCost)
+
+    def test_parallel_search_is_optimal(self):
+        matrix = randomCostMatrix(8, 3)
+        for bound in ['reduction', 'assignment']:
+            search = ParallelBranchAndBound(matrix, workers=2, bound=bound)
+            search.run(time.time(), 60)
+
+            self.assertEqual(bruteForceCost(matrix), search.search.bssfCost)
+            self.assertEqual(search.search.bssfCost, search.search.routeCost(search.search.bssfPath))
+            self.assertEqual(2, len(search.workerResults))
+            self.assertGreater(search.results()['total'], 0)
+        self.assertRaises(ValueError, ParallelBranchAndBound, matrix, queueLimit=6, onQueueFull='spill')
+
+    def test_spill_store_round_trip(self):
+        matrix = randomCostMatrix(5, 1, missingFraction=0)
+        Node.setupPool(5)
+        children = Node.createRoot(matrix).expandTree()
+        saved = [(child.lowerBound, child.level, list(child.pathVisited), child.visitedMask,
+                  child.reducedMatrix.copy()) for child in children]
+
+        store = SpillStore(5)
+        try:
+            store.spill(children)
+            self.assertEqual(0, store.discardWorseThan(math.inf))
+            restored = store.reload()
+            self.assertFalse(store.hasStates())
+        finally:
+            store.close()
+
+        for node, (lowerBound, level, path, mask, reducedMatrix) in zip(restored, saved):
+            self.assertEqual((lowerBound, level, path, mask),
+                             (node.lowerBound, node.level, list(node.pathVisited), node.visitedMask))
+            self.assertTrue((reducedMatrix == node.reducedMatrix).all())
+
+    def test_dominated_paths_are_pruned(self):
+        matrix = randomCostMatrix(9, 2, missingFraction=0)
+        plain = self.runSearch(matrix, strategy='best', transpositionSize=0)
+        plainCreated = Node.nodesCreated
+        pruned = self.runSearch(matrix, strategy='best')
+        self.assertEqual(plain.bssfCost, pruned.bssfCost)
+        self.assertEqual(0, plain.dominatedCount)
+        self.assertGreater(pruned.dominatedCount, 0)
+        self.assertLess(Node.nodesCreated, plainCreated)
+
+    def test_transposition_table(self):
+        table = TranspositionTable(2)
+        self.assertTrue(table.offer(0b11, 1, 10))
+        self.assertFalse(table.offer(0b11, 1, 10))
+        self.assertTrue(table.offer(0b11, 1, 7))
+        self.assertTrue(table.beaten(0b11, 1, 10))
+        self.assertFalse(table.beaten(0b11, 1, 7))
+        # The least recently used pair is forgotten first
+        table.offer(0b101, 2, 5)
+        table.offer(0b11, 1, 9)
+        table.offer(0b1001, 3, 5)
+        self.assertEqual(2, len(table))
+        self.assertFalse(table.offer(0b11, 1, 9))
+        self.assertTrue(table.offer(0b101, 2, 6))
@@ -0,0 +1,73 @@
+import os
+import tempfile
+from unittest import TestCase
+
+import numpy as np
+
+from TSPClasses import Scenario, generatePoints
+
+
+class TestCostMatrix(TestCase):
+    def test_storages_match_dense(self):
+        for difficulty in ['Easy', 'Normal']:
+            dense = Scenario(generatePoints(120, 6), difficulty, 6).getCostMatrix()
+            tiled = Scenario(generatePoints(120, 6), difficulty, 6, storage='tiled')
+            self.assertTrue(np.array_equal(dense, tiled.getCostMatrix()))
+            with tempfile.TemporaryDirectory() as directory:
+                memmap = Scenario(generatePoints(120, 6), difficulty, 6, storage='memmap',
+                                  storage_path=os.path.join(directory, 'costs.int32'))
+                self.assertTrue(np.array_equal(dense, memmap.getCostMatrix()))
+                del memmap
+
+    def test_indexing(self):
+        scenario = Scenario(generatePoints(50, 2), 'Hard (Deterministic)', 2, storage='tiled')
+        costs, matrix = scenario.getCosts(), scenario.getCostMatrix()
+        rows, cols = np.array([[0, 4], [9, 9]]), np.array([3, 9])
+        self.assertEqual(matrix[3, 7], costs[3, 7])
+        self.assertTrue(np.array_equal(matrix[rows, cols], costs[rows, cols]))
+        self.assertTrue(np.array_equal(matrix[[1, 2]], costs[[1, 2]]))
+        self.assertTrue(np.array_equal(matrix[5, :], costs[5, :]))
+        self.assertTrue(np.array_equal(matrix[:, cols], costs[:, cols]))
+        self.assertTrue(np.array_equal(matrix[5:9, 2:40:3], costs[5:9, 2:40:3]))
+        self.assertEqual(scenario.getCities()[3].costTo(scenario.getCities()[7]), matrix[3, 7])
+
+    def test_hashed_edges(self):
+        tiled = Scenario(generatePoints(300, 8), 'Hard (Deterministic)', 8, storage='tiled')
+        matrix = tiled.getCostMatrix()
+        missing = np.isinf(matrix).sum() - 300
+        self.assertAlmostEqual(0.2, missing / (300 * 299), delta=0.01)
+        # The kept tour is drawn first from the scenario generator, after the elevations
+        rng = np.random.default_rng(8)
+        rng.random(300)
+        route = rng.permutation(300)
+        self.assertTrue(np.isfinite(matrix[route, np.roll(route, -1)]).all())
+
+        again = Scenario(generatePoints(300, 8), 'Hard (Deterministic)', 8, storage='tiled')
+        self.assertTrue(np.array_equal(matrix, again.getCostMatrix()))
+
+    def test_memmap_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'costs.int32')
+            scenario = Scenario(generatePoints(40, 1), 'Hard (Deterministic)', 1, storage='memmap',
+                                storage_path=path)
+            self.assertEqual(40 * 40 * 4, os.path.getsize(path))
+            tiled = Scenario(generatePoints(40, 1), 'Hard (Deterministic)', 1, storage='tiled')
+            self.assertTrue(np.array_equal(tiled.getCostMatrix(), scenario.getCostMatrix()))
+            del scenario
+
+    def test_memmap_temporary_file(self):
+        scenario = Scenario(generatePoints(40, 1), 'Hard (Deterministic)', 1, storage='memmap')
+        self.assertFalse(os.path.exists(scenario.costs.matrix.filename))
+        tiled = Scenario(generatePoints(40, 1), 'Hard (Deterministic)', 1, storage='tiled')
+        self.assertTrue(np.array_equal(tiled.getCostMatrix(), scenario.getCostMatrix()))
+
+    def test_large_scenarios_are_tiled(self):
+        largeCities = Scenario.LARGE_CITIES
+        Scenario.LARGE_CITIES = 30
+        try:
+            scenario = Scenario(generatePoints(40, 1), 'Normal', 1)
+        finally:
+            Scenario.LARGE_CITIES = largeCities
+        self.assertEqual('tiled', scenario.storage)
+        self.assertIsNone(scenario.cost_matrix)
+        self.assertRaises(ValueError, Scenario, generatePoints(5, 1), 'Normal', 1, storage='sparse')
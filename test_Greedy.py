@@ -0,0 +1,73 @@
+import math
+from unittest import TestCase
+
+import numpy as np
+
+import Greedy
+from Greedy import candidateTour, greedyTours
+from TSPClasses import Scenario, generatePoints
+from test_BranchAndBound import randomCostMatrix
+
+
+def nearestNeighborCost(matrix, start):
+    route = [start]
+    while len(route) < len(matrix):
+        costs = [math.inf if city in route else matrix[route[-1], city] for city in range(len(matrix))]
+        if min(costs) == math.inf:
+            return math.inf
+        route.append(int(np.argmin(costs)))
+    return sum(matrix[route[i], route[(i + 1) % len(route)]] for i in range(len(route)))
+
+
+class TestGreedy(TestCase):
+    def test_best_of_all_starts(self):
+        for seed in range(5):
+            matrix = randomCostMatrix(12, seed, missingFraction=0.3)
+            costs = [nearestNeighborCost(matrix, start) for start in range(12)]
+            cost, route, successes = greedyTours(matrix)
+
+            self.assertEqual(min(costs), cost)
+            self.assertEqual(sum(cost < math.inf for cost in costs), successes)
+            if route is not None:
+                self.assertEqual(list(range(12)), sorted(route))
+                self.assertEqual(cost, sum(matrix[route[i], route[(i + 1) % 12]] for i in range(12)))
+
+    def test_blocks_of_starts(self):
+        matrix = randomCostMatrix(12, 3, missingFraction=0.1)
+        expected = greedyTours(matrix)
+        blockCells = Greedy.BLOCK_CELLS
+        Greedy.BLOCK_CELLS = 12 * 5
+        try:
+            self.assertEqual(expected, greedyTours(matrix))
+        finally:
+            Greedy.BLOCK_CELLS = blockCells
+
+    def test_spread_starts(self):
+        matrix = randomCostMatrix(12, 3, missingFraction=0)
+        allStartsWork = Greedy.ALL_STARTS_WORK
+        Greedy.ALL_STARTS_WORK = 4 * 12 * 12
+        try:
+            # Only 4 starts fit in the work, 0, 3, 6 and 9 are tried
+            self.assertEqual(greedyTours(matrix, starts=[0, 3, 6, 9]), greedyTours(matrix))
+        finally:
+            Greedy.ALL_STARTS_WORK = allStartsWork
+
+    def test_no_route(self):
+        matrix = randomCostMatrix(6, 0, missingFraction=0)
+        matrix[:, 2] = np.inf
+        self.assertEqual((math.inf, None, 0), greedyTours(matrix))
+
+    def test_candidate_tour(self):
+        scenario = Scenario(generatePoints(300, 2), 'Hard (Deterministic)', 2)
+        matrix = scenario.getCostMatrix()
+        # Short candidate lists run out often, so the grid search is used too
+        candidates = scenario.candidateLists(3)
+        for start in range(5):
+            cost, route = candidateTour(matrix, candidates, scenario.getSpatialIndex(), start)
+            if route is None:
+                self.assertEqual(math.inf, cost)
+                continue
+            self.assertEqual(start, route[0])
+            self.assertEqual(list(range(300)), sorted(route))
+            self.assertEqual(cost, sum(matrix[route[i], route[(i + 1) % 300]] for i in range(300)))
+            self.assertLessEqual(cost, 1.2 * nearestNeighborCost(matrix, start))
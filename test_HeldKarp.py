@@ -0,0 +1,29 @@
+import math
+from unittest import TestCase
+
+import numpy as np
+
+from HeldKarp import heldKarpTour, heldKarpTableBytes
+from test_BranchAndBound import randomCostMatrix, bruteForceCost
+
+
+class TestHeldKarp(TestCase):
+    def test_matches_brute_force(self):
+        for seed in range(5):
+            matrix = randomCostMatrix(8, seed, missingFraction=0.3)
+            cost, route = heldKarpTour(matrix)
+            self.assertEqual(bruteForceCost(matrix), cost)
+            if route is not None:
+                self.assertEqual(list(range(8)), sorted(route))
+                self.assertEqual(cost, sum(matrix[route[i], route[(i + 1) % 8]] for i in range(8)))
+
+    def test_no_route(self):
+        matrix = randomCostMatrix(5, 0, missingFraction=0)
+        matrix[:, 0] = np.inf  # nothing goes back to the start
+        self.assertEqual((math.inf, None), heldKarpTour(matrix))
+
+    def test_deadline(self):
+        self.assertIsNone(heldKarpTour(randomCostMatrix(8, 0), deadline=0))
+
+    def test_table_bytes(self):
+        self.assertEqual((1 << 19) * 19 * 5, heldKarpTableBytes(20))
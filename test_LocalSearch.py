@@ -0,0 +1,70 @@
+import math
+from unittest import TestCase
+
+import numpy as np
+
+from Greedy import greedyTours
+from LocalSearch import improveTour, tourCost
+from TSPClasses import Scenario, generatePoints
+from test_BranchAndBound import randomCostMatrix
+
+
+def neighborRoutes(route):
+    """
+    Every route one 2-opt or Or-opt move away from route, built the slow way.
+    """
+    numberCities = len(route)
+    for first in range(1, numberCities):
+        for last in range(first + 1, numberCities):
+            yield route[:first] + route[first:last + 1][::-1] + route[last + 1:]
+        for length in range(1, 4):
+            stretch = route[first:first + length]
+            if len(stretch) < length:
+                continue
+            rest = route[:first] + route[first + length:]
+            for insertAt in range(1, len(rest) + 1):
+                yield rest[:insertAt] + stretch + rest[insertAt:]
+                yield rest[:insertAt] + stretch[::-1] + rest[insertAt:]
+
+
+class TestLocalSearch(TestCase):
+    def test_reaches_local_optimum(self):
+        for seed in range(6):
+            matrix = randomCostMatrix(10, seed, missingFraction=0.2)
+            greedyCost, route, _ = greedyTours(matrix)
+            if route is None:
+                continue
+            cost, improved, moves = improveTour(matrix, route)
+
+            self.assertLessEqual(cost, greedyCost)
+            self.assertEqual(cost, tourCost(matrix, improved))
+            self.assertEqual(route[0], improved[0])
+            self.assertEqual(list(range(10)), sorted(improved))
+            self.assertEqual(cost, min(tourCost(matrix, neighbor) for neighbor in neighborRoutes(improved)))
+
+    def test_candidate_moves(self):
+        scenario = Scenario(generatePoints(60, 4), 'Hard (Deterministic)', 4)
+        matrix = scenario.getCostMatrix()
+        greedyCost, route, _ = greedyTours(matrix)
+        # With every other city as a candidate the search is the same as without candidates
+        everyCity = np.argsort(matrix, axis=1, kind='stable')[:, :59]
+        self.assertEqual(improveTour(matrix, route), improveTour(matrix, route, candidates=everyCity))
+
+        cost, improved, moves = improveTour(matrix, route, candidates=scenario.candidateLists(5))
+        self.assertLess(cost, greedyCost)
+        self.assertEqual(cost, tourCost(matrix, improved))
+        self.assertEqual(list(range(60)), sorted(improved))
+
+    def test_pays_for_reversed_edges(self):
+        # Going around 0 -> 1 -> 2 -> 3 is cheap, every edge backward is expensive
+        matrix = np.full((4, 4), 100.0)
+        for city in range(4):
+            matrix[city, (city + 1) % 4] = 1
+        np.fill_diagonal(matrix, np.inf)
+        self.assertEqual((4, [0, 1, 2, 3], 0), improveTour(matrix, [0, 1, 2, 3]))
+        self.assertEqual((4, [0, 1, 2, 3]), improveTour(matrix, [0, 2, 1, 3])[:2])
+
+    def test_infinite_tour_is_kept(self):
+        matrix = randomCostMatrix(6, 0, missingFraction=0)
+        matrix[1, 2] = np.inf
+        self.assertEqual((math.inf, [0, 1, 2, 3, 4, 5], 0), improveTour(matrix, [0, 1, 2, 3, 4, 5]))
@@ -1,25 +1,98 @@
 from unittest import TestCase
 
-from Node import Node
-from TSPClasses import City
-from TSPSolver import *
+import numpy as np
+
+from Node import Node, MatrixPool
 
 
 class TestNode(TestCase):
     def setUp(self):
-        self.solver = TSPSolver(None)
+        self.matrix = np.array([[np.inf, 7, 3, 12],
+                                [3, np.inf, 6, 14],
+                                [5, 8, np.inf, 6],
+                                [9, 3, 5, np.inf]])
+        Node.resetCount()
+        Node.setupPool(len(self.matrix))
+
     def test_add_to_path(self):
-        city1 = City(0.2523423, 0.323234)
-        city2 = City(0.7776675, 0.4434)
-        city3 = City(0.2523423, 0.131545)
-        city4 = City(0.123123, 0.65656)
-        city5 = City(0.3344432, 0.434233)
+        startNode = Node.createRoot(self.matrix)
 
-        cities = [city1, city2, city3, city4, city5]
+        self.assertTrue(len(startNode.pathVisited) == 1)
+        self.assertEqual(1, startNode.visitedMask)
+        self.assertEqual(15, startNode.lowerBound)
 
-        startMatrix = self.solver.convertCitiesIntoStartMatrix(cities, len(cities))
-        startNode = Node(startMatrix, 0, [], cities[0], cities)
+    def test_expand_tree(self):
+        startNode = Node.createRoot(self.matrix)
+        children = startNode.expandTree()
 
-        self.assertTrue(len(startNode.pathVisited) == 1)
+        self.assertEqual([1, 2, 3], [child.pathVisited[-1] for child in children])
+        self.assertEqual([0b11, 0b101, 0b1001], [child.visitedMask for child in children])
+        self.assertEqual(4, Node.nodesCreated)
+        # The parent matrix is not modified by its children
+        self.assertEqual(15, startNode.lowerBound)
+        self.assertTrue((startNode.reducedMatrix.min(axis=1) == 0).all())
+
+    def test_expand_batch_matches_expand_tree(self):
+        startNode = Node.createRoot(self.matrix)
+        children = startNode.expandTree()
+        Node.resetCount()
+
+        batchChildren, droppedCount = startNode.expandBatch(np.inf)
+        self.assertEqual(0, droppedCount)
+        self.assertEqual([child.lowerBound for child in children], [child.lowerBound for child in batchChildren])
+        for child, batchChild in zip(children, batchChildren):
+            self.assertTrue((child.reducedMatrix == batchChild.reducedMatrix).all())
+
+        # Children that can not beat the bssf are not created but still counted
+        Node.resetCount()
+        bssfCost = min(child.lowerBound for child in children) + 1
+        batchChildren, droppedCount = startNode.expandBatch(bssfCost)
+        self.assertEqual(1, len(batchChildren))
+        self.assertEqual(2, droppedCount)
+        self.assertEqual(3, Node.nodesCreated)
+
+    def test_expand_incremental_matches_expand_batch(self):
+        rng = np.random.default_rng(7)
+        for size, missingFraction in [(8, 0), (10, 0.3), (12, 0.5)]:
+            matrix = rng.integers(1, 60, (size, size)).astype(float)  # small costs give ties and several zeros
+            matrix[rng.random((size, size)) < missingFraction] = np.inf
+            np.fill_diagonal(matrix, np.inf)
+            Node.setupPool(size)
+            states = [Node.createRoot(matrix)]
+            while states:
+                state = states.pop()
+                bssfCost = state.lowerBound + 40
+                batchChildren, batchDropped = state.expandBatch(bssfCost)
+                children, droppedCount = state.expandIncremental(bssfCost)
+                self.assertEqual(batchDropped, droppedCount)
+                self.assertEqual([(child.lowerBound, list(child.pathVisited)) for child in batchChildren],
+                                 [(child.lowerBound, list(child.pathVisited)) for child in children])
+                for child, batchChild in zip(children, batchChildren):
+                    self.assertTrue((child.reducedMatrix == batchChild.reducedMatrix).all())
+                    batchChild.releaseMatrix()
+                states.extend(children[:2])
+
+    def test_compact_state(self):
+        startNode = Node.createRoot(self.matrix)
+        child = startNode.expandTree()[0]
+
+        self.assertFalse(hasattr(child, '__dict__'))
+        self.assertEqual(np.int32, child.reducedMatrix.dtype)
+        self.assertEqual([0, 1], list(child.pathVisited))
+        self.assertGreater(child.memoryFootprint(), child.reducedMatrix.nbytes)
 
+    def test_pool_reuses_released_slots(self):
+        pool = MatrixPool(4)
+        first = pool.acquire()
+        pool.release(first)
+        self.assertEqual(first, pool.acquire())
 
+        # Asking for more matrices than the pool holds makes it grow, every slot stays distinct
+        initialCapacity = pool.capacity()
+        slots = {pool.acquire() for _ in range(initialCapacity + 1)}
+        self.assertEqual(initialCapacity + 1, len(slots))
+        self.assertGreater(pool.capacity(), initialCapacity)
+        for slot in slots:
+            pool.matrix(slot)[:] = slot
+        for slot in slots:
+            self.assertTrue((pool.matrix(slot) == slot).all())
@@ -0,0 +1,41 @@
+from unittest import TestCase
+
+import numpy as np
+
+from SpatialIndex import GridIndex
+
+
+def bruteNearestDistances(xs, ys, k):
+    distances = np.hypot(xs[:, np.newaxis] - xs, ys[:, np.newaxis] - ys)
+    np.fill_diagonal(distances, np.inf)
+    return np.sort(distances, axis=1)[:, :k]
+
+
+class TestGridIndex(TestCase):
+    def assertNearest(self, xs, ys, k):
+        neighbors = GridIndex(xs, ys).nearest(k)
+        expected = bruteNearestDistances(xs, ys, k)
+        found = min(k, len(xs) - 1)
+        distances = np.hypot(xs[neighbors[:, :found]] - xs[:, np.newaxis], ys[neighbors[:, :found]] - ys[:, np.newaxis])
+        # Ties may come in any order, the distances may not
+        self.assertTrue(np.allclose(expected[:, :found], distances))
+        self.assertTrue((neighbors[:, found:] == -1).all())
+        self.assertTrue((neighbors[:, :found] != np.arange(len(xs))[:, np.newaxis]).all())
+
+    def test_matches_brute_force(self):
+        rng = np.random.default_rng(3)
+        self.assertNearest(rng.uniform(-1.5, 1.5, 500), rng.uniform(-1, 1, 500), 8)
+
+    def test_clustered_points(self):
+        # Most cells are empty, so most cities need a bigger block than the first one
+        rng = np.random.default_rng(5)
+        xs = np.concatenate((rng.normal(0, 0.01, 200), rng.uniform(-1, 1, 20)))
+        ys = np.concatenate((rng.normal(0, 0.01, 200), rng.uniform(-1, 1, 20)))
+        self.assertNearest(xs, ys, 5)
+
+    def test_points_on_a_line(self):
+        xs = np.linspace(0, 1, 50)
+        self.assertNearest(xs, np.zeros(50), 4)
+
+    def test_fewer_cities_than_k(self):
+        self.assertNearest(np.array([0.0, 1.0, 0.5]), np.array([0.0, 0.0, 1.0]), 5)
@@ -0,0 +1,43 @@
+import csv
+import json
+import os
+import tempfile
+from unittest import TestCase
+
+import TSPBenchmark
+
+
+class TestTSPBenchmark(TestCase):
+    def test_suite_and_baseline(self):
+        with tempfile.TemporaryDirectory() as directory:
+            out = os.path.join(directory, 'run')
+            rows = TSPBenchmark.runSuite(['greedy', 'branchAndBound'], [7], [3], ['Hard (Deterministic)'], 10,
+                                         {'strategy': 'best'})
+            TSPBenchmark.writeRows(rows, out)
+
+            with open(out + '.csv') as file:
+                self.assertEqual(2, len(list(csv.DictReader(file))))
+            with open(out + '.json') as file:
+                self.assertEqual(rows, json.load(file))
+            greedy, branchAndBound = rows
+            # Options only go to the solvers that take them
+            self.assertEqual('{}', greedy['options'])
+            self.assertEqual('{"strategy": "best"}', branchAndBound['options'])
+            self.assertLessEqual(branchAndBound['cost'], greedy['cost'])
+            self.assertGreater(branchAndBound['total'], 0)
+            self.assertGreater(branchAndBound['peak_rss_kb'], 0)
+
+            comparisons = TSPBenchmark.compareRows(rows, rows)
+            self.assertEqual([[], []], [comparison['regressions'] for comparison in comparisons])
+
+            worse = [dict(row, cost=row['cost'] + 1, total=(row['total'] or 0) * 2 or None) for row in rows]
+            regressions = [comparison['regressions'] for comparison in TSPBenchmark.compareRows(worse, rows)]
+            self.assertEqual([['cost'], ['cost', 'total']], regressions)
+
+    def test_size_limits(self):
+        rows = TSPBenchmark.runSuite(['heldKarp', 'parallelBranchAndBound'], [6, 8], [1], ['Hard (Deterministic)'], 10,
+                                     {}, maxSizes={'heldKarp': 6})
+        self.assertEqual([('heldKarp', 6), ('parallelBranchAndBound', 6), ('parallelBranchAndBound', 8)],
+                         [(row['algorithm'], row['size']) for row in rows])
+        # Both are exact on scenarios this small
+        self.assertEqual(rows[0]['cost'], rows[1]['cost'])
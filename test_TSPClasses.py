@@ -0,0 +1,70 @@
+import os
+import random
+import tempfile
+from unittest import TestCase
+
+import numpy as np
+
+from TSPClasses import Scenario, generatePoints
+
+
+class TestScenario(TestCase):
+    def test_thin_edges(self):
+        scenario = Scenario(generatePoints(40, 11), 'Hard (Deterministic)', 11)
+        removed = np.count_nonzero(~scenario.edge_exists) - 40  # minus the self-edges
+        self.assertEqual(int(0.2 * 40 * 39), removed)
+        self.assertTrue((np.isinf(scenario.getCostMatrix()) == ~scenario.edge_exists).all())
+
+        # The tour set aside is drawn from the scenario generator right after the elevations
+        rng = np.random.default_rng(11)
+        self.assertTrue(np.array_equal(rng.random(40), scenario.elevations))
+        route = rng.permutation(40)
+        self.assertTrue(scenario.edge_exists[route, np.roll(route, -1)].all())
+
+    def test_deterministic_per_seed(self):
+        first = Scenario(generatePoints(30, 4), 'Hard (Deterministic)', 4)
+        second = Scenario(generatePoints(30, 4), 'Hard (Deterministic)', 4)
+        other = Scenario(generatePoints(30, 4), 'Hard (Deterministic)', 5)
+        self.assertTrue(np.array_equal(first.getCostMatrix(), second.getCostMatrix()))
+        self.assertFalse(np.array_equal(first.edge_exists, other.edge_exists))
+
+    def test_explicit_generator(self):
+        points = generatePoints(25, 9)
+        first = Scenario(points, 'Hard', 9, rng=np.random.default_rng(3))
+        second = Scenario(points, 'Hard', 9, rng=np.random.default_rng(3))
+        self.assertTrue(np.array_equal(first.getCostMatrix(), second.getCostMatrix()))
+
+        # Building a scenario does not touch the global generators
+        random.seed(1)
+        np.random.seed(1)
+        Scenario(generatePoints(25, 9), 'Hard (Deterministic)', 9)
+        self.assertEqual(random.Random(1).random(), random.random())
+        self.assertEqual(np.random.RandomState(1).random_sample(), np.random.random_sample())
+
+    def test_cities_match_arrays(self):
+        scenario = Scenario(generatePoints(10, 2), 'Normal', 2)
+        cities = scenario.getCities()
+        self.assertEqual([city.elevation for city in cities], scenario.elevations.tolist())
+        self.assertEqual([(city.x, city.y) for city in cities], list(zip(scenario.xs, scenario.ys)))
+        self.assertEqual(cities[3].costTo(cities[7]), scenario.getCostMatrix()[3, 7])
+
+    def test_save_and_load(self):
+        with tempfile.TemporaryDirectory() as directory:
+            for storage in ['dense', 'tiled']:
+                scenario = Scenario(generatePoints(30, 5), 'Hard (Deterministic)', 5, storage=storage)
+                for name, costs in [('scenario.npz', False), ('scenario', False), ('mapped', True)]:
+                    path = os.path.join(directory, storage + name)
+                    scenario.save(path, costs=costs)
+                    loaded = Scenario.load(path)
+                    # Without the costs, a loaded scenario picks its storage from its size
+                    self.assertEqual('memmap' if costs else 'dense', loaded.storage)
+                    self.assertEqual(scenario.difficulty, loaded.difficulty)
+                    self.assertTrue(np.array_equal(scenario.elevations, loaded.elevations))
+                    self.assertTrue(np.array_equal(scenario.getCostMatrix(), loaded.getCostMatrix()))
+
+            # Costs given rather than computed are always saved
+            explicit = Scenario.fromCostMatrix(np.arange(3.0), np.zeros(3), np.array(
+                [[np.inf, 1, 2], [3, np.inf, 4], [5, np.inf, np.inf]]))
+            explicit.save(os.path.join(directory, 'explicit'))
+            loaded = Scenario.load(os.path.join(directory, 'explicit'), storage='dense')
+            self.assertTrue(np.array_equal(explicit.getCostMatrix(), loaded.getCostMatrix()))
@@ -0,0 +1,104 @@
+import os
+import tempfile
+from unittest import TestCase
+
+import numpy as np
+
+from TSPClasses import Scenario, TSPSolution, generatePoints
+from TSPLIB import readTsplib, writeTsplib
+
+EUC_2D = """NAME : square
+COMMENT : four cities
+TYPE : TSP
+DIMENSION : 4
+EDGE_WEIGHT_TYPE : EUC_2D
+NODE_COORD_SECTION
+1 0 0
+2 3 0
+3 3 4.9
+4 0 4
+EOF
+"""
+
+# A CVRP file: its DEMAND_SECTION and DEPOT_SECTION are not needed
+OTHER_SECTIONS = """NAME : square-vrp
+TYPE : CVRP
+DIMENSION : 4
+EDGE_WEIGHT_TYPE : EUC_2D
+CAPACITY : 10
+NODE_COORD_SECTION
+1 0 0
+2 3 0
+3 3 4.9
+4 0 4
+DEMAND_SECTION
+1 0
+2 4
+3 4
+4 2
+DEPOT_SECTION
+ 1
+ -1
+EOF
+"""
+
+UPPER_ROW = """NAME : upper
+TYPE : TSP
+DIMENSION : 4
+EDGE_WEIGHT_TYPE : EXPLICIT
+EDGE_WEIGHT_FORMAT : UPPER_ROW
+EDGE_WEIGHT_SECTION
+ 1 2 3
+ 4 5
+ 6
+EOF
+"""
+
+
+class TestTSPLIB(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def writeFile(self, name, text):
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'w') as file:
+            file.write(text)
+        return path
+
+    def test_euclidean(self):
+        scenario = readTsplib(self.writeFile('square.tsp', EUC_2D))
+        matrix = scenario.getCostMatrix()
+        # Distances are rounded to the nearest integer: 4.9 -> 5, 5.74 -> 6
+        self.assertEqual([np.inf, 3, 6, 4], matrix[0].tolist())
+        self.assertEqual([3, np.inf, 5, 5], matrix[1].tolist())
+        self.assertEqual(3 + 5 + 3 + 4, TSPSolution(scenario.getCities()).cost)
+        self.assertEqual([0, 3, 3, 0], scenario.xs.tolist())
+
+    def test_other_sections(self):
+        expected = readTsplib(self.writeFile('square.tsp', EUC_2D)).getCostMatrix()
+        scenario = readTsplib(self.writeFile('square.vrp', OTHER_SECTIONS))
+        self.assertTrue(np.array_equal(expected, scenario.getCostMatrix()))
+
+    def test_explicit_triangle(self):
+        matrix = readTsplib(self.writeFile('upper.tsp', UPPER_ROW)).getCostMatrix()
+        expected = np.array([[0, 1, 2, 3], [1, 0, 4, 5], [2, 4, 0, 6], [3, 5, 6, 0]], dtype=float)
+        np.fill_diagonal(expected, np.inf)
+        self.assertTrue(np.array_equal(expected, matrix))
+
+    def test_round_trip(self):
+        scenario = Scenario(generatePoints(15, 3), 'Hard (Deterministic)', 3)
+        path = os.path.join(self.directory.name, 'scenario.atsp')
+        writeTsplib(scenario, path)
+        loaded = readTsplib(path)
+
+        matrix, original = loaded.getCostMatrix(), scenario.getCostMatrix()
+        finite = np.isfinite(original)
+        self.assertTrue(np.array_equal(original[finite], matrix[finite]))
+        # Missing edges cost more than any tour that does not use them
+        offDiagonal = ~finite & ~np.eye(15, dtype=bool)
+        self.assertTrue((matrix[offDiagonal] > original[finite].max() * 15).all())
+        self.assertTrue(np.array_equal(scenario.xs, loaded.xs))
+        self.assertTrue(np.array_equal(scenario.ys, loaded.ys))
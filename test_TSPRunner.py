@@ -0,0 +1,81 @@
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+from contextlib import redirect_stdout
+from unittest import TestCase
+
+import numpy as np
+
+import TSPRunner
+from TSPClasses import Scenario, generatePoints
+
+
+class Point:
+    """
+    Stands for QPointF.
+    """
+
+    def __init__(self, x, y):
+        self._x, self._y = x, y
+
+    def x(self):
+        return self._x
+
+    def y(self):
+        return self._y
+
+
+class TestTSPRunner(TestCase):
+    def test_scenario_matches_qt_points(self):
+        for difficulty in ['Normal', 'Hard (Deterministic)']:
+            # What the GUI did: seed, draw the points, build the scenario
+            random.seed(7)
+            points = [Point(-1.5 + 3.0 * random.uniform(0.0, 1.0), -1.0 + 2.0 * random.uniform(0.0, 1.0))
+                      for _ in range(12)]
+            expected = Scenario(points, difficulty, 7)
+            scenario = TSPRunner.buildScenario(12, 7, difficulty)
+            self.assertTrue(np.array_equal(expected.getCostMatrix(), scenario.getCostMatrix()))
+            self.assertEqual(generatePoints(12, 7), [(city.x, city.y) for city in scenario.getCities()])
+
+    def test_json_lines(self):
+        output = io.StringIO()
+        with redirect_stdout(output):
+            TSPRunner.main(['--size', '8', '--seed', '1', '2', '--algorithm', 'greedy', 'branchAndBound',
+                            '--time', '10'])
+        lines = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual(4, len(lines))
+        for line in lines:
+            self.assertEqual(list(range(8)), sorted(line['soln']))
+        greedy = TSPRunner.runSolver(TSPRunner.buildScenario(8, 1, 'Hard (Deterministic)'), 'greedy')
+        self.assertEqual(greedy['cost'], lines[0]['cost'])
+
+    def test_anytime_lines(self):
+        output = io.StringIO()
+        with redirect_stdout(output):
+            TSPRunner.main(['--size', '10', '--algorithm', 'localSearch', '--anytime', '--time', '10'])
+        lines = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual([False] * (len(lines) - 1) + [True], [line['final'] for line in lines])
+        self.assertEqual(lines[-2]['cost'], lines[-1]['cost'])
+        self.assertEqual(list(range(10)), sorted(lines[0]['soln']))
+
+    def test_saved_scenarios(self):
+        scenario = TSPRunner.buildScenario(9, 4, 'Normal')
+        expected = TSPRunner.runSolver(scenario, 'greedy')['cost']
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'scenario.npz')
+            scenario.save(path)
+            output = io.StringIO()
+            with redirect_stdout(output):
+                TSPRunner.main(['--scenario', path, '--algorithm', 'greedy'])
+        line = json.loads(output.getvalue())
+        self.assertEqual(path, line['scenario'])
+        self.assertEqual(expected, line['cost'])
+
+    def test_does_not_import_qt(self):
+        code = 'import sys, TSPRunner; print("PyQt5" in sys.modules or "PyQt6" in sys.modules)'
+        output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+        self.assertEqual('False', output.stdout.strip())
@@ -1,7 +1,11 @@
 from unittest import TestCase
 import heapq
+import itertools
+import json
 import numpy as np
 from TSPSolver import *
+import Greedy
+from SearchStrategies import makeStrategy
 
 
 class TestTSPSolver(TestCase):
@@ -9,43 +13,163 @@ class TestTSPSolver(TestCase):
         self.solver = TSPSolver(None)
 
     def test_reduce_matrix(self):
-        self.fail()
+        # A stack of matrices is reduced like each matrix on its own, rows with no edge left add nothing
+        matrices = np.array([[[np.inf, 7, 3, 12],
+                              [3, np.inf, 6, 14],
+                              [5, 8, np.inf, 6],
+                              [9, 3, 5, np.inf]],
+                             [[np.inf, 385, 1801, 371],
+                              [np.inf, np.inf, np.inf, np.inf],
+                              [2080, 1533, np.inf, 2131],
+                              [373, np.inf, 1855, np.inf]]])
+        expected = [reduceCostMatrix(matrix.copy()) for matrix in matrices]
+
+        self.assertTrue((np.array(expected) == reduceCostMatrix(matrices)).all())
+        self.assertEqual(15, expected[0])
+        self.assertTrue((matrices[1][1] == np.inf).all())
 
     def testReduceMatrix(self):
-        matrix = [[np.inf, 7, 3, 12],
-                  [3, np.inf, 6, 14],
-                  [5, 8, np.inf, 6],
-                  [9, 3, 5, np.inf]]
+        matrix = np.array([[np.inf, 7, 3, 12],
+                           [3, np.inf, 6, 14],
+                           [5, 8, np.inf, 6],
+                           [9, 3, 5, np.inf]])
 
-        result = self.solver.reduceMatrix(matrix, 4)
+        result = reduceCostMatrix(matrix)
         self.assertEqual(15, result, "the LB are not the same.")
 
-        matrix = [[np.inf, 385, 1801, 371],
-                  [np.inf, np.inf, 1693, 639],
-                  [2080, 1533, np.inf, 2131],
-                  [373, np.inf, 1855, np.inf]]
+        matrix = np.array([[np.inf, 385, 1801, 371],
+                           [np.inf, np.inf, 1693, 639],
+                           [2080, 1533, np.inf, 2131],
+                           [373, np.inf, 1855, np.inf]])
 
-        result = self.solver.reduceMatrix(matrix, 4)
+        result = reduceCostMatrix(matrix)
         self.assertEqual(3970, result, "the LB are not the same.")
+        self.assertTrue((matrix.min(axis=0) == 0).all() and (matrix.min(axis=1) == 0).all())
 
     def testPQ(self):
-        node1 = Node(None, 10, None, None)
-        node2 = Node(None, 20, None, None)
-        node3 = Node(None, 30, None, None)
+        Node.setupPool(4)
+        root = Node.createRoot(np.array([[np.inf, 7, 3, 12],
+                                         [3, np.inf, 6, 14],
+                                         [5, 8, np.inf, 6],
+                                         [9, 3, 5, np.inf]]))
+        children = root.expandTree()
+        grandchild = children[0].expandTree()[0]
+        nodes = [root] + children + [grandchild]
+
+        for name, expectedFirst in [('best', root), ('depth', grandchild), ('dive', grandchild)]:
+            strategy = makeStrategy(name)
+            tiebreak = itertools.count()
+            priorityQueue = []
+            for node in nodes:
+                heapq.heappush(priorityQueue, (strategy.key(node), next(tiebreak), node))
+
+            _, _, poppedNode = heapq.heappop(priorityQueue)
+            self.assertIs(expectedFirst, poppedNode, "{} did not pop the right node first.".format(name))
+
+            poppedBounds = [heapq.heappop(priorityQueue)[2].lowerBound for _ in range(len(priorityQueue))]
+            if name == 'best':
+                self.assertEqual(sorted(poppedBounds), poppedBounds)
+
+    def testDiveSwitchesToBestFirst(self):
+        strategy = makeStrategy('dive')
+        self.assertTrue(strategy.solutionFound())
+        self.assertFalse(strategy.solutionFound())
+
+    def testBeamKeepsLowestBounds(self):
+        Node.setupPool(4)
+        root = Node.createRoot(np.array([[np.inf, 7, 3, 12],
+                                         [3, np.inf, 6, 14],
+                                         [5, 8, np.inf, 6],
+                                         [9, 3, 5, np.inf]]))
+        children = root.expandTree()
+        kept, dropped = makeStrategy('beam', beamWidth=1).select(children)
+        self.assertEqual([min(children, key=lambda node: node.lowerBound)], kept)
+        self.assertEqual(2, len(dropped))
+
+    def runAnytime(self, algorithm, **options):
+        """
+        :return: the cost of every improvement and the final results of solver.anytime(algorithm, **options)
+        """
+        improvements = self.solver.anytime(algorithm, 30, **options)
+        costs = []
+        while True:
+            try:
+                costs.append(next(improvements)['cost'])
+            except StopIteration as stop:
+                return costs, stop.value
+
+    def test_anytime_improves(self):
+        self.solver.setupWithScenario(Scenario(generatePoints(13, 3), 'Hard (Deterministic)', 3))
+        for algorithm in TSPSolver.ANYTIME_ALGORITHMS:
+            costs, final = self.runAnytime(algorithm)
+            self.assertTrue(costs)
+            self.assertTrue(all(before > after for before, after in zip(costs, costs[1:])))
+            self.assertEqual(costs[-1], final['cost'])
+            self.assertEqual(getattr(self.solver, algorithm)(30)['cost'], final['cost'])
 
-        priorityQueue = []
-        heapq.heappush(priorityQueue, node1)
-        heapq.heappush(priorityQueue, node2)
-        heapq.heappush(priorityQueue, node3)
+    def test_anytime_stops_early(self):
+        self.solver.setupWithScenario(Scenario(generatePoints(13, 3), 'Hard (Deterministic)', 3))
+        improvements = self.solver.anytime('branchAndBound', 30)
+        first = next(improvements)
+        improvements.close()
+        # The first improvement is the initial BSSF, before any state is searched
+        self.assertEqual(self.solver.greedy()['cost'], first['cost'])
+        self.assertEqual((0, 0), (first['count'], first['total']))
+        self.assertRaises(ValueError, self.solver.anytime, 'heldKarp')
 
-        poppedNode = heapq.heappop(priorityQueue)
-        self.assertEqual(node1, poppedNode, "Node 1 was not popped first.")
+    def test_held_karp_out_of_time(self):
+        self.solver.setupWithScenario(Scenario(generatePoints(13, 3), 'Hard (Deterministic)', 3))
+        # No time for the table, greedy still tries its first block of starts
+        results = self.solver.heldKarp(time_allowance=0)
+        greedy = self.solver.greedy(time_allowance=0)
+        self.assertEqual('greedy', results['fallback'])
+        self.assertEqual((greedy['cost'], greedy['count']), (results['cost'], results['count']))
 
-        poppedNode = heapq.heappop(priorityQueue)
-        self.assertEqual(node2, poppedNode, "Node 2 was not popped second.")
+    def test_local_search_without_a_tour(self):
+        # Greedy finds no tour on this scenario, and there is no time left for a random one
+        self.solver.setupWithScenario(Scenario(generatePoints(5, 22), 'Hard (Deterministic)', 22))
+        results = self.solver.localSearch(time_allowance=0)
+        self.assertEqual((math.inf, None), (results['cost'], results['soln']))
+        self.assertEqual([], list(self.solver.anytime('localSearch', 0)))
 
-        poppedNode = heapq.heappop(priorityQueue)
-        self.assertEqual(node3, poppedNode, "Node 1 was not popped third.")
+    def test_anytime_progress(self):
+        self.solver.setupWithScenario(Scenario(generatePoints(13, 3), 'Hard (Deterministic)', 3))
+        reports = list(itertools.islice(self.solver.anytime('branchAndBound', 30, progress_interval=0), 20))
+        # Every expansion is reported, the cost stays the same while the states searched go up
+        totals = [report['total'] for report in reports]
+        self.assertEqual(sorted(totals), totals)
+        self.assertGreater(len(reports), reports[-1]['count'] + 1)
 
+    def test_greedy_progress_interval(self):
+        self.solver.setupWithScenario(Scenario(generatePoints(13, 3), 'Hard (Deterministic)', 3))
+        blockWork = Greedy.BLOCK_WORK
+        Greedy.BLOCK_WORK = 13 * 13
+        try:
+            # One start per block: every block is reported with no interval, only improvements with a long one
+            everyBlock, final = self.runAnytime('greedy', progress_interval=0)
+            improvements, _ = self.runAnytime('greedy', progress_interval=3600)
+        finally:
+            Greedy.BLOCK_WORK = blockWork
+        self.assertEqual(13, len(everyBlock))
+        self.assertEqual(sorted(set(everyBlock), reverse=True), improvements)
+        self.assertEqual(improvements[-1], final['cost'])
 
+    def test_profile(self):
+        self.solver.setupWithScenario(Scenario(generatePoints(10, 3), 'Hard (Deterministic)', 3))
+        self.assertNotIn('profile', self.solver.branchAndBound(30))
+        results = self.solver.branchAndBound(30, profile=True)
+        profile = json.loads(json.dumps(results['profile']))
+        self.assertEqual(set(SearchProfile.PHASES), set(profile['phases']))
+        # Every state created but the root had its bound computed
+        self.assertEqual(results['total'] - 1, profile['bound_evaluations'])
+        self.assertEqual(results['pruned'] + results['dominated'], sum(profile['pruned'].values()))
+        self.assertTrue(profile['timeline'])
 
+    def test_parallel_profile(self):
+        self.solver.setupWithScenario(Scenario(generatePoints(12, 3), 'Hard (Deterministic)', 3))
+        results = self.solver.parallelBranchAndBound(30, workers=2, profile=True)
+        profile = json.loads(json.dumps(results['profile']))
+        # The counters of both workers are added to the ones of the main process
+        self.assertEqual(results['total'] - 1, profile['bound_evaluations'])
+        self.assertEqual(results['pruned'] + results['dominated'], sum(profile['pruned'].values()))
+        self.assertEqual(2, len(profile['worker_timelines']))